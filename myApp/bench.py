@@ -0,0 +1,153 @@
+"""
+Helpers shared by the `bench_*` management commands that need real tables:
+a throwaway SQLite database, fast synthetic rows and query plans.
+
+Rows are generated from a seeded RNG, so the same sizes and seed always give
+the same dataset, and are written in bulk without model signals; derived tables
+(rollups, forecasts) are left to the caller.
+"""
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connections, transaction
+
+from .models import Activity, Crop, Expense, Reminder, season_factor_table, spacing_columns
+
+INSERT_BATCH = 10_000
+
+
+def best_of(fn, repeat=5):
+    """Fastest of `repeat` calls to fn(), in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+@contextmanager
+def scratch_database(alias='bench'):
+    """
+    A migrated SQLite database in a temp file, registered as `alias` and removed
+    afterwards. With alias='default' it stands in for the app's own database
+    (so views and helpers without `using=` read it) until the block exits.
+    """
+    fd, path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+    original = connections.settings.get(alias)
+    if alias in connections:
+        connections[alias].close()
+        del connections[alias]
+    connections.settings[alias] = dict(connections.settings['default'], NAME=path, TEST={})
+    connections.configure_settings(connections.settings)
+    try:
+        call_command('migrate', database=alias, verbosity=0)
+        yield alias
+    finally:
+        connections[alias].close()
+        del connections[alias]
+        if original is None:
+            del connections.settings[alias]
+        else:
+            connections.settings[alias] = original
+        for suffix in ('', '-journal', '-wal', '-shm'):
+            try:
+                os.unlink(path + suffix)
+            except FileNotFoundError:
+                pass
+
+
+def create_farmers(alias, count):
+    User = get_user_model()
+    users = User.objects.db_manager(alias).bulk_create(
+        [User(username=f'bench_farmer_{i}', role='farmer') for i in range(count)], batch_size=INSERT_BATCH)
+    return [u.pk for u in users]
+
+
+def create_crops(alias, count, seed=7):
+    """`count` crops with plausible baselines (bulk_create skips the recompute signal)."""
+    rng = random.Random(seed)
+    seasons = ['Jun-Nov, Dec-Apr', 'May-Aug', 'Jan-Mar, Jul-Sep', 'Oct-Feb', 'Jan-Dec']
+    crops = []
+    for i in range(count):
+        ideal = rng.choice(seasons)
+        seed_min, fert_min, yield_min, days_min = (rng.randint(5, 50), rng.randint(2, 6),
+                                                   rng.randint(2, 20), rng.randint(60, 150))
+        crops.append(Crop(
+            name=f'Bench crop {i}', ideal_seasons=ideal, season_factors=season_factor_table(ideal),
+            days_to_harvest_min=days_min, days_to_harvest_max=days_min + rng.randint(10, 40),
+            seed_rate_min_kg=seed_min, seed_rate_max_kg=seed_min * 1.5,
+            fert_sacks_min=fert_min, fert_sacks_max=fert_min + 2,
+            yield_t_min=yield_min, yield_t_max=yield_min * 1.4,
+        ))
+    return [c.pk for c in Crop.objects.using(alias).bulk_create(crops)]
+
+
+def _executemany(alias, sql, rows, make_row):
+    """Insert `rows` rows built by make_row() in INSERT_BATCH batches, then refresh the planner stats."""
+    conn = connections[alias]
+    with transaction.atomic(using=alias), conn.cursor() as cursor:
+        for lo in range(0, rows, INSERT_BATCH):
+            cursor.executemany(sql, [make_row() for _ in range(min(INSERT_BATCH, rows - lo))])
+    with conn.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def insert_activities(alias, farmer_ids, crop_ids, rows, seed=7, start=date(2021, 1, 1), days=5 * 365):
+    """`rows` random activities, a third of them plantings with inputs and spacing."""
+    rng = random.Random(seed)
+    types = [t for t, _ in Activity.ACTIVITY_TYPES]
+    spacings = {s: spacing_columns(s) for s in ('20x20 cm', '75x25 cm', '10x10 m', '3x3 m', '')}
+    sql = (f'INSERT INTO "{Activity._meta.db_table}" (farmer_id, crop_id, activity_type, date, notes, area_ha, '
+           f'seed_qty_kg, fert_sacks, spacing, spacing_row_m, spacing_hill_m, trees_per_ha) '
+           f'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)')
+
+    def make_row():
+        kind = rng.choice(types)
+        day = (start + timedelta(days=rng.randrange(days))).isoformat()
+        area = round(rng.uniform(0.2, 5.0), 2)
+        if kind != 'planting':
+            return (rng.choice(farmer_ids), rng.choice(crop_ids), kind, day, '', area,
+                    None, None, None, None, None, None)
+        spacing = rng.choice(list(spacings))
+        return (rng.choice(farmer_ids), rng.choice(crop_ids), kind, day, '', area,
+                round(rng.uniform(5, 80) * area, 1), round(rng.uniform(2, 8) * area, 1),
+                spacing or None, *spacings[spacing])
+
+    _executemany(alias, sql, rows, make_row)
+
+
+def insert_expenses(alias, farmer_ids, rows, seed=7, start=date(2021, 1, 1), days=5 * 365):
+    """
+    `rows` random expenses spread over `days` days, written with executemany
+    (no model instances, no signals, so the rollups are not touched).
+    """
+    rng = random.Random(seed)
+    types = [t for t, _ in Expense.EXPENSE_TYPES]
+    sql = (f'INSERT INTO "{Expense._meta.db_table}" (farmer_id, expense_type, amount, date, description) '
+           f'VALUES (%s, %s, %s, %s, %s)')
+    _executemany(alias, sql, rows, lambda: (
+        rng.choice(farmer_ids), rng.choice(types), str(Decimal(rng.randint(100, 500_000)) / 100),
+        (start + timedelta(days=rng.randrange(days))).isoformat(), ''))
+
+
+def insert_reminders(alias, farmer_ids, per_farmer, seed=7, start=None):
+    """`per_farmer` reminders each, due over the 60 days from `start` (today)."""
+    rng = random.Random(seed)
+    start = start or date.today()
+    Reminder.objects.using(alias).bulk_create(
+        [Reminder(farmer_id=f, message=f'Bench reminder {i}', due_date=start + timedelta(days=rng.randrange(60)))
+         for f in farmer_ids for i in range(per_farmer)], batch_size=INSERT_BATCH)
+
+
+def query_plan(queryset):
+    """SQLite's EXPLAIN QUERY PLAN for the queryset, one step per line."""
+    return queryset.explain()
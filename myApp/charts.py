@@ -0,0 +1,162 @@
+"""
+Chart series for the dashboard, activity log and expense log.
+
+Each `*_rows` function runs one grouped query per source table; the series
+functions derive every chart from those rows in Python. The per-chart JSON
+endpoints and the page bundles (`chart_bundle`) both build on these, so a
+bundle costs one query per table rather than one per chart.
+"""
+import calendar
+from collections import defaultdict
+
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .date_ranges import as_int
+from .models import Activity, Expense, ExpenseRollup, LatestForecast
+
+
+# ---------- Expenses ----------
+def expense_rows(user, year):
+    """(month, expense_type, total) for one year, from ExpenseRollup (≤ 12 × types rows)."""
+    return list(ExpenseRollup.objects
+                .filter(farmer=user, year=year)
+                .values_list('month', 'expense_type', 'total'))
+
+
+def expenses_monthly_series(rows):
+    totals = defaultdict(float)
+    for month, _, total in rows:
+        totals[month] += float(total or 0)
+    return {
+        "labels": [calendar.month_abbr[m] for m in range(1, 13)],
+        "data": [totals.get(m, 0) for m in range(1, 13)],
+    }
+
+
+def expenses_by_category_series(rows, month=None):
+    totals = defaultdict(float)
+    for m, expense_type, total in rows:
+        if month is None or m == month:
+            totals[expense_type] += float(total or 0)
+    type_map = dict(Expense.EXPENSE_TYPES)
+    ordered = sorted(totals.items(), key=lambda kv: -kv[1])
+    return {
+        "labels": [type_map.get(t, t) for t, _ in ordered],
+        "data": [v for _, v in ordered],
+    }
+
+
+# ---------- Activities ----------
+def activity_rows(user, start=None, end=None):
+    """(month, activity_type, crop name, count), optionally limited to start..end."""
+    qs = Activity.objects.filter(farmer=user)
+    if start:
+        qs = qs.filter(date__gte=start)
+    if end:
+        qs = qs.filter(date__lte=end)
+    return list(qs.annotate(m=TruncMonth('date'))
+                .values_list('m', 'activity_type', 'crop__name')
+                .annotate(c=Count('id'))
+                .order_by())
+
+
+def activities_monthly_series(rows):
+    counts = defaultdict(int)
+    for m, _, _, c in rows:
+        counts[m] += c
+    months = sorted(counts)
+    return {"labels": [m.strftime('%b %Y') for m in months], "data": [counts[m] for m in months]}
+
+
+def activities_by_type_series(rows):
+    counts = defaultdict(int)
+    for _, activity_type, _, c in rows:
+        counts[activity_type] += c
+    type_map = dict(Activity.ACTIVITY_TYPES)
+    types = sorted(counts)
+    return {"labels": [type_map.get(t, t).title() for t in types], "data": [counts[t] for t in types]}
+
+
+def activities_by_crop_series(rows, limit=8):
+    counts = defaultdict(int)
+    for _, _, crop_name, c in rows:
+        counts[crop_name] += c
+    top = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0] or ''))[:limit]
+    return {"labels": [name for name, _ in top], "data": [c for _, c in top]}
+
+
+# ---------- Forecasts ----------
+def forecast_rows(user):
+    """(crop_id, crop name, created_at, expected_yield_kg, harvest_start, harvest_end, id) of the latest forecast per crop."""
+    return list(LatestForecast.objects
+                .filter(farmer=user)
+                .values_list('crop_id', 'crop__name', 'created_at', 'forecast__expected_yield_kg',
+                             'forecast__harvest_start', 'forecast__harvest_end', 'forecast_id'))
+
+
+def yield_by_crop_series(rows):
+    """Expected yield of the latest forecast per crop (forecast_rows has one row per crop)."""
+    by_crop = {}
+    for _, name, _, expected, *_ in sorted(rows, key=lambda r: r[0]):
+        by_crop[name] = by_crop.get(name, 0.0) + (expected or 0.0)
+    return {"labels": list(by_crop), "data": [round(v, 2) for v in by_crop.values()]}
+
+
+def harvest_timeline_series(rows, today=None):
+    """
+    Harvest window of each crop's latest forecast, as day offsets from today;
+    windows already past are skipped.
+
+    Before the bundle this read every forecast and kept each crop's earliest
+    harvest_start, so an old forecast could hide a crop's newer window (or
+    the crop itself, once that old window had passed). The latest forecast is
+    the one the yield chart and the dashboard pipeline already show.
+    """
+    today = today or timezone.now().date()
+    windows = sorted((r for r in rows if r[4] and r[5]), key=lambda r: (r[4], r[1] or ''))
+    labels, offsets, spans = [], [], []
+    for _, name, _, _, start, end, _ in windows:
+        if end < today:
+            continue
+        labels.append(name)
+        offsets.append(max((start - today).days, 0))
+        spans.append(max((end - start).days, 0))
+    return {"labels": labels, "offsets": offsets, "windows": spans}
+
+
+# ---------- Page bundles ----------
+def dashboard_bundle(user, params):
+    expenses = expense_rows(user, timezone.now().year)
+    forecasts = forecast_rows(user)
+    return {
+        "expenses_monthly": expenses_monthly_series(expenses),
+        "expenses_by_category": expenses_by_category_series(expenses),
+        "harvest_timeline": harvest_timeline_series(forecasts),
+        "yield_by_crop": yield_by_crop_series(forecasts),
+    }
+
+
+def activity_log_bundle(user, params):
+    rows = activity_rows(user, params.get('start'), params.get('end'))
+    return {
+        "activities_monthly": activities_monthly_series(rows),
+        "activities_by_type": activities_by_type_series(rows),
+        "activities_by_crop": activities_by_crop_series(rows),
+    }
+
+
+def expense_log_bundle(user, params):
+    rows = expense_rows(user, as_int(params.get('year')) or timezone.now().year)
+    return {
+        "expenses_monthly": expenses_monthly_series(rows),
+        "expenses_by_category": expenses_by_category_series(rows, as_int(params.get('month')) or None),
+    }
+
+
+PAGE_BUNDLES = {
+    'dashboard': dashboard_bundle,
+    'activity_log': activity_log_bundle,
+    'expense_log': expense_log_bundle,
+}
@@ -0,0 +1,73 @@
+"""
+Month/year filters as half-open date ranges.
+
+`date__month` compiles to a `django_date_extract('month', ...)` call on every
+row, which no index can serve (and `date__year` only becomes a range when it
+is used on its own). These helpers express each selection as
+`start <= date < end` so the (farmer, date) indexes do a range scan.
+"""
+from datetime import date
+
+from django.db.models import Max, Min, Q
+
+
+def as_int(value):
+    """
+    Convert querystring value to int or return None for '', 'None', 'null', 'undefined', etc.
+    """
+    if value in (None, "", "None", "none", "null", "undefined"):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def month_bounds(year, month):
+    """(first day, first day of the next month)."""
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def year_bounds(year):
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def _range_q(field, start, end):
+    return Q(**{f'{field}__gte': start, f'{field}__lt': end})
+
+
+def period_q(year=None, month=None, field='date', years=()):
+    """
+    Q for the selected year and/or month; None when neither is set. A month
+    without a year means that month in every year, so the caller passes the
+    `years` to cover (see filter_period).
+    """
+    if month is not None and not 1 <= month <= 12:
+        return Q(pk__in=[])
+    if year is not None and not date.min.year <= year < date.max.year:
+        return Q(pk__in=[])
+    if year is not None and month is not None:
+        return _range_q(field, *month_bounds(year, month))
+    if year is not None:
+        return _range_q(field, *year_bounds(year))
+    if month is not None:
+        q = Q(pk__in=[])
+        for y in years:
+            q |= _range_q(field, *month_bounds(y, month))
+        return q
+    return None
+
+
+def filter_period(queryset, year=None, month=None, field='date'):
+    """`queryset` limited to the selected year and/or month with index-friendly ranges."""
+    years = ()
+    if month is not None and year is None:
+        # One range per year the rows span; min/max come straight off the index
+        span = queryset.aggregate(first=Min(field), last=Max(field))
+        if span['first'] is None:
+            return queryset.none()
+        years = range(span['first'].year, span['last'].year + 1)
+    q = period_q(year, month, field, years)
+    return queryset if q is None else queryset.filter(q)
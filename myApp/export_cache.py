@@ -0,0 +1,165 @@
+"""
+On-disk cache for generated exports (CSV / PDF).
+
+A file's key covers the export, the farmer, the normalized filters and the
+farmer's DataVersion, so any Expense/Activity change makes the old entries
+unreachable. Files live in EXPORT_CACHE_DIR; each hit touches the file's mtime
+and, after a write, the least recently served files are deleted until the
+directory fits in EXPORT_CACHE_MAX_BYTES. The key doubles as the ETag, so a
+repeat download with If-None-Match gets a 304 without touching the disk.
+
+On a miss the whole file is written to disk before the response starts, so
+memory stays flat but the first byte waits for the build to finish; only hits
+stream straight away. Large PDFs should go through an export job instead.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import content_disposition_header
+from django.utils.text import compress_sequence
+
+from .exports import wants_gzip
+from .models import data_version
+
+READ_CHUNK = 64 * 1024
+CONTENT_TYPES = {'.csv': 'text/csv', '.pdf': 'application/pdf'}
+
+
+def cache_dir():
+    return Path(settings.EXPORT_CACHE_DIR)
+
+
+def export_key(farmer_id, filename, filters, version):
+    raw = json.dumps([filename, farmer_id, version, sorted(filters.items())], default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def cache_path(key, suffix):
+    return cache_dir() / f"{key}{suffix}"
+
+
+def open_cached(key, suffix):
+    """The cached file for `key` opened for reading, or None on a miss."""
+    path = cache_path(key, suffix)
+    try:
+        fh = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)  # mark as recently used
+    except FileNotFoundError:
+        pass  # evicted just now; the open handle still reads it
+    return fh
+
+
+def open_or_build(key, suffix, build):
+    """Open the cached file for `key`, writing it with `build(fileobj)` first on a miss."""
+    fh = open_cached(key, suffix)
+    if fh is not None:
+        return fh
+
+    path = cache_path(key, suffix)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            build(out)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    fh = open(path, 'rb')  # opened before eviction, so it survives an unlink
+    evict()
+    return fh
+
+
+def evict(max_bytes=None):
+    """Delete least recently used files until the cache fits in max_bytes; returns bytes freed."""
+    max_bytes = settings.EXPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    with os.scandir(cache_dir()) as it:
+        for entry in it:
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        freed += size
+    return freed
+
+
+def _read_chunks(fh):
+    with fh:
+        yield from iter(lambda: fh.read(READ_CHUNK), b'')
+
+
+def file_response(request, fh, filename, as_attachment=True):
+    """Stream an open export file back, gzip-encoding CSVs for clients that accept it."""
+    suffix = Path(filename).suffix
+    content_type = CONTENT_TYPES.get(suffix, 'application/octet-stream')
+    if suffix == '.csv' and wants_gzip(request):
+        response = StreamingHttpResponse(compress_sequence(_read_chunks(fh)), content_type=content_type)
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = FileResponse(fh, as_attachment=as_attachment, filename=filename, content_type=content_type)
+    return response
+
+
+def export_etag(request, key, filename):
+    gzipped = Path(filename).suffix == '.csv' and wants_gzip(request)
+    return f'"{key}-gzip"' if gzipped else f'"{key}"'
+
+
+def _cache_headers(response, etag):
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+    return response
+
+
+def serve_export(request, filename, filters, build, as_attachment=True):
+    """
+    Response for one of the farmer's exports. `filters` must already be
+    normalized (the same request always gives the same dict); `build(fileobj)`
+    writes the file on a cache miss.
+    """
+    farmer_id = request.user.pk
+    key = export_key(farmer_id, filename, filters, data_version(farmer_id))
+    etag = export_etag(request, key, filename)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        fh = open_or_build(key, Path(filename).suffix, build)
+        response = file_response(request, fh, filename, as_attachment)
+    return _cache_headers(response, etag)
+
+
+def serve_cached(request, key, filename, as_attachment=True):
+    """Like serve_export for a file rendered elsewhere (export jobs); None if it has been evicted."""
+    etag = export_etag(request, key, filename)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        fh = open_cached(key, Path(filename).suffix)
+        if fh is None:
+            return None
+        response = file_response(request, fh, filename, as_attachment)
+    return _cache_headers(response, etag)
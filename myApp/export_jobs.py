@@ -0,0 +1,129 @@
+"""
+Background export jobs.
+
+`start_export_job` records an ExportJob (or returns the farmer's identical
+one still in flight / already rendered). `python manage.py run_export_worker`
+claims pending jobs and renders several at once in a process pool, writing
+into the export cache under the key fixed at creation; progress is saved on
+the job so the page's HTMX partial can poll it. Finished jobs and their files
+are removed once they are older than EXPORT_JOB_TTL_HOURS.
+"""
+import os
+import time
+import traceback
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.utils import timezone
+
+from . import exports
+from .export_cache import cache_dir, cache_path, export_key, open_or_build
+from .models import ExportJob, data_version
+
+STALE_AFTER = timedelta(minutes=15)   # a 'running' job older than this lost its worker
+PROGRESS_EVERY = 0.5                  # seconds between progress writes
+
+
+def start_export_job(farmer, export, filters):
+    key = export_key(farmer.pk, export, filters, data_version(farmer.pk))
+    existing = (ExportJob.objects
+                .filter(farmer=farmer, cache_key=key, status__in=('pending', 'running', 'done'))
+                .order_by('-created_at')
+                .first())
+    if existing and (existing.is_active or cache_path(key, Path(export).suffix).exists()):
+        return existing
+    return ExportJob.objects.create(farmer=farmer, export=export, filters=filters, cache_key=key)
+
+
+def claim_export_jobs(worker, limit):
+    """Mark up to `limit` pending (or abandoned) jobs as ours and return their ids."""
+    now = timezone.now()
+    due = (ExportJob.objects
+           .filter(status='pending')
+           .order_by('created_at', 'id')
+           .values_list('id', flat=True)[:limit])
+    stale = (ExportJob.objects
+             .filter(status='running', started_at__lt=now - STALE_AFTER)
+             .values_list('id', flat=True)[:limit])
+    ids = (list(due) + list(stale))[:limit]
+    if not ids:
+        return []
+
+    # The status guard makes the claim safe when two workers race for the same rows
+    (ExportJob.objects
+     .filter(id__in=ids)
+     .filter(status__in=('pending', 'running'))
+     .exclude(status='running', started_at__gte=now - STALE_AFTER)
+     .update(status='running', claimed_by=worker, started_at=now, rows_done=0))
+    return list(ExportJob.objects
+                .filter(id__in=ids, claimed_by=worker, status='running', started_at=now)
+                .values_list('id', flat=True))
+
+
+def init_process():
+    """ProcessPoolExecutor initializer: Django in the child, without the parent's connections."""
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def render_export_job(job_id):
+    """Render one claimed job (runs in a pool process); returns True on success."""
+    job = ExportJob.objects.select_related('farmer').get(pk=job_id)
+    jobs = ExportJob.objects.filter(pk=job_id)
+    try:
+        total = exports.count_export_rows(job.export, job.farmer, job.filters)
+        jobs.update(rows_total=total)
+
+        last = [time.monotonic()]
+
+        def progress(done, pages):
+            now = time.monotonic()
+            if now - last[0] < PROGRESS_EVERY:
+                return
+            last[0] = now
+            try:
+                jobs.update(rows_done=done)
+            except OperationalError:
+                pass  # database busy; the next tick will catch up
+
+        def build(out):
+            exports.build_export(job.export, job.farmer, job.filters, out, progress)
+
+        open_or_build(job.cache_key, Path(job.export).suffix, build).close()
+    except Exception:
+        jobs.update(status='failed', last_error=traceback.format_exc(limit=5), finished_at=timezone.now())
+        return False
+
+    jobs.update(status='done', rows_done=total, finished_at=timezone.now())
+    return True
+
+
+def cleanup_export_jobs(ttl=None):
+    """Delete jobs (and their cached files) older than the TTL, plus leftover temp files; returns jobs deleted."""
+    ttl = ttl or timedelta(hours=settings.EXPORT_JOB_TTL_HOURS)
+    cutoff = timezone.now() - ttl
+    old = ExportJob.objects.filter(created_at__lt=cutoff).exclude(status='running')
+    recent_keys = set(ExportJob.objects.filter(created_at__gte=cutoff).values_list('cache_key', flat=True))
+
+    for key, export in old.values_list('cache_key', 'export'):
+        if key in recent_keys:
+            continue  # a newer job points at the same file
+        try:
+            os.unlink(cache_path(key, Path(export).suffix))
+        except FileNotFoundError:
+            pass
+
+    # Renders that died half-way leave their temp files behind
+    try:
+        with os.scandir(cache_dir()) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp') and entry.stat().st_mtime < cutoff.timestamp():
+                    os.unlink(entry.path)
+    except FileNotFoundError:
+        pass
+
+    deleted, _ = old.delete()
+    return deleted
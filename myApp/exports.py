@@ -0,0 +1,162 @@
+"""
+CSV/PDF exports: row sources, streamed CSV writing and the export registry.
+
+Rows come from `values_list(...).iterator()` so the database cursor is read in
+chunks and no model instances are built; the CSV is written a batch of lines
+at a time, so memory stays flat whatever the date range. EXPORTS names every
+downloadable file; the views write them into the export cache
+(export_cache.py), which streams the file back, gzip-encoded for clients that
+send `Accept-Encoding: gzip`, and `run_export_worker` renders them for
+background export jobs (export_jobs.py).
+"""
+import calendar
+import csv
+from io import StringIO
+
+from django.conf import settings
+from django.middleware.gzip import re_accepts_gzip
+from django.utils.dateparse import parse_date
+
+from . import reports
+from .date_ranges import as_int, filter_period
+from .models import Activity, Expense
+
+FETCH_CHUNK = 2000   # rows per cursor fetch
+WRITE_BATCH = 500    # CSV lines per yielded chunk
+
+EXPENSE_HEADER = ['Date', 'Type', 'Description', 'Amount']
+ACTIVITY_HEADER = ['Date', 'Crop', 'Type', 'Notes', 'Area(ha)', 'Seed(kg)', 'Fert(sacks)', 'Spacing']
+
+
+# ---------- Row sources ----------
+def expense_queryset(user, month=None, year=None):
+    return filter_period(Expense.objects.filter(farmer=user), year, month)
+
+
+def activity_queryset(user, start=None, end=None):
+    qs = Activity.objects.filter(farmer=user)
+    if start:
+        qs = qs.filter(date__gte=start)
+    if end:
+        qs = qs.filter(date__lte=end)
+    return qs
+
+
+def expense_export_rows(user, month=None, year=None):
+    qs = expense_queryset(user, month, year)
+    type_map = dict(Expense.EXPENSE_TYPES)
+    values = qs.order_by().values_list('date', 'expense_type', 'description', 'amount')
+    for day, expense_type, description, amount in values.iterator(chunk_size=FETCH_CHUNK):
+        yield day, type_map.get(expense_type, expense_type), description, amount
+
+
+def activity_export_rows(user, start=None, end=None):
+    qs = activity_queryset(user, start, end)
+    values = qs.order_by('-date').values_list(
+        'date', 'crop__name', 'activity_type', 'notes', 'area_ha', 'seed_qty_kg', 'fert_sacks', 'spacing')
+    for day, crop, activity_type, notes, area, seed, fert, spacing in values.iterator(chunk_size=FETCH_CHUNK):
+        if activity_type == 'planting':
+            yield day, crop, activity_type, notes or '', area, seed, fert, spacing
+        else:
+            yield day, crop, activity_type, notes or '', '', '', '', ''
+
+
+# ---------- CSV streaming ----------
+def csv_chunks(header, rows, batch=WRITE_BATCH):
+    """Yield the CSV text in chunks of `batch` lines; only one chunk is held at a time."""
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    pending = 1
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= batch:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+    if pending:
+        yield buf.getvalue()
+
+
+def wants_gzip(request):
+    return (getattr(settings, 'EXPORT_GZIP', True)
+            and bool(re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))))
+
+
+def write_csv(out, header, rows, progress=None):
+    """
+    Write the CSV as UTF-8 bytes to a binary file object, one chunk at a time.
+    `progress(rows_done, 0)` is called after each chunk (same signature as TableReport.render).
+    """
+    done = -1  # the header line
+    for chunk in csv_chunks(header, rows):
+        out.write(chunk.encode('utf-8'))
+        if progress:
+            done += chunk.count('\n')
+            progress(done, 0)
+
+
+# ---------- Export registry ----------
+def _iso_date(value):
+    try:
+        day = parse_date(value or '')
+    except ValueError:
+        return None
+    return day.isoformat() if day else None
+
+
+def _expense_period(filters):
+    month, year = filters['month'], filters['year']
+    return ' '.join(filter(None, [calendar.month_name[month] if month in range(1, 13) else '', str(year or '')]))
+
+
+def _activity_period(filters):
+    start, end = filters['start'], filters['end']
+    return f"{start or '…'} to {end or '…'}" if start or end else ''
+
+
+def _expenses_csv(user, filters, out, progress):
+    write_csv(out, EXPENSE_HEADER, expense_export_rows(user, **filters), progress)
+
+
+def _expenses_pdf(user, filters, out, progress):
+    rows = reports.expense_pdf_rows(expense_export_rows(user, **filters))
+    reports.expense_report(_expense_period(filters)).render(rows, out, progress)
+
+
+def _activities_csv(user, filters, out, progress):
+    write_csv(out, ACTIVITY_HEADER, activity_export_rows(user, **filters), progress)
+
+
+def _activities_pdf(user, filters, out, progress):
+    rows = activity_export_rows(user, **filters)
+    reports.activity_report(_activity_period(filters)).render(rows, out, progress)
+
+
+# name → (queryset for counting, writer)
+EXPORTS = {
+    'expenses.csv': (expense_queryset, _expenses_csv),
+    'expenses.pdf': (expense_queryset, _expenses_pdf),
+    'activities.csv': (activity_queryset, _activities_csv),
+    'activities.pdf': (activity_queryset, _activities_pdf),
+}
+
+
+def export_filters(name, params):
+    """
+    The filters an export honours, normalized from query params so the same
+    request always gives the same (JSON-serializable) dict.
+    """
+    if name.startswith('expenses'):
+        return {'month': as_int(params.get('month')), 'year': as_int(params.get('year'))}
+    return {'start': _iso_date(params.get('start')), 'end': _iso_date(params.get('end'))}
+
+
+def build_export(name, user, filters, out, progress=None):
+    EXPORTS[name][1](user, filters, out, progress)
+
+
+def count_export_rows(name, user, filters):
+    return EXPORTS[name][0](user, **filters).count()
@@ -0,0 +1,340 @@
+"""
+Column-oriented forecast engine.
+
+`compute_forecast_from_activity` in models.py handles one planting at a time.
+This module runs the same model over whole columns of plantings with NumPy so
+bulk recomputes (baseline edits, repairs) don't have to loop in Python.
+
+The arithmetic mirrors the scalar function operation-for-operation, so both
+paths return identical numbers for the same inputs.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (Crop, Forecast, _parse_spacing, _trees_per_ha, invalidate_dashboard_summaries,
+                     refresh_latest_forecasts, season_factor_table)
+
+
+# Order of the tuples produced by `planting_rows()`
+PLANTING_FIELDS = ('id', 'farmer_id', 'crop_id', 'date', 'area_ha', 'seed_qty_kg', 'fert_sacks', 'spacing',
+                   'trees_per_ha')
+
+CROP_FIELDS = (
+    'id', 'name', 'ideal_seasons',
+    'days_to_harvest_min', 'days_to_harvest_max',
+    'seed_rate_min_kg', 'seed_rate_max_kg',
+    'fert_sacks_min', 'fert_sacks_max',
+    'yield_t_min', 'yield_t_max',
+    'season_factors',
+)
+
+# Nominal trees/ha for crops whose yield scales with spacing (see compute_forecast_from_activity)
+TREE_NOMINAL = {"mango": 100, "guava": 400, "banana": 1100}
+
+# Same text compute_forecast_from_activity() writes; %-formatting is the fast path for bulk rows
+_NOTES = ("season=%.2f, seed×fert=%.2f "
+          "(seed=%.2f, fert=%.2f), pop=%.2f, "
+          "area=%rha, combined=%.2f")
+
+FORECAST_FIELDS = (
+    'expected_yield_kg', 'yield_min_kg', 'yield_max_kg',
+    'season_factor', 'input_factor', 'population_factor',
+    'harvest_start', 'harvest_end', 'notes', 'created_at',
+    'yield_p10_kg', 'yield_p50_kg', 'yield_p90_kg', 'harvest_p10', 'harvest_p50', 'harvest_p90',
+)
+
+
+class CropTable:
+    """Crop baselines as parallel arrays, addressable by crop id."""
+
+    def __init__(self, crops):
+        rows = sorted(crops, key=lambda c: c[0])
+        n = len(rows)
+        self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.names = [r[1] for r in rows]
+        self.days_min = [r[3] or 0 for r in rows]
+        self.days_max = [r[4] or 0 for r in rows]
+        self.seed_min = np.array([r[5] for r in rows], dtype=np.float64)
+        self.seed_max = np.array([r[6] for r in rows], dtype=np.float64)
+        self.fert_min = np.array([r[7] for r in rows], dtype=np.float64)
+        self.fert_max = np.array([r[8] for r in rows], dtype=np.float64)
+        self.yield_min = np.array([r[9] for r in rows], dtype=np.float64)
+        self.yield_max = np.array([r[10] for r in rows], dtype=np.float64)
+
+        # 12-month season lookup (Crop.season_factors, or parsed for unsaved crops)
+        self.season = np.ones((n, 12), dtype=np.float64)
+        for i, r in enumerate(rows):
+            table = r[11]
+            self.season[i] = table if table and len(table) == 12 else season_factor_table(r[2])
+
+        # 0 = not a spacing-driven crop
+        self.nominal = np.array(
+            [TREE_NOMINAL.get((r[1] or "").strip().lower(), 0) for r in rows], dtype=np.float64
+        )
+
+    @classmethod
+    def from_queryset(cls, queryset=None):
+        qs = Crop.objects.all() if queryset is None else queryset
+        return cls(qs.values_list(*CROP_FIELDS))
+
+    @classmethod
+    def from_instances(cls, crops):
+        return cls([tuple(getattr(c, f) for f in CROP_FIELDS) for c in crops])
+
+    def index_of(self, crop_ids):
+        idx = np.searchsorted(self.ids, crop_ids)
+        idx = np.minimum(idx, max(len(self.ids) - 1, 0))
+        if len(self.ids) == 0 or not np.array_equal(self.ids[idx], crop_ids):
+            raise KeyError("Planting references a crop missing from the crop table.")
+        return idx
+
+
+def planting_rows(queryset):
+    """values_list() over `queryset` in PLANTING_FIELDS order."""
+    return queryset.values_list(*PLANTING_FIELDS)
+
+
+def _trees_per_ha_for(rows):
+    """
+    Activity.trees_per_ha for each row, NaN where the scalar path would skip.
+    Rows saved before the column existed (or bulk-created) fall back to parsing,
+    once per distinct spacing string.
+    """
+    cache = {}
+    out = np.full(len(rows), np.nan)
+    for i, r in enumerate(rows):
+        trees = r[8]
+        if trees is None and r[7]:
+            sp = r[7]
+            if sp not in cache:
+                cache[sp] = _trees_per_ha(_parse_spacing(sp))
+            trees = cache[sp]
+        if trees:
+            out[i] = trees
+    return out
+
+
+def forecast_model(baseline_min, baseline_max, s_factor, smin, smax, fmin, fmax, nominal,
+                   area_raw, seed_qty, fert_qty, trees_ha):
+    """
+    The arithmetic of compute_forecast_from_activity() on NumPy arrays. Every
+    argument may be a scalar or any broadcast-compatible array, so the same
+    code serves per-planting columns and what-if grids over one crop.
+    `nominal` is 0 for crops without a population factor; `trees_ha` is NaN
+    where spacing is unknown.
+    """
+    area = np.maximum(area_raw, 1e-6)
+
+    # Seed factor
+    per_ha = seed_qty / area
+    ssum = smin + smax
+    mid = np.where(ssum > 0, ssum / 2.0, per_ha)
+    seed_factor = np.maximum(0.7, np.minimum(1.15, per_ha / np.maximum(mid, 1e-6)))
+    seed_factor = np.where((smax > 0) & (seed_qty > 0), seed_factor, 1.0)
+
+    # Fert factor
+    per_ha_f = fert_qty / area
+    fsum = fmin + fmax
+    mid_f = np.where(fsum > 0, fsum / 2.0, per_ha_f)
+    fert_factor = np.maximum(0.6, np.minimum(1.2, per_ha_f / np.maximum(mid_f, 1e-6)))
+    fert_factor = np.where((fmax > 0) & (fert_qty > 0), fert_factor, 1.0)
+
+    input_factor = seed_factor * fert_factor
+
+    # Population factor (tree crops only)
+    has_pop = (nominal > 0) & ~np.isnan(trees_ha)
+    ratio = np.divide(trees_ha, nominal, out=np.ones(has_pop.shape), where=has_pop)
+    pop_factor = np.where(has_pop, np.maximum(0.6, np.minimum(1.3, ratio)), 1.0)
+
+    combined = np.maximum(0.5, np.minimum(1.3, s_factor * input_factor * pop_factor))
+
+    total_min = baseline_min * combined * area
+    total_max = baseline_max * combined * area
+    est = (total_min + total_max) / 2.0
+
+    return {
+        "area": area,
+        "yield_min_kg": total_min,
+        "yield_max_kg": total_max,
+        "expected_yield_kg": est,
+        "season_factor": s_factor,
+        "seed_factor": seed_factor,
+        "fert_factor": fert_factor,
+        "input_factor": input_factor,
+        "population_factor": pop_factor,
+        "combined": combined,
+    }
+
+
+def compute_forecast_columns(rows, crop_table):
+    """
+    Evaluate the forecast model for every planting tuple in `rows` at once.
+    Returns a dict of arrays (one entry per row) plus the input columns the
+    caller needs to build notes and harvest dates.
+    """
+    n = len(rows)
+    crop_ids = np.fromiter((r[2] for r in rows), dtype=np.int64, count=n)
+    ci = crop_table.index_of(crop_ids)
+
+    area_raw = np.array([r[4] or 1.0 for r in rows], dtype=np.float64)
+    seed_qty = np.array([r[5] or 0.0 for r in rows], dtype=np.float64)
+    fert_qty = np.array([r[6] or 0.0 for r in rows], dtype=np.float64)
+    months = np.fromiter((r[3].month for r in rows), dtype=np.int64, count=n)
+
+    baseline_min = crop_table.yield_min[ci] * 1000.0
+    baseline_max = crop_table.yield_max[ci] * 1000.0
+    missing = (baseline_min <= 0) | (baseline_max <= 0)
+
+    # Spacing only matters for tree crops; skip parsing for everything else
+    nominal = crop_table.nominal[ci]
+    trees_ha = np.full(n, np.nan)
+    tree_idx = np.flatnonzero(nominal > 0)
+    if len(tree_idx):
+        trees_ha[tree_idx] = _trees_per_ha_for([rows[i] for i in tree_idx])
+
+    cols = forecast_model(
+        baseline_min, baseline_max, crop_table.season[ci, months - 1],
+        crop_table.seed_min[ci], crop_table.seed_max[ci],
+        crop_table.fert_min[ci], crop_table.fert_max[ci],
+        nominal, area_raw, seed_qty, fert_qty, trees_ha,
+    )
+    cols["crop_index"] = ci
+    cols["missing"] = missing
+    return cols
+
+
+def compute_forecasts_batch(rows, crop_table):
+    """
+    Same output as calling compute_forecast_from_activity() on each planting,
+    as a list of dicts in row order.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    cols = compute_forecast_columns(rows, crop_table)
+
+    # Back to Python floats so formatting and equality match the scalar path
+    missing = cols["missing"].tolist()
+    y_min = cols["yield_min_kg"].tolist()
+    y_max = cols["yield_max_kg"].tolist()
+    est = cols["expected_yield_kg"].tolist()
+    s_factor = cols["season_factor"].tolist()
+    input_factor = cols["input_factor"].tolist()
+    pop_factor = cols["population_factor"].tolist()
+    note_args = zip(s_factor, input_factor, cols["seed_factor"].tolist(), cols["fert_factor"].tolist(),
+                    pop_factor, cols["area"].tolist(), cols["combined"].tolist())
+    start_delta = [timedelta(days=d) for d in crop_table.days_min]
+    end_delta = [timedelta(days=d) for d in crop_table.days_max]
+    ci = cols["crop_index"].tolist()
+
+    out = []
+    for i, args in enumerate(note_args):
+        if missing[i]:
+            out.append({
+                "yield_min_kg": 0, "yield_max_kg": 0, "expected_yield_kg": 0,
+                "season_factor": 1.0, "input_factor": 1.0, "population_factor": 1.0,
+                "harvest_start": None, "harvest_end": None,
+                "notes": "Missing baseline yields for this crop."
+            })
+            continue
+        planted = rows[i][3]
+        out.append({
+            "yield_min_kg": y_min[i],
+            "yield_max_kg": y_max[i],
+            "expected_yield_kg": est[i],
+            "season_factor": s_factor[i],
+            "input_factor": input_factor[i],
+            "population_factor": pop_factor[i],
+            "harvest_start": planted + start_delta[ci[i]],
+            "harvest_end": planted + end_delta[ci[i]],
+            "notes": _NOTES % args,
+        })
+    return out
+
+
+def latest_planting_rows(queryset):
+    """
+    Yield the newest planting (by date, then id) for every farmer/crop pair in
+    `queryset`, matching how the dashboard links a forecast to its planting.
+    """
+    qs = (queryset.filter(activity_type='planting')
+          .order_by('farmer_id', 'crop_id', '-date', '-id'))
+    last_pair = None
+    for row in planting_rows(qs).iterator(chunk_size=5000):
+        pair = (row[1], row[2])
+        if pair != last_pair:
+            last_pair = pair
+            yield row
+
+
+def write_forecasts(rows, results, forecast_date=None):
+    """
+    Bulk equivalent of the Forecast.update_or_create() in auto_forecast_on_planting:
+    one row per farmer/crop for `forecast_date`, updated in place when it exists.
+    Returns (created, updated).
+    """
+    forecast_date = forecast_date or timezone.now().date()
+    now = timezone.now()
+
+    by_pair = {}
+    for r, data in zip(rows, results):
+        by_pair[(r[1], r[2])] = data
+    if not by_pair:
+        return 0, 0
+
+    farmer_ids = {p[0] for p in by_pair}
+    crop_ids = {p[1] for p in by_pair}
+
+    with transaction.atomic():
+        existing = (Forecast.objects
+                    .filter(forecast_date=forecast_date,
+                            farmer_id__in=farmer_ids, crop_id__in=crop_ids))
+        to_update, seen = [], set()
+        for fc in existing:
+            pair = (fc.farmer_id, fc.crop_id)
+            data = by_pair.get(pair)
+            if data is None:
+                continue
+            _apply(fc, data, now)
+            to_update.append(fc)
+            seen.add(pair)
+
+        to_create = []
+        for (farmer_id, crop_id), data in by_pair.items():
+            if (farmer_id, crop_id) in seen:
+                continue
+            fc = Forecast(farmer_id=farmer_id, crop_id=crop_id, forecast_date=forecast_date)
+            _apply(fc, data, now)
+            to_create.append(fc)
+
+        if to_update:
+            Forecast.objects.bulk_update(to_update, FORECAST_FIELDS, batch_size=500)
+        if to_create:
+            Forecast.objects.bulk_create(to_create, batch_size=500)
+        # bulk_* skip the signals that keep the pointers and dashboard summaries current
+        refresh_latest_forecasts(by_pair)
+        invalidate_dashboard_summaries(farmer_ids)
+    return len(to_create), len(to_update)
+
+
+def _apply(fc, data, now):
+    fc.expected_yield_kg = data["expected_yield_kg"]
+    fc.yield_min_kg = data["yield_min_kg"]
+    fc.yield_max_kg = data["yield_max_kg"]
+    fc.season_factor = data["season_factor"]
+    fc.input_factor = data["input_factor"]
+    fc.population_factor = data["population_factor"]
+    fc.harvest_start = data["harvest_start"]
+    fc.harvest_end = data["harvest_end"]
+    fc.notes = data["notes"]
+    fc.created_at = now
+    # Only present when the Monte Carlo pass ran; otherwise clear stale percentiles
+    fc.yield_p10_kg = data.get("yield_p10_kg")
+    fc.yield_p50_kg = data.get("yield_p50_kg")
+    fc.yield_p90_kg = data.get("yield_p90_kg")
+    fc.harvest_p10 = data.get("harvest_p10")
+    fc.harvest_p50 = data.get("harvest_p50")
+    fc.harvest_p90 = data.get("harvest_p90")
@@ -0,0 +1,138 @@
+"""
+Forecast history compaction.
+
+save_forecast_for_activity and write_forecasts upsert one Forecast per farmer,
+crop and day, so a season of recalculations leaves long runs of identical rows.
+`python manage.py compact_forecasts` walks the history a chunk of farmers at a
+time and, per farmer/crop:
+
+1. collapses each run of consecutive, unchanged forecasts into its last row,
+   whose `valid_from` records the day the run started;
+2. keeps one snapshot per ISO week (the week's last forecast, stretched over
+   the week) for rows older than FORECAST_WEEKLY_AFTER_DAYS.
+
+Today's rows (still being upserted) and the rows LatestForecast points at are
+never removed, so the pointers and dashboard summaries stay valid and the
+deletes can skip the Forecast signals. A chunk is read outside any transaction
+and written in one short one, so the SQLite write lock is held for a few
+batched statements at a time.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Forecast, LatestForecast
+
+# What a forecast says; consecutive rows that agree on all of these are one forecast
+VALUE_FIELDS = (
+    'expected_yield_kg', 'yield_min_kg', 'yield_max_kg',
+    'season_factor', 'input_factor', 'population_factor',
+    'harvest_start', 'harvest_end', 'notes',
+    'yield_p10_kg', 'yield_p50_kg', 'yield_p90_kg', 'harvest_p10', 'harvest_p50', 'harvest_p90',
+)
+WRITE_BATCH = 500  # ids per DELETE / rows per bulk_update
+
+# One history row: `start` is the first day it stands for (valid_from or forecast_date)
+_Row = namedtuple('_Row', 'id day start values')
+
+CompactionResult = namedtuple('CompactionResult', 'scanned deleted stretched')
+
+
+def farmer_id_chunks(size, farmer_ids=None):
+    """Farmer ids that have forecasts, `size` at a time (keyset over the farmer index)."""
+    last = 0
+    while True:
+        qs = Forecast.objects.filter(farmer_id__gt=last)
+        if farmer_ids:
+            qs = qs.filter(farmer_id__in=farmer_ids)
+        chunk = list(qs.order_by('farmer_id').values_list('farmer_id', flat=True).distinct()[:size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+
+
+def _collapse(rows, pinned, same):
+    """
+    Merge runs of rows where same(previous, row) holds into the run's last row,
+    starting from the run's first day. A pinned row always ends its run.
+    Returns (kept rows, dropped ids).
+    """
+    kept, dropped, run = [], [], []
+    for row in rows:
+        if run and (run[-1].id in pinned or not same(run[-1], row)):
+            kept.append(run[-1]._replace(start=min(r.start for r in run)))
+            dropped.extend(r.id for r in run[:-1])
+            run = []
+        run.append(row)
+    if run:
+        kept.append(run[-1]._replace(start=min(r.start for r in run)))
+        dropped.extend(r.id for r in run[:-1])
+    return kept, dropped
+
+
+def plan_compaction(rows, pinned, weekly_before):
+    """
+    For one farmer/crop history ordered by day: (kept rows, dropped ids).
+    Rows before `weekly_before` are thinned to one per ISO week after merging.
+    """
+    kept, dropped = _collapse(rows, pinned, lambda a, b: a.values == b.values)
+    old = [r for r in kept if r.day < weekly_before]
+    if len(old) > 1:
+        weekly, thinned = _collapse(old, pinned, lambda a, b: a.day.isocalendar()[:2] == b.day.isocalendar()[:2])
+        kept = weekly + kept[len(old):]
+        dropped += thinned
+    return kept, dropped
+
+
+def _delete(ids):
+    """Raw batched DELETE (no signals); a row that became a pointer meanwhile is left alone."""
+    table, pointers = Forecast._meta.db_table, LatestForecast._meta.db_table
+    deleted = 0
+    with connection.cursor() as cursor:
+        for lo in range(0, len(ids), WRITE_BATCH):
+            batch = ids[lo:lo + WRITE_BATCH]
+            cursor.execute(
+                f'DELETE FROM "{table}" WHERE id IN ({", ".join(["%s"] * len(batch))}) '
+                f'AND id NOT IN (SELECT forecast_id FROM "{pointers}")', batch)
+            deleted += cursor.rowcount
+    return deleted
+
+
+def compact_farmers(farmer_ids, today=None, weekly_after_days=None, dry_run=False):
+    """Compact the forecast history of `farmer_ids`; returns a CompactionResult."""
+    today = today or timezone.now().date()
+    if weekly_after_days is None:
+        weekly_after_days = settings.FORECAST_WEEKLY_AFTER_DAYS
+    weekly_before = today - timedelta(days=weekly_after_days)
+
+    values = (Forecast.objects
+              .filter(farmer_id__in=farmer_ids, forecast_date__lt=today)
+              .order_by('farmer_id', 'crop_id', 'forecast_date', 'created_at', 'id')
+              .values_list('id', 'farmer_id', 'crop_id', 'forecast_date', 'valid_from', *VALUE_FIELDS))
+    pinned = set(LatestForecast.objects.filter(farmer_id__in=farmer_ids).values_list('forecast_id', flat=True))
+
+    scanned, to_delete, to_stretch = 0, [], []
+    for _, group in groupby(values.iterator(chunk_size=2000), key=lambda v: v[1:3]):
+        rows = [_Row(v[0], v[3], v[4] or v[3], v[5:]) for v in group]
+        scanned += len(rows)
+        kept, dropped = plan_compaction(rows, pinned, weekly_before)
+        to_delete += dropped
+        # valid_from is only set when a row stands for more than its own day
+        by_id = {r.id: r for r in rows}
+        for row in kept:
+            valid_from = row.start if row.start < row.day else None
+            current = by_id[row.id].start
+            if valid_from != (current if current < row.day else None):
+                to_stretch.append(Forecast(pk=row.id, valid_from=valid_from))
+
+    if dry_run or not (to_delete or to_stretch):
+        return CompactionResult(scanned, len(to_delete), len(to_stretch))
+    with transaction.atomic():
+        Forecast.objects.bulk_update(to_stretch, ['valid_from'], batch_size=WRITE_BATCH)
+        deleted = _delete(to_delete)
+    return CompactionResult(scanned, deleted, len(to_stretch))
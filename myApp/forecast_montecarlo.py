@@ -0,0 +1,103 @@
+"""
+Probabilistic forecasts (P10 / P50 / P90) on top of the batch engine.
+
+Each sample draws:
+  * the per-hectare baseline from a triangular distribution over the crop's
+    yield_t_min..yield_t_max (mode at the midpoint),
+  * input uncertainty as log-normal noise on season × inputs × population,
+    clamped like the deterministic combined factor,
+  * days to harvest from a triangular distribution over the crop's maturity days.
+
+The standard draws depend only on (samples, seed) and are shared by every
+planting ("common random numbers"), so a planting gets the same percentiles
+whether it is forecast alone or inside a batch of 50k.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+
+from .forecast_batch import PLANTING_FIELDS, CropTable, compute_forecast_columns
+
+PERCENTILES = (10, 50, 90)
+INPUT_SIGMA = 0.10          # sd of log(actual / modelled) combined factor
+CHUNK_CELLS = 1_000_000     # plantings × samples evaluated per pass (~8 MB per temporary)
+
+MC_FIELDS = (
+    'yield_p10_kg', 'yield_p50_kg', 'yield_p90_kg',
+    'harvest_p10', 'harvest_p50', 'harvest_p90',
+)
+
+
+def standard_draws(samples, seed):
+    rng = np.random.default_rng(seed)
+    return {
+        "yield": rng.triangular(0.0, 0.5, 1.0, samples),
+        "noise": np.exp(rng.normal(0.0, INPUT_SIGMA, samples)),
+        "days": rng.triangular(0.0, 0.5, 1.0, samples),
+    }
+
+
+def yield_percentiles(rows, crop_table, draws, cols=None):
+    """(len(PERCENTILES), len(rows)) array of total-yield percentiles in kg."""
+    cols = cols or compute_forecast_columns(rows, crop_table)
+    ci = cols["crop_index"]
+    bmin = crop_table.yield_min[ci] * 1000.0
+    bmax = crop_table.yield_max[ci] * 1000.0
+
+    factor = cols["season_factor"] * cols["input_factor"] * cols["population_factor"]
+    combined = np.clip(factor[:, None] * draws["noise"][None, :], 0.5, 1.3)
+    y = bmin[:, None] + (bmax - bmin)[:, None] * draws["yield"][None, :]
+    y *= combined
+    y *= cols["area"][:, None]
+    return np.percentile(y, PERCENTILES, axis=1)
+
+
+def add_percentiles(rows, results, crop_table, samples=None, seed=None):
+    """
+    Fill the MC_FIELDS keys of compute_forecasts_batch() results in place.
+    Rows whose crop has no baseline yields get None.
+    """
+    samples = samples or settings.FORECAST_MC_SAMPLES
+    seed = settings.FORECAST_MC_SEED if seed is None else seed
+    rows = list(rows)
+    if not rows:
+        return results
+
+    draws = standard_draws(samples, seed)
+    # Maturity days scale linearly with the draw, so its percentiles carry over per crop
+    q_days = np.percentile(draws["days"], PERCENTILES)
+    days_min = np.array(crop_table.days_min, dtype=np.float64)
+    days_span = np.array(crop_table.days_max, dtype=np.float64) - days_min
+
+    step = max(1, CHUNK_CELLS // samples)
+    for lo in range(0, len(rows), step):
+        part = rows[lo:lo + step]
+        cols = compute_forecast_columns(part, crop_table)
+        ci = cols["crop_index"]
+        y = yield_percentiles(part, crop_table, draws, cols).T.tolist()
+        offsets = np.rint(days_min[ci][:, None] + days_span[ci][:, None] * q_days[None, :]).astype(int).tolist()
+        missing = cols["missing"].tolist()
+
+        for i, data in enumerate(results[lo:lo + step]):
+            if missing[i]:
+                data.update(dict.fromkeys(MC_FIELDS))
+                continue
+            planted = part[i][3]
+            p10, p50, p90 = y[i]
+            d10, d50, d90 = offsets[i]
+            data.update({
+                "yield_p10_kg": p10, "yield_p50_kg": p50, "yield_p90_kg": p90,
+                "harvest_p10": planted + timedelta(days=d10),
+                "harvest_p50": planted + timedelta(days=d50),
+                "harvest_p90": planted + timedelta(days=d90),
+            })
+    return results
+
+
+def percentiles_for_activity(activity, samples=None, seed=None):
+    """MC_FIELDS for a single (possibly unsaved) planting."""
+    row = tuple(getattr(activity, f) for f in PLANTING_FIELDS)
+    data = {}
+    add_percentiles([row], [data], CropTable.from_instances([activity.crop]), samples=samples, seed=seed)
+    return data
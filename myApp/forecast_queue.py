@@ -0,0 +1,261 @@
+"""
+Database-backed queue for forecast refreshes.
+
+Planting saves enqueue a ForecastJob (see auto_forecast_on_planting); workers
+started with `python manage.py run_forecast_worker` claim pending jobs in
+batches, keep only the newest job per farmer/crop, and write the forecasts with
+the batch engine. SQLite "database is locked" errors put the jobs back with a
+backoff instead of failing them; any other error splits the batch in halves
+and retries them, so only the farmer/crop whose own job fails is marked
+failed. A job whose worker died is reclaimed after STALE_AFTER, which counts as
+an attempt, so a job that keeps killing workers fails after MAX_ATTEMPTS.
+
+Crop baseline edits create a CropRecompute (see recompute_on_baseline_change),
+which the same workers advance one chunk of farmers at a time.
+"""
+import logging
+import os
+import socket
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import Case, F, PositiveIntegerField, When
+from django.utils import timezone
+
+from .forecast_batch import CropTable, compute_forecasts_batch, latest_planting_rows, planting_rows, write_forecasts
+from .forecast_montecarlo import add_percentiles
+from .models import Activity, Crop, CropRecompute, ForecastJob
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+STALE_AFTER = timedelta(minutes=5)   # a 'running' job older than this lost its worker
+RECOMPUTE_CHUNK = 500                # farmers per CropRecompute step (one bulk write each)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _is_lock_error(exc):
+    return isinstance(exc, OperationalError) and 'locked' in str(exc).lower()
+
+
+def claim_jobs(worker, limit=200):
+    """Mark up to `limit` due jobs as ours and return them; reclaiming a stale job costs it an attempt."""
+    now = timezone.now()
+    # Jobs whose workers died on them MAX_ATTEMPTS times are not handed out again
+    (ForecastJob.objects
+     .filter(status='running', claimed_at__lt=now - STALE_AFTER, attempts__gte=MAX_ATTEMPTS - 1)
+     .update(status='failed', attempts=F('attempts') + 1, claimed_by='', claimed_at=None,
+             last_error='Worker stopped while running this job.'))
+    due = (ForecastJob.objects
+           .filter(status='pending', available_at__lte=now)
+           .order_by('available_at', 'id')
+           .values_list('id', flat=True)[:limit])
+    stale = (ForecastJob.objects
+             .filter(status='running', claimed_at__lt=now - STALE_AFTER)
+             .values_list('id', flat=True)[:limit])
+    ids = list(due) + list(stale)
+    if not ids:
+        return []
+
+    # The status guard makes the claim safe when two workers race for the same rows
+    (ForecastJob.objects
+     .filter(id__in=ids)
+     .filter(status__in=('pending', 'running'))
+     .exclude(status='running', claimed_at__gte=now - STALE_AFTER)
+     .update(status='running', claimed_by=worker, claimed_at=now,
+             attempts=Case(When(status='running', then=F('attempts') + 1), default=F('attempts'),
+                           output_field=PositiveIntegerField())))
+    return list(ForecastJob.objects.filter(claimed_by=worker, status='running', claimed_at=now))
+
+
+def merge_jobs(jobs):
+    """
+    One forecast row exists per farmer/crop per day, so only the newest job for
+    each pair matters. Returns (winners, superseded).
+    """
+    newest = {}
+    for job in jobs:
+        key = (job.farmer_id, job.crop_id)
+        if key not in newest or job.id > newest[key].id:
+            newest[key] = job
+    winners = list(newest.values())
+    winner_ids = {j.id for j in winners}
+    return winners, [j for j in jobs if j.id not in winner_ids]
+
+
+def _release(jobs, error, retry):
+    now = timezone.now()
+    for job in jobs:
+        job.attempts += 1
+        job.last_error = error
+        job.claimed_by = ''
+        job.claimed_at = None
+        if retry and job.attempts < MAX_ATTEMPTS:
+            job.status = 'pending'
+            job.available_at = now + timedelta(seconds=2 ** job.attempts)
+        else:
+            job.status = 'failed'
+    ForecastJob.objects.bulk_update(
+        jobs, ['attempts', 'last_error', 'claimed_by', 'claimed_at', 'status', 'available_at']
+    )
+
+
+def _write_batch(jobs, crop_table):
+    winners, _ = merge_jobs(jobs)
+    rows = list(planting_rows(Activity.objects.filter(id__in=[j.activity_id for j in winners])))
+    results = compute_forecasts_batch(rows, crop_table)
+    if settings.FORECAST_MONTE_CARLO:
+        add_percentiles(rows, results, crop_table)
+    with transaction.atomic():
+        write_forecasts(rows, results)
+        ForecastJob.objects.filter(id__in=[j.id for j in jobs]).delete()
+    return len(rows)
+
+
+def run_jobs(jobs, crop_table=None):
+    """
+    Compute and store forecasts for claimed jobs. Returns the number of forecasts written.
+
+    A lock error reschedules every job not written yet and is re-raised. Other
+    errors bisect the batch (a farmer/crop's jobs always stay together) until
+    the failing pair is alone; its jobs are marked failed and logged, the rest
+    are written.
+    """
+    crop_table = crop_table or CropTable.from_queryset()
+    batches = [jobs]
+    written = 0
+    while batches:
+        batch = batches.pop()
+        try:
+            written += _write_batch(batch, crop_table)
+        except Exception as exc:
+            error = traceback.format_exc(limit=3)
+            if _is_lock_error(exc):
+                _release([job for rest in batches for job in rest] + batch, error, retry=True)
+                raise
+            pairs = {}
+            for job in batch:
+                pairs.setdefault((job.farmer_id, job.crop_id), []).append(job)
+            if len(pairs) == 1:
+                _release(batch, error, retry=False)
+                logger.error("Forecast jobs %s failed:\n%s", [job.id for job in batch], error)
+                continue
+            groups = list(pairs.values())
+            half = len(groups) // 2
+            batches.append([job for group in groups[half:] for job in group])
+            batches.append([job for group in groups[:half] for job in group])
+    return written
+
+
+def process_batch(worker, limit=200):
+    """
+    Claim and run one batch. Returns (jobs_claimed, forecasts_written).
+    Lock errors are swallowed (the jobs are already rescheduled), as are failing
+    jobs, which run_jobs marks failed and logs.
+    """
+    jobs = claim_jobs(worker, limit=limit)
+    if not jobs:
+        return 0, 0
+    try:
+        written = run_jobs(jobs)
+    except OperationalError as exc:
+        if not _is_lock_error(exc):
+            raise
+        return len(jobs), 0
+    return len(jobs), written
+
+
+def drain(limit=200):
+    """Run every due job in this process (handy for tests and one-off repairs)."""
+    worker = worker_name()
+    total = 0
+    while True:
+        claimed, written = process_batch(worker, limit=limit)
+        if not claimed:
+            return total
+        total += written
+
+
+# ---------- Crop baseline recomputes ----------
+class _Superseded(Exception):
+    """The CropRecompute changed under us (restarted or advanced by another worker)."""
+
+
+def recompute_chunk(job, chunk_size=RECOMPUTE_CHUNK):
+    """
+    Refresh the forecasts of the next `chunk_size` farmers planting job.crop.
+    Returns True once the recompute is finished.
+    """
+    plantings = Activity.objects.filter(crop_id=job.crop_id, activity_type='planting')
+    if job.total is None:
+        job.total = plantings.values('farmer_id').distinct().count()
+        job.status = 'running'
+        job.save(update_fields=['total', 'status', 'updated_at'])
+
+    farmer_ids = list(plantings
+                      .filter(farmer_id__gt=job.cursor)
+                      .order_by('farmer_id')
+                      .values_list('farmer_id', flat=True)
+                      .distinct()[:chunk_size])
+    if not farmer_ids:
+        job.status = 'done'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'finished_at', 'updated_at'])
+        return True
+
+    crop_table = CropTable.from_queryset(Crop.objects.filter(id=job.crop_id))
+    rows = list(latest_planting_rows(plantings.filter(farmer_id__in=farmer_ids)))
+    results = compute_forecasts_batch(rows, crop_table)
+    if settings.FORECAST_MONTE_CARLO:
+        add_percentiles(rows, results, crop_table)
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            write_forecasts(rows, results)
+            advanced = (CropRecompute.objects
+                        .filter(id=job.id, updated_at=job.updated_at)
+                        .update(processed=job.processed + len(rows), cursor=farmer_ids[-1],
+                                status='running', updated_at=now))
+            if not advanced:
+                raise _Superseded()
+    except _Superseded:
+        job.refresh_from_db()
+        return job.status == 'done'
+
+    job.processed += len(rows)
+    job.cursor = farmer_ids[-1]
+    job.updated_at = now
+    return False
+
+
+def run_crop_recompute(job, chunk_size=RECOMPUTE_CHUNK):
+    """Run a CropRecompute to completion in this process."""
+    while not recompute_chunk(job, chunk_size=chunk_size):
+        pass
+
+
+def process_recompute_chunk(chunk_size=RECOMPUTE_CHUNK):
+    """Advance the oldest unfinished CropRecompute by one chunk. Returns False when there is none."""
+    job = (CropRecompute.objects
+           .filter(status__in=('pending', 'running'))
+           .order_by('created_at', 'id').first())
+    if job is None:
+        return False
+    try:
+        recompute_chunk(job, chunk_size=chunk_size)
+    except OperationalError as exc:
+        if not _is_lock_error(exc):
+            raise
+    except Exception:
+        CropRecompute.objects.filter(id=job.id).update(
+            status='failed', last_error=traceback.format_exc(limit=3), updated_at=timezone.now()
+        )
+        raise
+    return True
@@ -0,0 +1,122 @@
+"""
+What-if grids over one crop's forecast model.
+
+Technicians pick value ranges for area, seed, fertilizer and spacing; every
+combination is evaluated in a single broadcast pass of `forecast_model` and
+returned as a flattened surface (C order over the axes, area first).
+"""
+import hashlib
+import json
+
+import numpy as np
+from django.core.cache import cache
+
+from .forecast_batch import CROP_FIELDS, CropTable, forecast_model
+
+MAX_SCENARIOS = 10_000
+CACHE_TIMEOUT = 60 * 10
+
+# Axis order of the response surface
+AXES = ('area', 'seed', 'fert', 'spacing')
+
+
+class ScenarioError(ValueError):
+    """Bad grid parameters; the message is safe to show to the client."""
+
+
+def _number(name, text):
+    try:
+        return float(text)
+    except ValueError:
+        raise ScenarioError(f"{name}: '{text}' is not a number.")
+
+
+def parse_axis(name, raw, default):
+    """
+    '1:5:9' → 9 evenly spaced values from 1 to 5, '1,2,4' → those values,
+    '3' → one value. Empty/missing → [default].
+    """
+    if raw is None or str(raw).strip() == '':
+        return [default]
+    raw = str(raw).strip()
+    if ':' in raw:
+        parts = raw.split(':')
+        if len(parts) != 3:
+            raise ScenarioError(f"{name}: use start:stop:num.")
+        start, stop, num = _number(name, parts[0]), _number(name, parts[1]), _number(name, parts[2])
+        if num != int(num) or not 1 <= num <= MAX_SCENARIOS:
+            raise ScenarioError(f"{name}: num must be a whole number between 1 and {MAX_SCENARIOS}.")
+        values = np.linspace(start, stop, int(num)).tolist()
+    else:
+        values = [_number(name, v) for v in raw.split(',') if v.strip() != '']
+    if not values:
+        return [default]
+    if any(not np.isfinite(v) or v < 0 for v in values):
+        raise ScenarioError(f"{name}: values must be zero or positive.")
+    return values
+
+
+def parse_grid(params, defaults):
+    """All four axes from query params; enforces the MAX_SCENARIOS budget."""
+    axes = {a: parse_axis(a, params.get(a), defaults[a]) for a in AXES}
+    if any(v <= 0 for v in axes['area']):
+        raise ScenarioError("area: values must be greater than zero.")
+    total = int(np.prod([len(axes[a]) for a in AXES]))
+    if total > MAX_SCENARIOS:
+        raise ScenarioError(f"Grid has {total} combinations; the limit is {MAX_SCENARIOS}.")
+    return axes
+
+
+def evaluate_grid(crop_row, month, axes):
+    """
+    Forecast surface for one crop (a CROP_FIELDS tuple) planted in `month`.
+    `axes` maps AXES names to value lists; spacing is square spacing in metres
+    (None = unknown). Returns the JSON-ready response dict.
+    """
+    table = CropTable([crop_row])
+    shape = tuple(len(axes[a]) for a in AXES)
+
+    area = np.array(axes['area'], dtype=np.float64).reshape(-1, 1, 1, 1)
+    seed = np.array(axes['seed'], dtype=np.float64).reshape(1, -1, 1, 1)
+    fert = np.array(axes['fert'], dtype=np.float64).reshape(1, 1, -1, 1)
+    spacing = np.array([np.nan if s is None else s for s in axes['spacing']], dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        trees_ha = np.where(spacing > 0, 10000.0 / (spacing * spacing), np.nan).reshape(1, 1, 1, -1)
+
+    baseline_min = table.yield_min[0] * 1000.0
+    baseline_max = table.yield_max[0] * 1000.0
+    result = {
+        "crop": crop_row[0],
+        "month": month,
+        "axes": {a: axes[a] for a in AXES},
+        "shape": list(shape),
+        "harvest_days": [table.days_min[0], table.days_max[0]],
+    }
+    if baseline_min <= 0 or baseline_max <= 0:
+        result["error"] = "Missing baseline yields for this crop."
+        return result
+
+    cols = forecast_model(
+        baseline_min, baseline_max, table.season[0, month - 1],
+        table.seed_min[0], table.seed_max[0], table.fert_min[0], table.fert_max[0],
+        table.nominal[0], area, seed, fert, trees_ha,
+    )
+    result["season_factor"] = float(table.season[0, month - 1])
+    # Expected yield is the midpoint, so min/max are all the client needs
+    for key in ("yield_min_kg", "yield_max_kg"):
+        result[key] = np.broadcast_to(cols[key], shape).ravel().round(1).tolist()
+    result["combined"] = np.broadcast_to(cols["combined"], shape).ravel().round(3).tolist()
+    return result
+
+
+def scenario_surface(crop, month, axes):
+    """evaluate_grid() for a saved Crop, as JSON text cached per baselines + grid."""
+    crop_row = tuple(getattr(crop, f) for f in CROP_FIELDS)
+    # Baselines are part of the key, so editing the crop never serves a stale surface
+    digest = hashlib.sha1(repr((crop_row, month, [axes[a] for a in AXES])).encode()).hexdigest()
+    key = f"forecast-scenarios:{crop.pk}:{digest}"
+    body = cache.get(key)
+    if body is None:
+        body = json.dumps(evaluate_grid(crop_row, month, axes), separators=(',', ':'))
+        cache.set(key, body, CACHE_TIMEOUT)
+    return body
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from myApp.bench import best_of, create_farmers, insert_expenses, query_plan, scratch_database
+from myApp.date_ranges import filter_period
+from myApp.models import Expense
+
+
+def _extract_filter(qs, year=None, month=None):
+    """The filters the expense views used before date_ranges.py."""
+    if year is not None:
+        qs = qs.filter(date__year=year)
+    if month is not None:
+        qs = qs.filter(date__month=month)
+    return qs
+
+
+# (label, year, month)
+CASES = [
+    ("year", 2023, None),
+    ("year+month", 2023, 6),
+    ("month only", None, 6),
+]
+
+
+class Command(BaseCommand):
+    help = "Benchmark __year/__month extraction against half-open date ranges on a scratch database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--farmers', type=int, default=1,
+                            help="Rows are spread over this many farmers; queries read the first one.")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--plans', action='store_true', help="Print EXPLAIN QUERY PLAN for both forms.")
+
+    def handle(self, *args, **opts):
+        with scratch_database() as alias:
+            self.stdout.write(f"Inserting {opts['rows']:,} expenses for {opts['farmers']} farmer(s)...")
+            farmer_ids = create_farmers(alias, max(opts['farmers'], 1))
+            insert_expenses(alias, farmer_ids, opts['rows'], seed=opts['seed'])
+            base = Expense.objects.using(alias).filter(farmer_id=farmer_ids[0])
+
+            self.stdout.write(f"{'filter':<12} {'rows':>9} {'extract ms':>11} {'range ms':>9} {'speedup':>8}")
+            for label, year, month in CASES:
+                old = _extract_filter(base, year, month)
+                new = filter_period(base, year, month)
+                totals = old.aggregate(total=Sum('amount'), n=Count('id'))
+                check = new.aggregate(total=Sum('amount'), n=Count('id'))
+                # SQLite sums DECIMAL as REAL, so the last digits depend on row order
+                if totals['n'] != check['n'] or round(totals['total'] or 0, 2) != round(check['total'] or 0, 2):
+                    self.stderr.write(f"Mismatch for {label}: {totals} vs {check}")
+
+                # Same work as expense_log_view: the filter is applied per request, then aggregated
+                old_s = best_of(lambda: _extract_filter(base, year, month).aggregate(Sum('amount')), opts['repeat'])
+                new_s = best_of(lambda: filter_period(base, year, month).aggregate(Sum('amount')), opts['repeat'])
+                self.stdout.write(f"{label:<12} {totals['n']:>9,} {old_s * 1000:>11.1f} {new_s * 1000:>9.1f} "
+                                  f"{old_s / new_s:>7.1f}x")
+                if opts['plans']:
+                    self.stdout.write(f"  extract: {query_plan(old)}")
+                    self.stdout.write(f"  range:   {query_plan(new)}")
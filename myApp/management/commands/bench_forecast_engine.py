@@ -0,0 +1,149 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myApp.forecast_batch import CropTable, compute_forecast_columns, compute_forecasts_batch
+from myApp.models import Activity, Crop, compute_forecast_from_activity, season_factor_table, spacing_columns
+
+
+# In-memory crops shaped like seed_crops.py (no database needed)
+BENCH_CROPS = [
+    dict(id=1, name="Rice", ideal_seasons="Jun-Nov, Dec-Apr", seed_rate_min_kg=40, seed_rate_max_kg=60,
+         fert_sacks_min=4, fert_sacks_max=6, yield_t_min=4, yield_t_max=6, days_to_harvest_min=110, days_to_harvest_max=130),
+    dict(id=2, name="Corn", ideal_seasons="Jan-Dec", seed_rate_min_kg=15, seed_rate_max_kg=20,
+         fert_sacks_min=4, fert_sacks_max=6, yield_t_min=4, yield_t_max=5, days_to_harvest_min=90, days_to_harvest_max=120),
+    dict(id=3, name="Mango", ideal_seasons="Dec-Apr", seed_rate_min_kg=0, seed_rate_max_kg=0,
+         fert_sacks_min=1, fert_sacks_max=2, yield_t_min=3, yield_t_max=5, days_to_harvest_min=120, days_to_harvest_max=150),
+    dict(id=4, name="Banana", ideal_seasons="Jan-Dec", seed_rate_min_kg=0, seed_rate_max_kg=0,
+         fert_sacks_min=10, fert_sacks_max=15, yield_t_min=20, yield_t_max=30, days_to_harvest_min=270, days_to_harvest_max=360),
+    dict(id=5, name="Guava", ideal_seasons="Jan-Dec", seed_rate_min_kg=0, seed_rate_max_kg=0,
+         fert_sacks_min=4, fert_sacks_max=8, yield_t_min=10, yield_t_max=15, days_to_harvest_min=540, days_to_harvest_max=720),
+    dict(id=6, name="Eggplant", ideal_seasons="Oct-Feb", seed_rate_min_kg=0.2, seed_rate_max_kg=0.3,
+         fert_sacks_min=6, fert_sacks_max=8, yield_t_min=15, yield_t_max=25, days_to_harvest_min=60, days_to_harvest_max=90),
+    dict(id=7, name="Ampalaya", ideal_seasons="", yield_t_min=0, yield_t_max=0),  # no baselines
+]
+
+SPACINGS = [None, "", "20x20 cm", "75x25", "10x10 m", "5 x 5 m", "3x3 m", "2.5X2.5 m", "bad", "0x10 m"]
+
+
+def _bench_crops(precompiled=True):
+    """Unsaved crops; `precompiled` fills season_factors the way Crop.save() would."""
+    crops = [Crop(**c) for c in BENCH_CROPS]
+    if precompiled:
+        for c in crops:
+            c.season_factors = season_factor_table(c.ideal_seasons)
+    return crops
+
+
+def _synthetic_rows(n, seed=7, precompiled=True):
+    """Deterministic planting tuples in PLANTING_FIELDS order."""
+    rng = random.Random(seed)
+    start = date(2023, 1, 1)
+    crop_ids = [c["id"] for c in BENCH_CROPS]
+    trees = {sp: spacing_columns(sp)[2] for sp in SPACINGS}
+    rows = []
+    for i in range(n):
+        spacing = rng.choice(SPACINGS)
+        rows.append((
+            i + 1,
+            rng.randint(1, max(n // 200, 1)),
+            rng.choice(crop_ids),
+            start + timedelta(days=rng.randint(0, 730)),
+            rng.choice([None, 0.0, round(rng.uniform(0.1, 8), 2)]),
+            rng.choice([None, round(rng.uniform(0, 120), 1)]),
+            rng.choice([None, round(rng.uniform(0, 30), 1)]),
+            spacing,
+            trees[spacing] if precompiled else None,
+        ))
+    return rows
+
+
+def _as_activities(rows, crops_by_id):
+    return [
+        Activity(id=r[0], farmer_id=r[1], crop=crops_by_id[r[2]], date=r[3],
+                 area_ha=r[4], seed_qty_kg=r[5], fert_sacks=r[6], spacing=r[7], trees_per_ha=r[8])
+        for r in rows
+    ]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the scalar forecast calculator against the batch engine."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--chunk-size', type=int, default=50_000,
+                            help="Scalar inputs are materialised this many at a time to cap memory.")
+        parser.add_argument('--no-verify', action='store_true', help="Skip the output equality check.")
+        parser.add_argument('--compare-precompiled', action='store_true',
+                            help="Instead: per-forecast cost of the scalar path with parsing vs precompiled columns.")
+
+    def handle(self, *args, **opts):
+        if opts['compare_precompiled']:
+            return self._compare_precompiled(opts)
+
+        crops = _bench_crops()
+        crops_by_id = {c.id: c for c in crops}
+        crop_table = CropTable.from_instances(crops)
+        chunk_size = max(opts['chunk_size'], 1)
+
+        # "kernel" is the vectorised numeric pass alone; "batch" adds building the
+        # per-row dicts (notes text, harvest dates) that the scalar function returns.
+        self.stdout.write(f"{'rows':>10} {'scalar s':>10} {'kernel s':>10} {'batch s':>10} {'speedup':>8}")
+        for n in opts['sizes']:
+            rows = _synthetic_rows(n, seed=opts['seed'])
+
+            scalar_s = kernel_s = batch_s = 0.0
+            for lo in range(0, n, chunk_size):
+                part = rows[lo:lo + chunk_size]
+                activities = _as_activities(part, crops_by_id)
+
+                t0 = time.perf_counter()
+                scalar = [compute_forecast_from_activity(a) for a in activities]
+                scalar_s += time.perf_counter() - t0
+
+                t0 = time.perf_counter()
+                compute_forecast_columns(part, crop_table)
+                kernel_s += time.perf_counter() - t0
+
+                t0 = time.perf_counter()
+                batch = compute_forecasts_batch(part, crop_table)
+                batch_s += time.perf_counter() - t0
+
+                if not opts['no_verify'] and scalar != batch:
+                    bad = next(i for i, (a, b) in enumerate(zip(scalar, batch)) if a != b)
+                    raise CommandError(f"Mismatch on row {part[bad]}:\n scalar={scalar[bad]}\n batch={batch[bad]}")
+                del activities, scalar, batch
+
+            speedup = scalar_s / batch_s if batch_s else float('inf')
+            self.stdout.write(f"{n:>10} {scalar_s:>10.3f} {kernel_s:>10.3f} {batch_s:>10.3f} {speedup:>7.1f}x")
+
+    def _compare_precompiled(self, opts):
+        """Scalar cost per forecast when seasons/spacing are re-parsed vs read from stored columns."""
+        chunk_size = max(opts['chunk_size'], 1)
+        self.stdout.write(f"{'rows':>10} {'parse µs':>10} {'precomp µs':>11} {'speedup':>8}")
+        for n in opts['sizes']:
+            timings = {}
+            outputs = {}
+            for precompiled in (False, True):
+                crops_by_id = {c.id: c for c in _bench_crops(precompiled)}
+                rows = _synthetic_rows(n, seed=opts['seed'], precompiled=precompiled)
+                elapsed = 0.0
+                first = None
+                for lo in range(0, n, chunk_size):
+                    activities = _as_activities(rows[lo:lo + chunk_size], crops_by_id)
+                    t0 = time.perf_counter()
+                    out = [compute_forecast_from_activity(a) for a in activities]
+                    elapsed += time.perf_counter() - t0
+                    if first is None:
+                        first = out
+                timings[precompiled] = elapsed
+                outputs[precompiled] = first
+
+            if not opts['no_verify'] and outputs[False] != outputs[True]:
+                raise CommandError("Precompiled columns changed forecast output.")
+            parse_us = timings[False] / n * 1e6
+            pre_us = timings[True] / n * 1e6
+            self.stdout.write(f"{n:>10} {parse_us:>10.2f} {pre_us:>11.2f} {parse_us / pre_us:>7.1f}x")
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myApp.forecast_batch import CropTable, compute_forecasts_batch
+from myApp.forecast_montecarlo import add_percentiles
+
+from .bench_forecast_engine import _bench_crops, _synthetic_rows
+
+
+class Command(BaseCommand):
+    help = ("Time Monte Carlo percentiles for N plantings × S samples and fail if over budget. "
+            "NumPy element-wise work runs on one core, so this measures single-core throughput.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plantings', type=int, default=10_000)
+        parser.add_argument('--samples', type=int, default=1_000)
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--budget', type=float, default=2.0, help="Seconds allowed for the sampling pass.")
+        parser.add_argument('--repeat', type=int, default=3, help="Best of this many runs is reported.")
+
+    def handle(self, *args, **opts):
+        crop_table = CropTable.from_instances(_bench_crops())
+        rows = _synthetic_rows(opts['plantings'], seed=opts['seed'])
+        base = compute_forecasts_batch(rows, crop_table)
+
+        best = float('inf')
+        for _ in range(max(opts['repeat'], 1)):
+            results = [dict(r) for r in base]
+            t0 = time.perf_counter()
+            add_percentiles(rows, results, crop_table, samples=opts['samples'], seed=opts['seed'])
+            best = min(best, time.perf_counter() - t0)
+
+        # Same seed → same percentiles, whether a planting is sampled alone or in the batch
+        alone = [dict(base[0])]
+        add_percentiles(rows[:1], alone, crop_table, samples=opts['samples'], seed=opts['seed'])
+        if alone[0] != results[0]:
+            raise CommandError("Percentiles depend on batch composition; sampling is not reproducible.")
+
+        cells = opts['plantings'] * opts['samples']
+        self.stdout.write(
+            f"{opts['plantings']} plantings × {opts['samples']} samples: {best:.3f}s "
+            f"({cells / best / 1e6:.1f}M samples/s, budget {opts['budget']:.1f}s)"
+        )
+        if best > opts['budget']:
+            raise CommandError(f"Monte Carlo pass took {best:.3f}s, over the {opts['budget']:.1f}s budget.")
+        self.stdout.write(self.style.SUCCESS("✅ Within budget."))
@@ -0,0 +1,85 @@
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from myApp.reports import activity_report, expense_pdf_rows, expense_report, pdf_response
+
+WORDS = "urea applied north paddy rows weeding irrigation canal hybrid seedlings labor hauling sacks".split()
+
+
+def _synthetic_activities(n, seed=7):
+    rng = random.Random(seed)
+    start = date(2023, 1, 1)
+    for _ in range(n):
+        planting = rng.random() < 0.3
+        yield (
+            start + timedelta(days=rng.randint(0, 730)),
+            rng.choice(["Rice", "Corn", "Mango", "Banana", "Eggplant"]),
+            'planting' if planting else rng.choice(['weeding', 'fertilizing', 'irrigation', 'harvest']),
+            ' '.join(rng.choices(WORDS, k=rng.choice([0, 4, 12, 40]))),
+            round(rng.uniform(0.1, 8), 2) if planting else '',
+            round(rng.uniform(0, 120), 1) if planting else '',
+            round(rng.uniform(0, 30), 1) if planting else '',
+            rng.choice(["20x20 cm", "75x25", "10x10 m"]) if planting else '',
+        )
+
+
+def _synthetic_expenses(n, seed=7):
+    rng = random.Random(seed)
+    start = date(2023, 1, 1)
+    for _ in range(n):
+        yield (
+            start + timedelta(days=rng.randint(0, 730)),
+            rng.choice(["Seed", "Fertilizer", "Labor", "Equipment", "Others"]),
+            ' '.join(rng.choices(WORDS, k=rng.choice([0, 3, 10]))),
+            Decimal(rng.randint(100, 500_000)) / 100,
+        )
+
+
+class Command(BaseCommand):
+    help = ("Render synthetic activity and expense PDFs through the export path and report "
+            "pages/second and peak Python memory (tracemalloc, measured on a separate run).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--no-memory', action='store_true', help="Skip the traced run (timing only).")
+
+    def _render(self, report, rows):
+        """(pages, PDF bytes) for one render through pdf_response()."""
+        seen = [0]
+        response = pdf_response(report, rows, 'bench.pdf', progress=lambda done, pages: seen.__setitem__(0, pages))
+        size = sum(len(chunk) for chunk in response.streaming_content)
+        response.close()
+        return seen[0], size
+
+    def handle(self, *args, **opts):
+        cases = [
+            ("activities", activity_report, _synthetic_activities),
+            ("expenses", expense_report, lambda n, seed: expense_pdf_rows(_synthetic_expenses(n, seed))),
+        ]
+        for n in opts['rows']:
+            for name, report, source in cases:
+                t0 = time.perf_counter()
+                pages, size = self._render(report(), source(n, opts['seed']))
+                elapsed = time.perf_counter() - t0
+
+                mem = ""
+                if not opts['no_memory']:
+                    tracemalloc.start()
+                    try:
+                        self._render(report(), source(n, opts['seed']))
+                        _, peak = tracemalloc.get_traced_memory()
+                    finally:
+                        tracemalloc.stop()
+                    mem = f", peak {peak / 1e6:.1f} MB"
+
+                self.stdout.write(
+                    f"{name:<10} {n:>7} rows: {pages} pages in {elapsed:.2f}s "
+                    f"({pages / elapsed:.0f} pages/s, {size / 1e6:.1f} MB PDF{mem})"
+                )
+        self.stdout.write(self.style.SUCCESS("✅ Done."))
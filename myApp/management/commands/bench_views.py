@@ -0,0 +1,248 @@
+import json
+import platform
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import date
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from myApp.bench import (create_crops, create_farmers, insert_activities, insert_expenses, insert_reminders,
+                         scratch_database)
+from myApp.export_jobs import render_export_job, start_export_job
+from myApp.models import Activity, Reminder, User
+
+HX = {'HX-Request': 'true'}
+
+
+def _cases(ctx):
+    """
+    (label, method, path, data, headers) for every route in myApp/urls.py, as the
+    first bench farmer. `data` may be a callable for POSTs that consume a row.
+    """
+    today = timezone.now().date()
+    planting, job = ctx['planting'], ctx['job']
+    expenses = {'month': 6, 'year': 2023}
+    activities = {'start': '2023-01-01', 'end': '2023-12-31'}
+    return [
+        ('login', 'get', reverse('login'), None, {}),
+        ('logout', 'get', reverse('logout'), None, {}),
+        ('register', 'get', reverse('register'), None, {}),
+        ('home', 'get', reverse('home'), None, {}),
+        ('farmer_dashboard', 'get', reverse('farmer_dashboard'), None, {}),
+        ('flash_messages', 'get', reverse('flash_messages'), None, HX),
+        ('password_reset', 'get', reverse('password_reset'), None, {}),
+        ('password_reset_done', 'get', reverse('password_reset_done'), None, {}),
+        ('password_reset_confirm', 'get', reverse('password_reset_confirm', kwargs=ctx['reset']), None, {}),
+        ('password_reset_complete', 'get', reverse('password_reset_complete'), None, {}),
+
+        ('add_reminder', 'post', reverse('add_reminder'),
+         {'message': 'Bench reminder', 'due_date': today.isoformat()}, HX),
+        ('edit_reminder', 'post', reverse('edit_reminder'),
+         {'reminder_id': ctx['reminders'][0], 'message': 'Edited', 'due_date': today.isoformat()}, HX),
+        ('delete_reminder', 'post', reverse('delete_reminder'),
+         lambda: {'reminder_id': ctx['reminders'].pop()}, HX),
+        ('refresh_reminders', 'get', reverse('refresh_reminders'), None, HX),
+
+        ('activity_log', 'get', reverse('activity_log'), None, {}),
+        ('activity_log filtered', 'get', reverse('activity_log'),
+         {'start_date': activities['start'], 'end_date': activities['end']}, {}),
+        ('activity_log records (htmx)', 'get', reverse('activity_log'), None,
+         {**HX, 'HX-Target': 'activity-records'}),
+        ('activity_log add', 'post', reverse('activity_log'),
+         {'add_activity': '1', 'crop': planting.crop_id, 'activity_type': 'watering',
+          'date': today.isoformat(), 'notes': ''}, {}),
+        ('planting_detail', 'get', reverse('planting_detail', kwargs={'pk': planting.pk}), None, {}),
+        ('forecast_scenarios', 'get', reverse('forecast_scenarios'),
+         {'planting': planting.pk, 'area': '0.5:5:20', 'fert': '0:10:11'}, {}),
+
+        ('expense_log', 'get', reverse('expense_log'), None, {}),
+        ('expense_log filtered', 'get', reverse('expense_log'), expenses, {}),
+        ('expense_log results (htmx)', 'get', reverse('expense_log'), expenses,
+         {**HX, 'HX-Target': 'expense-results'}),
+        ('expense_log add', 'post', reverse('expense_log'),
+         {'add_expense': '1', 'expense_type': 'labor', 'amount': '250.00',
+          'date': today.isoformat(), 'description': ''}, {}),
+        ('expense_chart_data', 'get', reverse('expense_chart_data'), {'year': 2023}, {}),
+        ('export_expenses_csv', 'get', reverse('export_expenses_csv'), expenses, {}),
+        ('export_expenses_pdf', 'get', reverse('export_expenses_pdf'), expenses, {}),
+
+        ('chart_expenses_monthly', 'get', reverse('chart_expenses_monthly'), {'year': 2023}, {}),
+        ('chart_expenses_by_category', 'get', reverse('chart_expenses_by_category'), expenses, {}),
+        ('chart_yield_by_crop', 'get', reverse('chart_yield_by_crop'), None, {}),
+        ('chart_harvest_timeline', 'get', reverse('chart_harvest_timeline'), None, {}),
+        ('chart_bundle dashboard', 'get', reverse('chart_bundle'), {'page': 'dashboard'}, {}),
+        ('chart_bundle activity_log', 'get', reverse('chart_bundle'), {'page': 'activity_log', **activities}, {}),
+        ('chart_bundle expense_log', 'get', reverse('chart_bundle'), {'page': 'expense_log', **expenses}, {}),
+        ('chart_activities_monthly', 'get', reverse('chart_activities_monthly'), None, {}),
+        ('chart_activities_by_type', 'get', reverse('chart_activities_by_type'), None, {}),
+        ('chart_activities_by_crop', 'get', reverse('chart_activities_by_crop'), None, {}),
+
+        ('export_activities_csv', 'get', reverse('export_activities_csv'), activities, {}),
+        ('export_activities_pdf', 'get', reverse('export_activities_pdf'), activities, {}),
+        ('start_export', 'post', reverse('start_export'), {'export': 'activities.pdf', **activities}, HX),
+        ('export_job_status', 'get', reverse('export_job_status', kwargs={'pk': job.pk}), None, HX),
+        ('export_job_download', 'get', reverse('export_job_download', kwargs={'pk': job.pk}), None, {}),
+    ]
+
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+class Command(BaseCommand):
+    help = ("Generate a deterministic dataset on a scratch database and time every URL in myApp/urls.py "
+            "through the test client (p50/p95, queries, bytes), writing the results to JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--farmers', type=int, default=10_000)
+        parser.add_argument('--crops', type=int, default=20)
+        parser.add_argument('--activities', type=int, default=2_000_000)
+        parser.add_argument('--expenses', type=int, default=5_000_000)
+        parser.add_argument('--reminders', type=int, default=5, help="Reminders per farmer.")
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--requests', type=int, default=20, help="Timed requests per URL, after a cold one.")
+        parser.add_argument('--only', action='append', help="Only cases whose label contains this (repeatable).")
+        parser.add_argument('--output', help="JSON file to write (default: bench_views-<timestamp>.json).")
+        parser.add_argument('--compare', help="Earlier results JSON to print p50 changes against.")
+
+    def handle(self, *args, **opts):
+        export_dir = tempfile.TemporaryDirectory()
+        # DEBUG off so timings don't include query logging; queries are counted separately
+        with export_dir, override_settings(DEBUG=False, EXPORT_CACHE_DIR=export_dir.name,
+                                           ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), \
+                scratch_database('default'):
+            started = time.perf_counter()
+            ctx = self._generate(opts)
+            generated_s = time.perf_counter() - started
+            self.stdout.write(f"Dataset ready in {generated_s:.1f}s.")
+            results = self._run(ctx, opts)
+
+        report = {
+            'created': timezone.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'dataset': {k: opts[k] for k in ('farmers', 'crops', 'activities', 'expenses', 'reminders', 'seed')},
+            'generate_s': round(generated_s, 2),
+            'requests': opts['requests'],
+            'results': results,
+        }
+        output = opts['output'] or f"bench_views-{timezone.now():%Y%m%d-%H%M%S}.json"
+        with open(output, 'w') as fh:
+            json.dump(report, fh, indent=2)
+        if opts['compare']:
+            self._compare(opts['compare'], results)
+        self.stdout.write(self.style.SUCCESS(f"✅ Timed {len(results)} URLs; results written to {output}."))
+
+    def _generate(self, opts):
+        self.stdout.write(f"Generating {opts['farmers']:,} farmers, {opts['activities']:,} activities, "
+                          f"{opts['expenses']:,} expenses...")
+        seed = opts['seed']
+        farmer_ids = create_farmers('default', max(opts['farmers'], 1))
+        crop_ids = create_crops('default', max(opts['crops'], 1), seed=seed)
+        steps = [
+            ('activities', lambda: insert_activities('default', farmer_ids, crop_ids, opts['activities'], seed=seed)),
+            ('expenses', lambda: insert_expenses('default', farmer_ids, opts['expenses'], seed=seed)),
+            ('reminders', lambda: insert_reminders('default', farmer_ids, opts['reminders'], seed=seed)),
+            # Derived tables the signals would have kept current
+            ('expense rollups', lambda: call_command('rebuild_expense_rollups', stdout=StringIO())),
+            ('forecasts', lambda: call_command('recompute_forecasts', stdout=StringIO())),
+        ]
+        for label, step in steps:
+            t0 = time.perf_counter()
+            step()
+            self.stdout.write(f"  … {label} in {time.perf_counter() - t0:.1f}s")
+
+        farmer = User.objects.get(pk=farmer_ids[0])
+        farmer.set_password('bench')
+        farmer.save(update_fields=['password'])
+        planting = (Activity.objects.filter(farmer=farmer, activity_type='planting').order_by('-date', '-id').first()
+                    or Activity.objects.create(farmer=farmer, crop_id=crop_ids[0], activity_type='planting',
+                                               date=date(2023, 3, 1), area_ha=1.0))
+        job = start_export_job(farmer, 'expenses.csv', {'month': 6, 'year': 2023})
+        render_export_job(job.pk)
+        # Enough reminders for every timed delete
+        reminders = Reminder.objects.bulk_create(
+            [Reminder(farmer=farmer, message='Bench delete', due_date=timezone.now().date())
+             for _ in range(opts['requests'] + 2)])
+        return {
+            'farmer': farmer, 'planting': planting, 'job': job,
+            'reminders': [r.pk for r in reminders],
+            'reset': {'uidb64': urlsafe_base64_encode(force_bytes(farmer.pk)),
+                      'token': default_token_generator.make_token(farmer)},
+        }
+
+    def _run(self, ctx, opts):
+        client = Client()
+        client.force_login(ctx['farmer'])
+        cases = [c for c in _cases(ctx) if not opts['only'] or any(o in c[0] for o in opts['only'])]
+
+        def request(method, path, data, headers):
+            response = getattr(client, method)(path, data() if callable(data) else data, headers=headers)
+            body = (b''.join(response.streaming_content) if response.streaming else response.content)
+            return response, len(body)
+
+        self.stdout.write(f"{'url':<30} {'status':>6} {'cold ms':>8} {'p50 ms':>7} {'p95 ms':>7} "
+                          f"{'queries':>7} {'bytes':>9}")
+        results = []
+        for label, method, path, data, headers in cases:
+            t0 = time.perf_counter()
+            request(method, path, data, headers)
+            cold_ms = (time.perf_counter() - t0) * 1000
+
+            timings = []
+            for _ in range(max(opts['requests'], 1)):
+                t0 = time.perf_counter()
+                response, size = request(method, path, data, headers)
+                timings.append((time.perf_counter() - t0) * 1000)
+            with CaptureQueriesContext(connection) as queries:
+                request(method, path, data, headers)
+
+            row = {
+                'label': label, 'method': method.upper(), 'path': path, 'status': response.status_code,
+                'cold_ms': round(cold_ms, 2),
+                'p50_ms': round(_percentile(timings, 50), 2),
+                'p95_ms': round(_percentile(timings, 95), 2),
+                'queries': len(queries), 'bytes': size,
+            }
+            results.append(row)
+            self.stdout.write(f"{label:<30} {row['status']:>6} {row['cold_ms']:>8.1f} {row['p50_ms']:>7.1f} "
+                              f"{row['p95_ms']:>7.1f} {row['queries']:>7} {row['bytes']:>9,}")
+        return results
+
+    def _compare(self, path, results):
+        with open(path) as fh:
+            before = {r['label']: r for r in json.load(fh)['results']}
+        self.stdout.write(f"\nCompared with {path}:")
+        for row in results:
+            old = before.get(row['label'])
+            if not old:
+                continue
+            ratio = row['p50_ms'] / old['p50_ms'] if old['p50_ms'] else float('inf')
+            self.stdout.write(f"  {row['label']:<30} p50 {old['p50_ms']:>7.1f} → {row['p50_ms']:>7.1f} ms "
+                              f"({ratio:.2f}x), queries {old['queries']} → {row['queries']}")
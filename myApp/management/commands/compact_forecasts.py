@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from myApp.forecast_history import compact_farmers, farmer_id_chunks
+
+
+class Command(BaseCommand):
+    help = ("Collapse runs of unchanged forecasts into one row with a validity range and keep one "
+            "snapshot per week for old forecasts, a chunk of farmers per short write transaction.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--farmer', type=int, action='append', dest='farmers',
+                            help="Only this farmer id (repeatable).")
+        parser.add_argument('--chunk-size', type=int, default=200, help="Farmers per write transaction.")
+        parser.add_argument('--weekly-after-days', type=int,
+                            help="Thin forecasts older than this to one per week "
+                                 "(default: settings.FORECAST_WEEKLY_AFTER_DAYS).")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between chunks, to leave room for other writers.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without writing.")
+
+    def handle(self, *args, **opts):
+        weekly_after_days = opts['weekly_after_days']
+        if weekly_after_days is None:
+            weekly_after_days = settings.FORECAST_WEEKLY_AFTER_DAYS
+        started = time.monotonic()
+
+        farmers = scanned = deleted = stretched = 0
+        for chunk in farmer_id_chunks(max(opts['chunk_size'], 1), opts['farmers']):
+            result = compact_farmers(chunk, weekly_after_days=weekly_after_days, dry_run=opts['dry_run'])
+            farmers += len(chunk)
+            scanned += result.scanned
+            deleted += result.deleted
+            stretched += result.stretched
+            self.stdout.write(f"  … {farmers} farmers, {deleted}/{scanned} forecasts removed")
+            if opts['pause']:
+                time.sleep(opts['pause'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Compacted {scanned} forecasts of {farmers} farmers in {time.monotonic() - started:.1f}s "
+            f"(removed {deleted}, re-dated {stretched}{', dry run' if opts['dry_run'] else ''})."
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from myApp.models import User, rebuild_dashboard_summary
+
+
+class Command(BaseCommand):
+    help = "Recompute DashboardSummary rows from scratch (repairs after bulk imports or raw SQL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--farmer', type=int, action='append', dest='farmers',
+                            help="Only this farmer id (repeatable).")
+
+    def handle(self, *args, **opts):
+        farmers = User.objects.filter(role='farmer')
+        if opts['farmers']:
+            farmers = farmers.filter(id__in=opts['farmers'])
+
+        count = 0
+        for farmer_id in farmers.values_list('id', flat=True).iterator():
+            rebuild_dashboard_summary(farmer_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt {count} dashboard summaries."))
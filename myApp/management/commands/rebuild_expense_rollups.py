@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from myApp.models import rebuild_expense_rollups
+
+
+class Command(BaseCommand):
+    help = "Recreate ExpenseRollup rows from the raw expenses (after bulk imports or raw SQL edits)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--farmer', type=int, action='append', dest='farmers',
+                            help="Only this farmer id (repeatable).")
+
+    def handle(self, *args, **opts):
+        buckets = rebuild_expense_rollups(opts['farmers'])
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt {buckets} expense rollup buckets."))
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myApp.forecast_batch import CropTable, compute_forecasts_batch, latest_planting_rows, write_forecasts
+from myApp.forecast_montecarlo import add_percentiles
+from myApp.models import Activity
+
+
+class Command(BaseCommand):
+    help = "Recompute today's forecast for every farmer/crop from their latest planting, in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--crop', type=int, action='append', dest='crops',
+                            help="Only plantings of this crop id (repeatable).")
+        parser.add_argument('--farmer', type=int, action='append', dest='farmers',
+                            help="Only plantings of this farmer id (repeatable).")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help="Compute but don't write.")
+        parser.add_argument('--monte-carlo', action='store_true',
+                            help="Also store P10/P50/P90 (default: settings.FORECAST_MONTE_CARLO).")
+        parser.add_argument('--samples', type=int, help="Monte Carlo samples per planting.")
+        parser.add_argument('--seed', type=int, help="Monte Carlo seed.")
+
+    def handle(self, *args, **opts):
+        qs = Activity.objects.all()
+        if opts['crops']:
+            qs = qs.filter(crop_id__in=opts['crops'])
+        if opts['farmers']:
+            qs = qs.filter(farmer_id__in=opts['farmers'])
+
+        crop_table = CropTable.from_queryset()
+        chunk_size = max(opts['chunk_size'], 1)
+        today = timezone.now().date()
+        started = timezone.now()
+        monte_carlo = opts['monte_carlo'] or settings.FORECAST_MONTE_CARLO
+
+        created = updated = total = 0
+        chunk = []
+
+        def flush():
+            nonlocal created, updated, total
+            results = compute_forecasts_batch(chunk, crop_table)
+            if monte_carlo:
+                add_percentiles(chunk, results, crop_table, samples=opts['samples'], seed=opts['seed'])
+            if not opts['dry_run']:
+                c, u = write_forecasts(chunk, results, forecast_date=today)
+                created += c
+                updated += u
+            total += len(chunk)
+            self.stdout.write(f"  … {total} forecasts computed")
+            chunk.clear()
+
+        for row in latest_planting_rows(qs):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Recomputed {total} forecasts in {elapsed:.1f}s "
+            f"(created {created}, updated {updated}{', dry run' if opts['dry_run'] else ''})."
+        ))
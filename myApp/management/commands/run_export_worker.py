@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connections
+
+from myApp.export_jobs import claim_export_jobs, cleanup_export_jobs, init_process, render_export_job
+from myApp.forecast_queue import worker_name
+
+
+class Command(BaseCommand):
+    help = "Render background CSV/PDF export jobs, several at once in a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2,
+                            help="Jobs rendered in parallel (0 = render in this process, one at a time).")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--cleanup-every', type=float, default=600,
+                            help="Seconds between removals of expired jobs and files.")
+        parser.add_argument('--once', action='store_true', help="Render what is queued and exit.")
+
+    def handle(self, *args, **opts):
+        worker = worker_name()
+        processes = max(opts['processes'], 0)
+        self.stdout.write(f"Export worker {worker} started ({processes or 'no'} pool processes).")
+
+        pool = None
+        if processes:
+            connections.close_all()  # forked children must not share the parent's connection
+            pool = ProcessPoolExecutor(max_workers=processes, initializer=init_process)
+
+        running = {}
+        next_cleanup = 0.0
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    if time.monotonic() >= next_cleanup:
+                        removed = cleanup_export_jobs()
+                        if removed:
+                            self.stdout.write(f"  removed {removed} expired export jobs")
+                        next_cleanup = time.monotonic() + opts['cleanup_every']
+                    slots = processes - len(running) if pool else 1
+                    claimed = claim_export_jobs(worker, limit=slots) if slots > 0 else []
+                except OperationalError as exc:
+                    self.stderr.write(f"Database busy ({exc}); retrying.")
+                    claimed = []
+
+                for job_id in claimed:
+                    if pool:
+                        running[pool.submit(render_export_job, job_id)] = job_id
+                    else:
+                        self._report(job_id, render_export_job(job_id))
+
+                if running:
+                    done, _ = wait(running, timeout=opts['sleep'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._report(running.pop(future), future.exception() is None and future.result())
+                    continue
+                if claimed:
+                    continue
+                if opts['once']:
+                    break
+                time.sleep(opts['sleep'])
+        finally:
+            if pool:
+                pool.shutdown(wait=True)
+        self.stdout.write(self.style.SUCCESS("✅ Queue drained."))
+
+    def _report(self, job_id, ok):
+        self.stdout.write(f"  export {job_id} {'done' if ok else 'failed'}")
@@ -0,0 +1,45 @@
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from myApp.forecast_queue import _is_lock_error, process_batch, process_recompute_chunk, worker_name
+
+
+class Command(BaseCommand):
+    help = "Process queued forecast jobs (planting saves) and crop baseline recomputes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--recompute-chunk', type=int, default=500,
+                            help="Farmers refreshed per step of a crop baseline recompute.")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+
+    def handle(self, *args, **opts):
+        worker = worker_name()
+        self.stdout.write(f"Forecast worker {worker} started.")
+        while True:
+            close_old_connections()
+            try:
+                claimed, written = process_batch(worker, limit=opts['batch_size'])
+                # Planting jobs first; baseline recomputes advance one chunk per loop in between
+                recomputing = process_recompute_chunk(chunk_size=opts['recompute_chunk'])
+            except Exception as exc:
+                # Failing jobs are marked failed by run_jobs and lock errors rescheduled;
+                # anything left (a failed recompute, say) must not take the worker down
+                if _is_lock_error(exc):
+                    self.stderr.write(f"Database busy ({exc}); retrying.")
+                else:
+                    self.stderr.write(f"Forecast worker step failed; retrying.\n{traceback.format_exc()}")
+                claimed, written, recomputing = 0, 0, False
+
+            if claimed:
+                self.stdout.write(f"  claimed {claimed} jobs → {written} forecasts")
+            if claimed or recomputing:
+                continue
+            if opts['once']:
+                break
+            time.sleep(opts['sleep'])
+        self.stdout.write(self.style.SUCCESS("✅ Queue drained."))
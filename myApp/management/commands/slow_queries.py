@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myApp import slow_queries
+
+
+class Command(BaseCommand):
+    help = "Print the slowest query fingerprints by total time, with their worst run's view, params and plan."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--hours', type=float, help="Only fingerprints seen in the last N hours.")
+        parser.add_argument('--plans', action='store_true', help="Also print the SQL, params and query plan.")
+        parser.add_argument('--reset', action='store_true', help="Forget everything recorded so far.")
+
+    def handle(self, *args, **opts):
+        if opts['reset']:
+            slow_queries.reset()
+            self.stdout.write(self.style.SUCCESS("✅ Slow-query log cleared."))
+            return
+
+        since = time.time() - opts['hours'] * 3600 if opts['hours'] else None
+        rows = slow_queries.top_offenders(opts['limit'], since)
+        if not rows:
+            self.stdout.write("No slow queries recorded.")
+            return
+
+        self.stdout.write(f"{'total ms':>10} {'count':>6} {'avg ms':>8} {'max ms':>8}  {'view':<24} query")
+        for row in rows:
+            self.stdout.write(f"{row['total_ms']:>10.1f} {row['count']:>6} {row['total_ms'] / row['count']:>8.1f} "
+                              f"{row['max_ms']:>8.1f}  {row['view']:<24} {row['normalized'][:120]}")
+            if opts['plans']:
+                self.stdout.write(f"    fingerprint {row['fingerprint']}")
+                self.stdout.write(f"    sql:    {row['sql']}")
+                self.stdout.write(f"    params: {row['params']}")
+                for line in (row['plan'] or '(no plan: not a SELECT)').splitlines():
+                    self.stdout.write(f"    plan:   {line}")
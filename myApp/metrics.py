@@ -0,0 +1,305 @@
+"""
+Per-view request metrics.
+
+RequestMetricsMiddleware (middleware.py) records, for every resolved view
+name, the wall time, DB query count and DB time, response bytes and status
+into in-process histograms. Every METRICS_FLUSH_SECONDS a request hands the
+process's histograms to a small SQLite file (METRICS_DB, separate from the app
+database so flushing never waits on its write lock) and starts afresh; readers
+merge the flushed rows of every worker process. The admin page
+(`metrics_dashboard`) reads those rows for its 1h/24h/7d windows; they are
+pruned after METRICS_RETENTION_DAYS. Each flush also folds the same stats
+into one running total per view that is never pruned, and the Prometheus
+text endpoint (`metrics_prometheus`) serves those, so its counters and
+histogram buckets only ever go up.
+
+Histograms are log-linear in the spirit of HdrHistogram: integer values
+(microseconds, bytes, queries) are bucketed by power of two, each power split
+into 32 linear slots, so a value is reproduced within ~3% and a histogram is a
+few hundred counters whatever the range.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+SUB_BITS = 5                 # 2**5 = 32 linear slots per power of two
+SUB_BUCKETS = 1 << SUB_BITS
+
+# Prometheus `le` bounds, in seconds / bytes
+DURATION_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BOUNDS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+class Histogram:
+    """Counts of integer values in log-linear buckets; see the module docstring."""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def bucket(value):
+        if value < 2 * SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - SUB_BITS - 1
+        return ((shift + 1) << SUB_BITS) + (value >> shift) - SUB_BUCKETS
+
+    @staticmethod
+    def bucket_range(index):
+        """(lowest, highest) value that lands in bucket `index`."""
+        if index < 2 * SUB_BUCKETS:
+            return index, index
+        shift = (index >> SUB_BITS) - 1
+        low = ((index & (SUB_BUCKETS - 1)) + SUB_BUCKETS) << shift
+        return low, low + (1 << shift) - 1
+
+    def record(self, value):
+        value = max(int(value), 0)
+        index = self.bucket(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, n in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, pct):
+        """Highest value equivalent to the pct-th percentile (0 when empty)."""
+        if not self.count:
+            return 0
+        rank = max(1, round(pct / 100 * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.bucket_range(index)[1], self.max)
+        return self.max
+
+    def count_at_most(self, bound):
+        """Recorded values <= bound (bucket-accurate), for cumulative Prometheus buckets."""
+        return sum(n for index, n in self.counts.items() if self.bucket_range(index)[1] <= bound)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def to_dict(self):
+        return {'counts': self.counts, 'count': self.count, 'total': self.total, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        hist = cls()
+        hist.counts = {int(k): v for k, v in data['counts'].items()}
+        hist.count, hist.total, hist.max = data['count'], data['total'], data['max']
+        return hist
+
+
+class ViewStats:
+    """Everything recorded for one view name."""
+
+    FIELDS = ('wall_us', 'db_us', 'queries', 'bytes')
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, Histogram())
+        self.statuses = Counter()
+
+    def merge(self, other):
+        for field in self.FIELDS:
+            getattr(self, field).merge(getattr(other, field))
+        self.statuses.update(other.statuses)
+
+    def to_dict(self):
+        return {**{f: getattr(self, f).to_dict() for f in self.FIELDS}, 'statuses': dict(self.statuses)}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for field in cls.FIELDS:
+            setattr(stats, field, Histogram.from_dict(data[field]))
+        stats.statuses = Counter({int(k): v for k, v in data['statuses'].items()})
+        return stats
+
+
+class MetricsRegistry:
+    """This process's unflushed ViewStats, keyed by view name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._last_flush = time.monotonic()
+
+    def record(self, view, wall_us, db_us, queries, status, size=None):
+        with self._lock:
+            stats = self._stats.get(view)
+            if stats is None:
+                stats = self._stats[view] = ViewStats()
+            stats.wall_us.record(wall_us)
+            stats.db_us.record(db_us)
+            stats.queries.record(queries)
+            stats.statuses[status] += 1
+            if size is not None:
+                stats.bytes.record(size)
+        if time.monotonic() - self._last_flush >= settings.METRICS_FLUSH_SECONDS:
+            self.flush()
+
+    def record_bytes(self, view, size):
+        """Bytes of a streamed response, known only once the stream is exhausted."""
+        with self._lock:
+            stats = self._stats.get(view)
+            if stats is None:
+                stats = self._stats[view] = ViewStats()
+            stats.bytes.record(size)
+
+    def flush(self):
+        with self._lock:
+            pending, self._stats = self._stats, {}
+            self._last_flush = time.monotonic()
+        if pending:
+            write_stats(pending)
+
+
+REGISTRY = MetricsRegistry()
+
+
+# ---------- SQLite sink ----------
+def _connect():
+    conn = sqlite3.connect(settings.METRICS_DB, timeout=5)
+    conn.execute('CREATE TABLE IF NOT EXISTS view_metrics ('
+                 'id INTEGER PRIMARY KEY, flushed_at REAL NOT NULL, pid INTEGER NOT NULL, '
+                 'view TEXT NOT NULL, data TEXT NOT NULL)')
+    conn.execute('CREATE INDEX IF NOT EXISTS view_metrics_flushed_at ON view_metrics (flushed_at)')
+    conn.execute('CREATE TABLE IF NOT EXISTS view_totals (view TEXT PRIMARY KEY, data TEXT NOT NULL)')
+    return conn
+
+
+def write_stats(stats_by_view):
+    """
+    Append one row per view, add the stats to each view's running total, and
+    drop rows older than METRICS_RETENTION_DAYS (totals are kept).
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')  # totals are read then rewritten; no other flush in between
+            conn.executemany('INSERT INTO view_metrics (flushed_at, pid, view, data) VALUES (?, ?, ?, ?)',
+                             [(now, os.getpid(), view, json.dumps(stats.to_dict()))
+                              for view, stats in stats_by_view.items()])
+            views = list(stats_by_view)
+            totals = dict(conn.execute('SELECT view, data FROM view_totals WHERE view IN ({})'
+                                       .format(', '.join('?' * len(views))), views))
+            for view, stats in stats_by_view.items():
+                total = ViewStats.from_dict(json.loads(totals[view])) if view in totals else ViewStats()
+                total.merge(stats)
+                conn.execute('INSERT INTO view_totals (view, data) VALUES (?, ?) '
+                             'ON CONFLICT (view) DO UPDATE SET data = excluded.data',
+                             (view, json.dumps(total.to_dict())))
+            conn.execute('DELETE FROM view_metrics WHERE flushed_at < ?',
+                         (now - settings.METRICS_RETENTION_DAYS * 86400,))
+    finally:
+        conn.close()
+
+
+def load_stats(since=None):
+    """ViewStats per view merged over every flushed row (newer than `since`, a Unix time)."""
+    REGISTRY.flush()
+    conn = _connect()
+    try:
+        rows = conn.execute('SELECT view, data FROM view_metrics WHERE flushed_at >= ?', (since or 0,))
+        merged = {}
+        for view, data in rows:
+            stats = ViewStats.from_dict(json.loads(data))
+            if view in merged:
+                merged[view].merge(stats)
+            else:
+                merged[view] = stats
+        return merged
+    finally:
+        conn.close()
+
+
+def load_totals():
+    """Running ViewStats per view since the sink was created (never pruned)."""
+    REGISTRY.flush()
+    conn = _connect()
+    try:
+        return {view: ViewStats.from_dict(json.loads(data))
+                for view, data in conn.execute('SELECT view, data FROM view_totals')}
+    finally:
+        conn.close()
+
+
+# ---------- Readers ----------
+def summary_rows(stats_by_view):
+    """One dict per view for the admin page, heaviest total wall time first."""
+    total_wall = sum(s.wall_us.total for s in stats_by_view.values()) or 1
+    rows = []
+    for view, s in stats_by_view.items():
+        rows.append({
+            'view': view,
+            'requests': s.wall_us.count,
+            'total_s': s.wall_us.total / 1e6,
+            'share': 100 * s.wall_us.total / total_wall,
+            'p50_ms': s.wall_us.percentile(50) / 1000,
+            'p95_ms': s.wall_us.percentile(95) / 1000,
+            'p99_ms': s.wall_us.percentile(99) / 1000,
+            'max_ms': s.wall_us.max / 1000,
+            'queries_mean': s.queries.mean,
+            'queries_max': s.queries.max,
+            'db_p95_ms': s.db_us.percentile(95) / 1000,
+            'db_share': 100 * s.db_us.total / (s.wall_us.total or 1),
+            'bytes_mean': s.bytes.mean,
+            'statuses': sorted(s.statuses.items()),
+        })
+    return sorted(rows, key=lambda r: -r['total_s'])
+
+
+def _label(view):
+    return view.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _histogram_lines(name, help_text, stats_by_view, field, bounds, scale):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for view, stats in sorted(stats_by_view.items()):
+        hist, label = getattr(stats, field), _label(view)
+        for bound in bounds:
+            lines.append(f'{name}_bucket{{view="{label}",le="{bound}"}} {hist.count_at_most(bound * scale)}')
+        lines.append(f'{name}_bucket{{view="{label}",le="+Inf"}} {hist.count}')
+        lines.append(f'{name}_sum{{view="{label}"}} {hist.total / scale:.6f}')
+        lines.append(f'{name}_count{{view="{label}"}} {hist.count}')
+    return lines
+
+
+def prometheus_text(stats_by_view):
+    """Prometheus text exposition (version 0.0.4) of the running totals from load_totals()."""
+    lines = _histogram_lines('agritrack_request_duration_seconds', 'Wall time per request, by view.',
+                             stats_by_view, 'wall_us', DURATION_BOUNDS, 1e6)
+    lines += _histogram_lines('agritrack_request_db_seconds', 'Time spent in SQL per request, by view.',
+                              stats_by_view, 'db_us', DURATION_BOUNDS, 1e6)
+    lines += _histogram_lines('agritrack_response_bytes', 'Response body size, by view.',
+                              stats_by_view, 'bytes', BYTES_BOUNDS, 1)
+    lines += ['# HELP agritrack_request_queries_total SQL statements run, by view.',
+              '# TYPE agritrack_request_queries_total counter']
+    lines += [f'agritrack_request_queries_total{{view="{_label(v)}"}} {s.queries.total}'
+              for v, s in sorted(stats_by_view.items())]
+    lines += ['# HELP agritrack_requests_total Requests, by view and status.',
+              '# TYPE agritrack_requests_total counter']
+    lines += [f'agritrack_requests_total{{view="{_label(v)}",status="{status}"}} {n}'
+              for v, s in sorted(stats_by_view.items()) for status, n in sorted(s.statuses.items())]
+    return '\n'.join(lines) + '\n'
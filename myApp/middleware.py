@@ -0,0 +1,155 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.urls import reverse
+
+from .metrics import REGISTRY
+from .profiling import RequestProfile, wants_profile
+from .slow_queries import SlowQueryLogger
+
+UNRESOLVED = '<unresolved>'  # 404s and anything else the URLconf didn't match
+
+
+class _QueryTimer:
+    """execute_wrapper that counts statements and sums their time."""
+
+    __slots__ = ('queries', 'seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - t0
+            self.queries += 1
+
+
+def _counted(chunks, view):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    REGISTRY.record_bytes(view, size)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records wall time, DB queries/time, response bytes and status per resolved
+    view name (metrics.py). Put it first so the time covers the other middleware.
+
+    Wall time stops when the response is returned; for streamed bodies without a
+    Content-Length the bytes are recorded once the stream has been consumed.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        # Same as `with conn.execute_wrapper(timer)` for every alias, without a context manager each
+        wrapped = connections.all()
+        for conn in wrapped:
+            conn.execute_wrappers.append(timer)
+        t0 = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            wall = time.perf_counter() - t0
+            for conn in wrapped:
+                conn.execute_wrappers.remove(timer)
+
+        match = request.resolver_match
+        view = match.view_name if match else UNRESOLVED
+        size = None
+        if not response.streaming:
+            size = len(response.content)
+        elif response.has_header('Content-Length'):
+            size = int(response['Content-Length'])
+        else:
+            response.streaming_content = _counted(response.streaming_content, view)
+        REGISTRY.record(view, wall * 1e6, timer.seconds * 1e6, timer.queries, response.status_code, size)
+        return response
+
+
+_END = object()
+
+
+def _profiled(chunks, profile):
+    iterator = iter(chunks)
+    try:
+        while (chunk := profile.call(next, iterator, _END)) is not _END:
+            yield chunk
+    finally:
+        profile.save()
+
+
+def _then(close, after):
+    """`close` followed by `after`, even when closing raises."""
+    def wrapper():
+        try:
+            close()
+        finally:
+            after()
+    return wrapper
+
+
+class SlowQueryMiddleware:
+    """
+    Logs statements slower than SLOW_QUERY_MS with their plan and view
+    (slow_queries.py); 0 turns it off. They are written to the metrics file
+    when the response is closed, after the server has sent it.
+    """
+
+    def __init__(self, get_response):
+        if settings.SLOW_QUERY_MS <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        slow_log = SlowQueryLogger(request, settings.SLOW_QUERY_MS)
+        wrapped = connections.all()
+        for conn in wrapped:
+            conn.execute_wrappers.append(slow_log)
+        try:
+            response = self.get_response(request)
+        finally:
+            for conn in wrapped:
+                conn.execute_wrappers.remove(slow_log)
+        if slow_log.pending:
+            response.close = _then(response.close, slow_log.flush)
+        return response
+
+
+class ProfilerMiddleware:
+    """
+    Runs a staff user's request under cProfile when it carries `X-Profile: 1` or
+    `?_profile=1` (profiling.py); goes after AuthenticationMiddleware.
+    PROFILING_ENABLED=0 turns it off.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not wants_profile(request):
+            return self.get_response(request)
+
+        profile = RequestProfile(request)
+        response = profile.call(self.get_response, request)
+        if response.streaming:
+            response.streaming_content = _profiled(response.streaming_content, profile)
+        else:
+            profile.save()
+        response['X-Profile'] = reverse('profile_download', args=[profile.filename('prof')])
+        response['X-Profile-Collapsed'] = reverse('profile_download', args=[profile.filename('collapsed')])
+        return response
@@ -0,0 +1,99 @@
+# Generated by Django 5.1.2 on 2026-10-17 23:32
+
+import re
+
+from django.db import migrations, models
+
+# Frozen copies of the models.py helpers as of this migration, so later edits
+# to them can't change what this backfill writes.
+MONTHS = {m: i for i, m in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], start=1
+)}
+SPACING = re.compile(r'^\s*(\d+(\.\d+)?)\s*[xX]\s*(\d+(\.\d+)?)\s*(cm|m)?\s*$')
+
+
+def season_factor(ideal, month):
+    if not ideal:
+        return 1.0
+    good_months = set()
+    for block in ideal.replace(' ', '').split(','):
+        if '-' in block:
+            a, b = block.split('-')
+            if a in MONTHS and b in MONTHS:
+                ai, bi = MONTHS[a], MONTHS[b]
+                if ai <= bi:
+                    good_months.update(range(ai, bi + 1))
+                else:
+                    good_months.update(list(range(ai, 13)) + list(range(1, bi + 1)))
+        elif block in MONTHS:
+            good_months.add(MONTHS[block])
+    if month in good_months:
+        return 1.0
+    shoulders = {(m % 12) + 1 for m in good_months} | {((m - 2) % 12) + 1 for m in good_months}
+    return 0.9 if month in shoulders else 0.8
+
+
+def season_factor_table(ideal):
+    return [season_factor(ideal or "", m) for m in range(1, 13)]
+
+
+def spacing_columns(spacing):
+    m = SPACING.match(spacing.strip()) if spacing else None
+    if not m:
+        return None, None, 0.0  # unparseable: 0 trees/ha, so forecasts don't parse it again
+    a, b = float(m.group(1)), float(m.group(3))
+    if (m.group(5) or 'cm').lower() == 'cm':
+        a, b = a / 100.0, b / 100.0
+    return a, b, (10000.0 / (a * b) if a > 0 and b > 0 else 0.0)
+
+
+def backfill(apps, schema_editor):
+    Crop = apps.get_model('myApp', 'Crop')
+    Activity = apps.get_model('myApp', 'Activity')
+    db = schema_editor.connection.alias
+
+    crops = list(Crop.objects.using(db))
+    for crop in crops:
+        crop.season_factors = season_factor_table(crop.ideal_seasons)
+    Crop.objects.using(db).bulk_update(crops, ['season_factors'])
+
+    batch = []
+    for activity in Activity.objects.using(db).exclude(spacing__isnull=True).exclude(spacing='').iterator(chunk_size=2000):
+        activity.spacing_row_m, activity.spacing_hill_m, activity.trees_per_ha = spacing_columns(activity.spacing)
+        batch.append(activity)
+        if len(batch) >= 2000:
+            Activity.objects.using(db).bulk_update(batch, ['spacing_row_m', 'spacing_hill_m', 'trees_per_ha'])
+            batch = []
+    if batch:
+        Activity.objects.using(db).bulk_update(batch, ['spacing_row_m', 'spacing_hill_m', 'trees_per_ha'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0004_forecastjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='spacing_hill_m',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='spacing_row_m',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='trees_per_ha',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='crop',
+            name='season_factors',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
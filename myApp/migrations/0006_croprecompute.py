@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-17 23:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0005_precompiled_agronomy_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CropRecompute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('changed_fields', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('cursor', models.BigIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('crop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recomputes', to='myApp.crop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='myApp_cropr_status_a0a8e1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-17 23:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0006_croprecompute'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forecast',
+            name='harvest_p10',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='forecast',
+            name='harvest_p50',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='forecast',
+            name='harvest_p90',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='forecast',
+            name='yield_p10_kg',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='forecast',
+            name='yield_p50_kg',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='forecast',
+            name='yield_p90_kg',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
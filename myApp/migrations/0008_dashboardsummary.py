@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-17 23:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0007_forecast_percentiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateField(blank=True, null=True)),
+                ('crop_count', models.PositiveIntegerField(default=0)),
+                ('recent_activities', models.JSONField(blank=True, default=list)),
+                ('month_expense_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('most_common_expense', models.CharField(blank=True, max_length=20)),
+                ('last_expense_date', models.DateField(blank=True, null=True)),
+                ('forecasts', models.JSONField(blank=True, default=list)),
+                ('reminders', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('farmer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='dashboard_summary', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.2 on 2026-10-17 23:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def backfill(apps, schema_editor):
+    Expense = apps.get_model('myApp', 'Expense')
+    ExpenseRollup = apps.get_model('myApp', 'ExpenseRollup')
+    db = schema_editor.connection.alias
+    rows = (Expense.objects.using(db)
+            .values('farmer_id', 'date__year', 'date__month', 'expense_type')
+            .annotate(total=Sum('amount'), count=Count('id'), min_amount=Min('amount'), max_amount=Max('amount'))
+            .order_by())
+    ExpenseRollup.objects.using(db).bulk_create([
+        ExpenseRollup(farmer_id=r['farmer_id'], year=r['date__year'], month=r['date__month'],
+                      expense_type=r['expense_type'], total=r['total'], count=r['count'],
+                      min_amount=r['min_amount'], max_amount=r['max_amount'])
+        for r in rows.iterator(chunk_size=2000)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0008_dashboardsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('expense_type', models.CharField(choices=[('seed', 'Seed'), ('fertilizer', 'Fertilizer'), ('labor', 'Labor'), ('equipment', 'Equipment'), ('others', 'Others')], max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('min_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('max_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('farmer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('farmer', 'year', 'month', 'expense_type'), name='uniq_expense_rollup_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
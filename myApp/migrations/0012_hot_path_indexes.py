@@ -0,0 +1,41 @@
+# Generated by Django 5.1.2 on 2026-10-17 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0011_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['farmer', 'date'], name='myApp_activ_farmer__71fd88_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['farmer', 'crop', 'date'], name='myApp_activ_farmer__7e317e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['farmer', 'date'], name='myApp_expen_farmer__43db1c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forecast',
+            index=models.Index(fields=['farmer', 'crop', 'created_at'], name='myApp_forec_farmer__449ebe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forecast',
+            index=models.Index(fields=['farmer', 'harvest_end'], name='myApp_forec_farmer__b1c830_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forecast',
+            index=models.Index(fields=['farmer', 'created_at'], name='myApp_forec_farmer__fcd208_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['farmer', 'due_date'], name='myApp_remin_farmer__61853a_idx'),
+        ),
+    ]
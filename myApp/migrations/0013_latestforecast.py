@@ -0,0 +1,45 @@
+# Generated by Django 5.1.2 on 2026-10-18 00:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import RowNumber
+
+
+def backfill(apps, schema_editor):
+    Forecast = apps.get_model('myApp', 'Forecast')
+    LatestForecast = apps.get_model('myApp', 'LatestForecast')
+    db = schema_editor.connection.alias
+    rank = models.Window(RowNumber(), partition_by=[models.F('farmer_id'), models.F('crop_id')],
+                         order_by=[models.F('created_at').desc(), models.F('id').desc()])
+    newest = (Forecast.objects.using(db).annotate(rank=rank).filter(rank=1)
+              .values_list('farmer_id', 'crop_id', 'id', 'created_at'))
+    LatestForecast.objects.using(db).bulk_create([
+        LatestForecast(farmer_id=f, crop_id=c, forecast_id=pk, created_at=at)
+        for f, c, pk, at in newest.iterator(chunk_size=2000)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0012_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('crop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='myApp.crop')),
+                ('farmer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latest_forecasts', to=settings.AUTH_USER_MODEL)),
+                ('forecast', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='myApp.forecast')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='myApp_lates_created_34944c_idx')],
+                'constraints': [models.UniqueConstraint(fields=('farmer', 'crop'), name='uniq_latest_forecast')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 00:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0013_latestforecast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forecast',
+            name='valid_from',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
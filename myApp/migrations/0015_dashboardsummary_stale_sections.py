@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 00:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0014_forecast_valid_from'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dashboardsummary',
+            name='stale_sections',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def seed(apps, schema_editor):
+    # One row per user, so data_version() can read without creating one
+    User = apps.get_model('myApp', 'User')
+    DataVersion = apps.get_model('myApp', 'DataVersion')
+    db = schema_editor.connection.alias
+    missing = User.objects.using(db).exclude(data_version__isnull=False).values_list('pk', flat=True)
+    DataVersion.objects.using(db).bulk_create(
+        [DataVersion(farmer_id=pk) for pk in missing.iterator(chunk_size=2000)], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0015_dashboardsummary_stale_sections'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,15 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 # --- imports near the top of models.py ---
-from django.db.models.signals import post_save
+from django.db.models.functions import RowNumber
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 import re
-from datetime import timedelta
+from datetime import date, datetime, timedelta
+
+from .date_ranges import month_bounds
 
 
 # ======================
@@ -51,9 +55,42 @@ class Crop(models.Model):
     yield_t_min = models.FloatField(default=0)        # e.g., Rice 4
     yield_t_max = models.FloatField(default=0)        # e.g., Rice 6
 
+    # Precompiled from ideal_seasons on save: season factor for Jan..Dec
+    season_factors = models.JSONField(default=list, blank=True, editable=False)
+
+    # Fields compute_forecast_from_activity reads; editing any of them makes saved forecasts stale
+    BASELINE_FIELDS = (
+        'name', 'ideal_seasons',
+        'days_to_harvest_min', 'days_to_harvest_max',
+        'seed_rate_min_kg', 'seed_rate_max_kg',
+        'fert_sacks_min', 'fert_sacks_max',
+        'yield_t_min', 'yield_t_max',
+    )
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_baselines = {f: getattr(instance, f) for f in cls.BASELINE_FIELDS if f in field_names}
+        return instance
+
+    def changed_baseline_fields(self):
+        loaded = getattr(self, '_loaded_baselines', None)
+        if not loaded:
+            return []
+        return [f for f, v in loaded.items() if getattr(self, f) != v]
+
+    def save(self, *args, **kwargs):
+        self.season_factors = season_factor_table(self.ideal_seasons)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'ideal_seasons' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'season_factors'}
+        self._changed_baselines = self.changed_baseline_fields()
+        super().save(*args, **kwargs)
+        self._loaded_baselines = {f: getattr(self, f) for f in self.BASELINE_FIELDS}
+
 # ======================
 # 📋 ACTIVITY LOG
 # ======================
@@ -77,9 +114,27 @@ class Activity(models.Model):
     fert_sacks = models.FloatField(null=True, blank=True, help_text="Total # of 50kg fertilizer sacks applied (baseline plan)")
     spacing = models.CharField(max_length=50, null=True, blank=True, help_text="e.g. '20x20 cm' or '10x10 m'")
 
+    # Precompiled from spacing on save (None when spacing is empty or unparseable)
+    spacing_row_m = models.FloatField(null=True, blank=True, editable=False)
+    spacing_hill_m = models.FloatField(null=True, blank=True, editable=False)
+    trees_per_ha = models.FloatField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['farmer', 'date']),          # activity log, exports, recent activity
+            models.Index(fields=['farmer', 'crop', 'date']),  # newest planting per crop, crops per month
+        ]
+
     def __str__(self):
         return f"{self.farmer.username} - {self.activity_type} - {self.crop.name}"
 
+    def save(self, *args, **kwargs):
+        self.spacing_row_m, self.spacing_hill_m, self.trees_per_ha = spacing_columns(self.spacing)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'spacing' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'spacing_row_m', 'spacing_hill_m', 'trees_per_ha'}
+        super().save(*args, **kwargs)
+
 
 # ======================
 # 💰 EXPENSE TRACKER
@@ -103,6 +158,48 @@ class Expense(models.Model):
     def __str__(self):
         return f"{self.farmer.username} - {self.expense_type} - ₱{self.amount}"
 
+    class Meta:
+        indexes = [models.Index(fields=['farmer', 'date'])]
+
+    ROLLUP_FIELDS = {'farmer', 'farmer_id', 'date', 'expense_type'}
+
+    # The ExpenseRollup signals run inside these, so a row and its rollup commit together
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            # An edit can move the expense to another month/type; the signal refreshes the old bucket too
+            self._rollup_bucket = None
+            update_fields = kwargs.get('update_fields')
+            if not self._state.adding and (update_fields is None or self.ROLLUP_FIELDS & set(update_fields)):
+                old = Expense.objects.filter(pk=self.pk).values('farmer_id', 'date', 'expense_type').first()
+                if old:
+                    self._rollup_bucket = (old['farmer_id'], old['date'].year, old['date'].month,
+                                           old['expense_type'])
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+
+class ExpenseRollup(models.Model):
+    """Per farmer / month / expense type totals, kept in step with Expense by signals."""
+    farmer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expense_rollups')
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    expense_type = models.CharField(max_length=20, choices=Expense.EXPENSE_TYPES)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+    min_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    max_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['farmer', 'year', 'month', 'expense_type'], name='uniq_expense_rollup_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.farmer_id} {self.year}-{self.month:02d} {self.expense_type}: ₱{self.total} ({self.count})"
+
 
 # ======================
 # 📈 CROP FORECAST
@@ -126,9 +223,114 @@ class Forecast(models.Model):
     harvest_start = models.DateField(null=True, blank=True)
     harvest_end = models.DateField(null=True, blank=True)
 
+    # Set by `compact_forecasts`: this row stands for valid_from..forecast_date
+    valid_from = models.DateField(null=True, blank=True)
+
+    # Monte Carlo percentiles (settings.FORECAST_MONTE_CARLO); empty for range-only forecasts
+    yield_p10_kg = models.FloatField(null=True, blank=True)
+    yield_p50_kg = models.FloatField(null=True, blank=True)
+    yield_p90_kg = models.FloatField(null=True, blank=True)
+    harvest_p10 = models.DateField(null=True, blank=True)
+    harvest_p50 = models.DateField(null=True, blank=True)
+    harvest_p90 = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['farmer', 'crop', 'created_at']),  # latest forecast per crop
+            models.Index(fields=['farmer', 'harvest_end']),         # upcoming harvests
+            models.Index(fields=['farmer', 'created_at']),          # latest forecasts overall
+        ]
+
     def __str__(self):
         return f"{self.crop.name} forecast for {self.forecast_date}"
 
+
+class LatestForecast(models.Model):
+    """
+    Points at the newest Forecast (by created_at, then id) for each farmer and
+    crop, so "latest per crop" is a lookup instead of a sort over the history.
+    Kept current by the Forecast signals and write_forecasts().
+    """
+    farmer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='latest_forecasts')
+    crop = models.ForeignKey(Crop, on_delete=models.CASCADE, related_name='+')
+    forecast = models.OneToOneField(Forecast, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()  # copy of forecast.created_at, for ordering across farmers
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['farmer', 'crop'], name='uniq_latest_forecast'),
+        ]
+        indexes = [models.Index(fields=['created_at'])]
+
+    def __str__(self):
+        return f"{self.farmer_id}/{self.crop_id} → forecast {self.forecast_id}"
+
+# ======================
+# ⏳ FORECAST JOB QUEUE
+# ======================
+
+class ForecastJob(models.Model):
+    """A pending forecast refresh for one farmer/crop, processed by `run_forecast_worker`."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+
+    farmer = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'farmer'})
+    crop = models.ForeignKey(Crop, on_delete=models.CASCADE)
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='forecast_jobs')  # planting to compute from
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)  # pushed back on retry
+    claimed_by = models.CharField(max_length=64, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'available_at'])]
+
+    def __str__(self):
+        return f"Forecast job {self.pk} ({self.status}) for {self.farmer_id}/{self.crop_id}"
+
+
+class CropRecompute(models.Model):
+    """
+    Refresh of every farmer's forecast for one crop after its baselines changed.
+    Workers advance it a chunk of farmers at a time (`cursor` = last farmer id done).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    crop = models.ForeignKey(Crop, on_delete=models.CASCADE, related_name='recomputes')
+    changed_fields = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    total = models.PositiveIntegerField(null=True, blank=True)  # farmers to refresh, counted by the worker
+    processed = models.PositiveIntegerField(default=0)
+    cursor = models.BigIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Recompute {self.crop_id} ({self.status} {self.processed}/{self.total or '?'})"
+
+    @property
+    def percent(self):
+        if not self.total:
+            return 0
+        return min(100, round(self.processed * 100 / self.total))
+
+
 # ======================
 # 🌾 CROP RECOMMENDATIONS
 # ======================
@@ -152,10 +354,114 @@ class Reminder(models.Model):
     message = models.CharField(max_length=255)
     due_date = models.DateField()
 
+    class Meta:
+        indexes = [models.Index(fields=['farmer', 'due_date'])]
+
     def __str__(self):
         return f"Reminder for {self.farmer.username}: {self.message}"
 
 
+# ======================
+# 📊 DASHBOARD SUMMARY
+# ======================
+
+class DashboardSummary(models.Model):
+    """
+    Everything farmer_dashboard shows, precomputed per farmer. Saves mark the
+    sections they feed in `stale_sections` (signals at the bottom of this file)
+    and the next view recomputes just those; `as_of` is the day the
+    month/upcoming sections were computed for (NULL = rebuild on next view).
+    """
+    farmer = models.OneToOneField(User, on_delete=models.CASCADE, related_name='dashboard_summary')
+    as_of = models.DateField(null=True, blank=True)
+    stale_sections = models.PositiveIntegerField(default=0)  # bitmask over DASHBOARD_SECTIONS
+
+    crop_count = models.PositiveIntegerField(default=0)
+    recent_activities = models.JSONField(default=list, blank=True)
+
+    month_expense_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    most_common_expense = models.CharField(max_length=20, blank=True)
+    last_expense_date = models.DateField(null=True, blank=True)
+
+    forecasts = models.JSONField(default=list, blank=True)
+    reminders = models.JSONField(default=list, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dashboard summary for {self.farmer_id} ({self.as_of})"
+
+    def context(self):
+        """Template context for farmer_dashboard, with JSON dates turned back into dates."""
+        return {
+            'crop_count': self.crop_count,
+            'forecasts': [_hydrate(f, DASHBOARD_FORECAST_DATES) for f in self.forecasts],
+            'total_expenses': self.month_expense_total,
+            'most_common_expense_label': dict(Expense.EXPENSE_TYPES).get(self.most_common_expense, "—"),
+            'last_recorded_date': self.last_expense_date,
+            'recent_activities': [_hydrate(a, ('date',)) for a in self.recent_activities],
+            'reminders': [_hydrate(r, ('due_date',)) for r in self.reminders],
+        }
+
+
+# ======================
+# 📦 EXPORT CACHE
+# ======================
+
+class DataVersion(models.Model):
+    """
+    Per-farmer counter bumped whenever one of their expenses or activities
+    changes. Cached exports are keyed by it, so a bump retires every old file.
+    """
+    farmer = models.OneToOneField(User, on_delete=models.CASCADE, related_name='data_version')
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Data version {self.version} for {self.farmer_id}"
+
+
+class ExportJob(models.Model):
+    """
+    A CSV/PDF export rendered in the background by `run_export_worker`; the page
+    polls its status partial until the download link appears.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    farmer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_jobs')
+    export = models.CharField(max_length=32)            # exports.EXPORTS name, e.g. 'activities.pdf'
+    filters = models.JSONField(default=dict, blank=True)
+    cache_key = models.CharField(max_length=40)         # export_cache key, fixed at creation
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    rows_total = models.PositiveIntegerField(null=True, blank=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    claimed_by = models.CharField(max_length=64, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Export {self.pk} {self.export} ({self.status}) for {self.farmer_id}"
+
+    @property
+    def is_active(self):
+        return self.status in ('pending', 'running')
+
+    @property
+    def percent(self):
+        if not self.rows_total:
+            return 0
+        return min(100, round(self.rows_done * 100 / self.rows_total))
+
+
 # ======================
 # 📝 SUPPORT & HELP
 # ======================
@@ -229,6 +535,36 @@ def _season_factor(ideal: str, month: int) -> float:
 
 def _clamp(x, lo, hi): return max(lo, min(hi, x))
 
+def season_factor_table(ideal: str):
+    """Crop.season_factors: _season_factor() for months 1..12."""
+    return [_season_factor(ideal or "", m) for m in range(1, 13)]
+
+def spacing_columns(spacing: str):
+    """
+    Activity (spacing_row_m, spacing_hill_m, trees_per_ha) for a spacing string.
+    A spacing that gives no tree count is stored as 0 trees/ha, so forecasts
+    don't try to parse it again; None means no spacing (or a row never saved).
+    """
+    if not spacing:
+        return None, None, None
+    sp = _parse_spacing(spacing)
+    if not sp:
+        return None, None, 0.0
+    return sp[0], sp[1], _trees_per_ha(sp) or 0.0
+
+def _crop_season_factor(crop, month: int) -> float:
+    table = crop.season_factors
+    if table and len(table) == 12:
+        return table[month - 1]
+    return _season_factor(crop.ideal_seasons or "", month)
+
+def _activity_trees_per_ha(activity):
+    if activity.trees_per_ha is not None or not activity.spacing:
+        return activity.trees_per_ha
+    # Row never went through save() (bulk_create, unsaved instance): parse on the fly.
+    # Saved rows with an unusable spacing hold 0, so they never get here.
+    return _trees_per_ha(_parse_spacing(activity.spacing))
+
 
 # ---------- The calculator ----------
 def compute_forecast_from_activity(activity: Activity):
@@ -239,7 +575,6 @@ def compute_forecast_from_activity(activity: Activity):
     area = max(activity.area_ha or 1.0, 1e-6)
     seed_qty = (activity.seed_qty_kg or 0.0)
     fert_sacks = (activity.fert_sacks or 0.0)
-    spacing = activity.spacing or ""
 
     # Baselines
     baseline_min = crop.yield_t_min * 1000.0  # kg/ha
@@ -255,7 +590,7 @@ def compute_forecast_from_activity(activity: Activity):
 
     # Season
     plant_month = activity.date.month
-    s_factor = _season_factor(crop.ideal_seasons or "", plant_month)
+    s_factor = _crop_season_factor(crop, plant_month)
 
     # Inputs
     # Seed factor (if seed rate exists)
@@ -278,12 +613,10 @@ def compute_forecast_from_activity(activity: Activity):
     pop_factor = 1.0
     crop_name = (crop.name or "").strip().lower()
     if crop_name in ("mango", "guava", "banana"):
-        sp = _parse_spacing(spacing)
-        if sp:
-            trees_ha = _trees_per_ha(sp)
-            nominal = 100 if crop_name == "mango" else (400 if crop_name == "guava" else 1100)
-            if trees_ha:
-                pop_factor = _clamp(trees_ha / nominal, 0.6, 1.3)
+        trees_ha = _activity_trees_per_ha(activity)
+        nominal = 100 if crop_name == "mango" else (400 if crop_name == "guava" else 1100)
+        if trees_ha:
+            pop_factor = _clamp(trees_ha / nominal, 0.6, 1.3)
 
     combined = _clamp(s_factor * input_factor * pop_factor, 0.5, 1.3)
 
@@ -315,16 +648,18 @@ def compute_forecast_from_activity(activity: Activity):
 
 
 # ---------- Auto-create/refresh Forecast on planting ----------
-@receiver(post_save, sender=Activity)
-def auto_forecast_on_planting(sender, instance: Activity, created, **kwargs):
-    if instance.activity_type != 'planting':
-        return
-
-    data = compute_forecast_from_activity(instance)
-
-    Forecast.objects.update_or_create(
-        farmer=instance.farmer,
-        crop=instance.crop,
+def save_forecast_for_activity(activity: Activity):
+    """Compute and upsert today's Forecast for this planting's farmer/crop."""
+    data = compute_forecast_from_activity(activity)
+    percentiles = dict.fromkeys(('yield_p10_kg', 'yield_p50_kg', 'yield_p90_kg',
+                                 'harvest_p10', 'harvest_p50', 'harvest_p90'))
+    if settings.FORECAST_MONTE_CARLO:
+        from .forecast_montecarlo import percentiles_for_activity
+        percentiles = percentiles_for_activity(activity)
+
+    forecast, _ = Forecast.objects.update_or_create(
+        farmer=activity.farmer,
+        crop=activity.crop,
         forecast_date=timezone.now().date(),
         defaults={
             "expected_yield_kg": data["expected_yield_kg"],
@@ -337,5 +672,358 @@ def auto_forecast_on_planting(sender, instance: Activity, created, **kwargs):
             "harvest_end": data["harvest_end"],
             "notes": data["notes"],
             "created_at": timezone.now(),
+            **percentiles,
         }
     )
+    return forecast
+
+
+@receiver(post_save, sender=Activity)
+def auto_forecast_on_planting(sender, instance: Activity, created, **kwargs):
+    if instance.activity_type != 'planting':
+        return
+
+    # Tests and small installs can compute inline; otherwise hand off to run_forecast_worker
+    if settings.FORECAST_SYNC:
+        save_forecast_for_activity(instance)
+        return
+
+    ForecastJob.objects.create(farmer_id=instance.farmer_id, crop_id=instance.crop_id, activity=instance)
+
+
+# ---------- Refresh forecasts when crop baselines change ----------
+@receiver(post_save, sender=Crop)
+def recompute_on_baseline_change(sender, instance: Crop, created, **kwargs):
+    changed = getattr(instance, '_changed_baselines', None)
+    if created or not changed:
+        return
+
+    # Restart an unfinished run so every chunk sees the new baselines
+    job = (CropRecompute.objects
+           .filter(crop=instance, status__in=('pending', 'running'))
+           .order_by('-id').first())
+    if job:
+        fields = set(filter(None, job.changed_fields.split(','))) | set(changed)
+        job.changed_fields = ','.join(sorted(fields))
+        job.status, job.cursor, job.processed, job.total = 'pending', 0, 0, None
+        job.save()
+    else:
+        job = CropRecompute.objects.create(crop=instance, changed_fields=','.join(sorted(changed)))
+
+    instance._recompute = job
+    # The worker drains recomputes; only a small crop on a worker-less install refreshes inline
+    if settings.FORECAST_SYNC and (Activity.objects.filter(crop=instance, activity_type='planting')
+                                   .count() <= settings.CROP_RECOMPUTE_INLINE_MAX):
+        from .forecast_queue import run_crop_recompute
+        run_crop_recompute(job)
+
+
+# ---------- Expense rollups ----------
+def _expense_bucket(expense):
+    d = expense.date
+    if expense.farmer_id is None or not hasattr(d, 'year'):
+        return None
+    return (expense.farmer_id, d.year, d.month, expense.expense_type)
+
+
+def refresh_expense_rollup(farmer_id, year, month, expense_type):
+    """Recompute one bucket from its Expense rows (deletes the rollup when it is empty)."""
+    start, end = month_bounds(year, month)
+    agg = (Expense.objects
+           .filter(farmer_id=farmer_id, date__gte=start, date__lt=end, expense_type=expense_type)
+           .aggregate(total=models.Sum('amount'), count=models.Count('id'),
+                      min_amount=models.Min('amount'), max_amount=models.Max('amount')))
+    bucket = dict(farmer_id=farmer_id, year=year, month=month, expense_type=expense_type)
+    if not agg['count']:
+        ExpenseRollup.objects.filter(**bucket).delete()
+        return
+    ExpenseRollup.objects.update_or_create(**bucket, defaults=agg)
+
+
+def rebuild_expense_rollups(farmer_ids=None):
+    """Recreate rollups from scratch in one grouped pass. Returns the number of buckets."""
+    expenses = Expense.objects.all()
+    rollups = ExpenseRollup.objects.all()
+    if farmer_ids is not None:
+        expenses = expenses.filter(farmer_id__in=farmer_ids)
+        rollups = rollups.filter(farmer_id__in=farmer_ids)
+    rows = (expenses
+            .values('farmer_id', 'date__year', 'date__month', 'expense_type')
+            .annotate(total=models.Sum('amount'), count=models.Count('id'),
+                      min_amount=models.Min('amount'), max_amount=models.Max('amount'))
+            .order_by())
+    with transaction.atomic():
+        rollups.delete()
+        created = ExpenseRollup.objects.bulk_create([
+            ExpenseRollup(farmer_id=r['farmer_id'], year=r['date__year'], month=r['date__month'],
+                          expense_type=r['expense_type'], total=r['total'], count=r['count'],
+                          min_amount=r['min_amount'], max_amount=r['max_amount'])
+            for r in rows.iterator(chunk_size=2000)
+        ], batch_size=500)
+    return len(created)
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def update_expense_rollup(sender, instance, **kwargs):
+    # The bucket the row was stored under before this save (Expense.save), and the current one
+    buckets = {getattr(instance, '_rollup_bucket', None), _expense_bucket(instance)} - {None}
+    for bucket in buckets:
+        refresh_expense_rollup(*bucket)
+    instance._rollup_bucket = None
+
+
+# ---------- Latest forecast pointers ----------
+def newest_forecasts(queryset):
+    """(farmer_id, crop_id, forecast id, created_at) of the newest forecast per pair in `queryset`, in one query."""
+    rank = models.Window(RowNumber(), partition_by=[models.F('farmer_id'), models.F('crop_id')],
+                         order_by=[models.F('created_at').desc(), models.F('id').desc()])
+    return (queryset.annotate(rank=rank).filter(rank=1)
+            .values_list('farmer_id', 'crop_id', 'id', 'created_at'))
+
+
+def refresh_latest_forecasts(pairs):
+    """Re-point LatestForecast for each (farmer_id, crop_id) in `pairs`; pairs left without forecasts lose theirs."""
+    pairs = set(pairs)
+    if not pairs:
+        return
+    farmer_ids = {f for f, _ in pairs}
+    crop_ids = {c for _, c in pairs}
+    newest = [row for row in newest_forecasts(Forecast.objects.filter(farmer_id__in=farmer_ids, crop_id__in=crop_ids))
+              if row[:2] in pairs]
+    LatestForecast.objects.bulk_create(
+        [LatestForecast(farmer_id=f, crop_id=c, forecast_id=pk, created_at=at) for f, c, pk, at in newest],
+        update_conflicts=True, unique_fields=['farmer', 'crop'], update_fields=['forecast', 'created_at'],
+    )
+    gone = pairs - {row[:2] for row in newest}
+    if gone:
+        q = models.Q(pk__in=[])
+        for f, c in gone:
+            q |= models.Q(farmer_id=f, crop_id=c)
+        LatestForecast.objects.filter(q).delete()
+
+
+@receiver(post_save, sender=Forecast)
+def latest_forecast_on_save(sender, instance: Forecast, **kwargs):
+    # A saved forecast is nearly always the pair's newest: move the pointer with one
+    # conditional UPDATE, and only fall back to the window query when it doesn't apply
+    # (first forecast for the pair, or an older row saved).
+    not_newer = (models.Q(created_at__lt=instance.created_at)
+                 | models.Q(created_at=instance.created_at, forecast_id__lte=instance.pk))
+    moved = (LatestForecast.objects
+             .filter(not_newer, farmer_id=instance.farmer_id, crop_id=instance.crop_id)
+             .update(forecast=instance, created_at=instance.created_at))
+    if not moved:
+        refresh_latest_forecasts([(instance.farmer_id, instance.crop_id)])
+
+
+@receiver(post_delete, sender=Forecast)
+def latest_forecast_on_delete(sender, instance: Forecast, **kwargs):
+    refresh_latest_forecasts([(instance.farmer_id, instance.crop_id)])
+
+
+# ---------- Dashboard summary sections ----------
+DASHBOARD_FORECAST_DATES = ('harvest_start', 'harvest_end', 'created_at')
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _hydrate(item, date_keys):
+    item = dict(item)
+    for key in date_keys:
+        value = item.get(key)
+        if value:
+            item[key] = datetime.fromisoformat(value) if 'T' in value else date.fromisoformat(value)
+    return item
+
+
+def _summary_activities(farmer_id, today):
+    start, end = month_bounds(today.year, today.month)
+    crop_count = (Activity.objects
+                  .filter(farmer_id=farmer_id, date__gte=start, date__lt=end)
+                  .values('crop').distinct().count())
+    recent = (Activity.objects
+              .filter(farmer_id=farmer_id)
+              .select_related('crop')
+              .order_by('-date')[:5])
+    return {
+        'crop_count': crop_count,
+        'recent_activities': [
+            {'crop_name': a.crop.name, 'activity_type': a.activity_type, 'date': _iso(a.date)}
+            for a in recent
+        ],
+    }
+
+
+def _summary_expenses(farmer_id, today):
+    month = ExpenseRollup.objects.filter(farmer_id=farmer_id, year=today.year, month=today.month)
+    total = month.aggregate(total=models.Sum('total'))['total'] or 0
+    most_common = month.order_by('-count').values_list('expense_type', flat=True).first()
+    last = Expense.objects.filter(farmer_id=farmer_id).order_by('-date').values_list('date', flat=True).first()
+    return {
+        'month_expense_total': total,
+        'most_common_expense': most_common or '',
+        'last_expense_date': last,
+    }
+
+
+def _summary_forecasts(farmer_id, today):
+    # Latest forecast per crop: prefer upcoming harvests, else the 3 newest
+    latest = LatestForecast.objects.filter(farmer_id=farmer_id).select_related('forecast__crop')
+    rows = [p.forecast for p in (latest
+                                 .filter(forecast__harvest_end__isnull=False, forecast__harvest_end__gte=today)
+                                 .order_by('forecast__harvest_start', '-created_at')[:3])]
+    if not rows:
+        rows = [p.forecast for p in latest.order_by('-created_at')[:3]]
+
+    # Newest planting for just these crops, for the "View planting detail" links
+    planting_map = {}
+    for crop_id, pk in (Activity.objects
+                        .filter(farmer_id=farmer_id, activity_type='planting', crop_id__in={f.crop_id for f in rows})
+                        .order_by('-crop_id', '-date', '-id')  # one direction, so the (farmer, crop, date) index needs no sort
+                        .values_list('crop_id', 'id')):
+        planting_map.setdefault(crop_id, pk)
+
+    return {'forecasts': [{
+        'crop_name': f.crop.name,
+        'expected_yield_kg': f.expected_yield_kg,
+        'yield_min_kg': f.yield_min_kg,
+        'yield_max_kg': f.yield_max_kg,
+        'season_factor': f.season_factor,
+        'input_factor': f.input_factor,
+        'population_factor': f.population_factor,
+        'harvest_start': _iso(f.harvest_start),
+        'harvest_end': _iso(f.harvest_end),
+        'created_at': _iso(f.created_at),
+        'notes': f.notes,
+        'planting_activity_id': planting_map.get(f.crop_id),
+    } for f in rows]}
+
+
+def _summary_reminders(farmer_id, today):
+    upcoming = (Reminder.objects
+                .filter(farmer_id=farmer_id, due_date__gte=today)
+                .order_by('due_date')
+                .values('id', 'message', 'due_date'))
+    return {'reminders': [dict(r, due_date=_iso(r['due_date'])) for r in upcoming]}
+
+
+DASHBOARD_SECTIONS = {
+    'activities': _summary_activities,
+    'expenses': _summary_expenses,
+    'forecasts': _summary_forecasts,
+    'reminders': _summary_reminders,
+}
+SECTION_BITS = {name: 1 << i for i, name in enumerate(DASHBOARD_SECTIONS)}
+
+
+def rebuild_dashboard_summary(farmer_id):
+    """Recompute every section for this farmer and store it as of today."""
+    today = timezone.now().date()
+    fields = {'as_of': today, 'stale_sections': 0}
+    for build in DASHBOARD_SECTIONS.values():
+        fields.update(build(farmer_id, today))
+    summary, _ = DashboardSummary.objects.update_or_create(farmer_id=farmer_id, defaults=fields)
+    return summary
+
+
+def get_dashboard_summary(user):
+    """
+    The farmer's summary: rebuilt first if missing, invalidated or from another
+    day, else with its stale sections recomputed.
+    """
+    summary = DashboardSummary.objects.filter(farmer=user).first()
+    if summary is None or summary.as_of != timezone.now().date():
+        summary = rebuild_dashboard_summary(user.pk)
+    elif summary.stale_sections:
+        refresh_dashboard_sections(summary)
+    return summary
+
+
+def refresh_dashboard_sections(summary):
+    """Recompute the sections marked in `summary.stale_sections`, in place."""
+    mask = summary.stale_sections
+    today = timezone.now().date()
+    # Clear the bits first, so a write landing mid-rebuild marks its section again
+    DashboardSummary.objects.filter(pk=summary.pk).update(stale_sections=models.F('stale_sections').bitand(~mask))
+    fields = {}
+    for name, bit in SECTION_BITS.items():
+        if mask & bit:
+            fields.update(DASHBOARD_SECTIONS[name](summary.farmer_id, today))
+    fields['updated_at'] = timezone.now()
+    DashboardSummary.objects.filter(pk=summary.pk).update(**fields)
+    for name, value in fields.items():
+        setattr(summary, name, value)
+    summary.stale_sections = 0
+
+
+def invalidate_dashboard_summaries(farmer_ids):
+    """For bulk writes that skip signals: one UPDATE, rebuilt lazily per farmer."""
+    DashboardSummary.objects.filter(farmer_id__in=farmer_ids).update(as_of=None)
+
+
+# Which sections each model feeds (plantings also drive the forecast card links)
+_DASHBOARD_SOURCES = {
+    Activity: SECTION_BITS['activities'] | SECTION_BITS['forecasts'],
+    Expense: SECTION_BITS['expenses'],
+    Forecast: SECTION_BITS['forecasts'],
+    Reminder: SECTION_BITS['reminders'],
+}
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Forecast)
+@receiver(post_save, sender=Reminder)
+@receiver(post_delete, sender=Activity)
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Forecast)
+@receiver(post_delete, sender=Reminder)
+def mark_dashboard_stale(sender, instance, **kwargs):
+    # One UPDATE per save; the sections are recomputed on the farmer's next view
+    DashboardSummary.objects.filter(farmer_id=instance.farmer_id).update(
+        stale_sections=models.F('stale_sections').bitor(_DASHBOARD_SOURCES[sender]))
+
+
+@receiver(post_save, sender=Crop)
+def dashboard_on_crop_rename(sender, instance: Crop, created, **kwargs):
+    # Crop names are copied into the summaries
+    if not created and 'name' in (getattr(instance, '_changed_baselines', None) or ()):
+        invalidate_dashboard_summaries(
+            Activity.objects.filter(crop=instance).values('farmer_id')
+        )
+
+
+# ---------- Export data versions ----------
+def data_version(farmer_id):
+    """
+    Current version, or None for a farmer who has no row yet (a new user who
+    hasn't saved anything). Read-only, so GETs never write.
+    """
+    return DataVersion.objects.filter(farmer_id=farmer_id).values_list('version', flat=True).first()
+
+
+def bump_data_versions(farmer_ids):
+    return DataVersion.objects.filter(farmer_id__in=farmer_ids).update(version=models.F('version') + 1)
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Activity)
+@receiver(post_delete, sender=Expense)
+def bump_data_version(sender, instance, signal, **kwargs):
+    if bump_data_versions([instance.farmer_id]) or signal is not post_save:
+        return
+    # First save since sign-up (migration 0016 seeded rows for existing users): None → 1
+    _, created = DataVersion.objects.get_or_create(farmer_id=instance.farmer_id, defaults={'version': 1})
+    if not created:
+        bump_data_versions([instance.farmer_id])
+
+
+@receiver(post_save, sender=Crop)
+def data_version_on_crop_rename(sender, instance: Crop, created, **kwargs):
+    # Activity exports print the crop name
+    if not created and 'name' in (getattr(instance, '_changed_baselines', None) or ()):
+        bump_data_versions(Activity.objects.filter(crop=instance).values('farmer_id'))
@@ -0,0 +1,115 @@
+"""
+Keyset (seek) pagination for the activity and expense logs.
+
+Rows are ordered newest first by (date, id). A page is fetched with
+`date <= d` plus an exclusion of the cursor row's ties, so the (farmer, date)
+index serves both the range and the ORDER BY and a deep page costs the same
+as the first one. The cursor travels in `?after=` / `?before=` as
+`<iso date>_<id>`.
+
+Totals for the filter bar come from cached_count, which keys the cache on the
+farmer's DataVersion: any Activity/Expense change moves to a new key, so the
+COUNT(*) runs once per change instead of once per page.
+"""
+import hashlib
+import json
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import data_version
+
+COUNT_TTL = 24 * 60 * 60  # seconds; entries are also invalidated by the data version
+
+
+def parse_cursor(value):
+    """(date, id) from `<iso date>_<id>`, or None when missing/malformed."""
+    try:
+        day, pk = (value or '').split('_')
+        return date.fromisoformat(day), int(pk)
+    except ValueError:
+        return None
+
+
+def format_cursor(obj):
+    return f"{obj.date.isoformat()}_{obj.pk}"
+
+
+class KeysetPage:
+    """One page of rows plus the query strings for its neighbours."""
+
+    def __init__(self, items, params, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_query = self._query(params, 'after', next_cursor) if next_cursor else ''
+        self.prev_query = self._query(params, 'before', prev_cursor) if prev_cursor else ''
+
+    @staticmethod
+    def _query(params, key, cursor):
+        q = params.copy()
+        q.pop('after', None)
+        q.pop('before', None)
+        q[key] = cursor
+        return q.urlencode()
+
+    @property
+    def has_next(self):
+        return bool(self.next_query)
+
+    @property
+    def has_prev(self):
+        return bool(self.prev_query)
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_prev
+
+
+def keyset_page(queryset, params, size=None):
+    """
+    The page of `queryset` (newest first) selected by `params['after']` or
+    `params['before']`; `params` is request.GET.
+    """
+    size = size or settings.LOG_PAGE_SIZE
+    after = parse_cursor(params.get('after'))
+    before = None if after else parse_cursor(params.get('before'))
+
+    if before:
+        day, pk = before
+        rows = list(queryset
+                    .filter(date__gte=day).exclude(date=day, id__lte=pk)
+                    .order_by('date', 'id')[:size + 1])
+        more = len(rows) > size
+        items = rows[:size][::-1]
+        has_prev, has_next = more, True
+    else:
+        qs = queryset
+        if after:
+            day, pk = after
+            qs = qs.filter(date__lte=day).exclude(date=day, id__gte=pk)
+        rows = list(qs.order_by('-date', '-id')[:size + 1])
+        items = rows[:size]
+        has_prev, has_next = bool(after), len(rows) > size
+
+    if not items:
+        return KeysetPage(items, params)
+    return KeysetPage(items, params,
+                      next_cursor=format_cursor(items[-1]) if has_next else None,
+                      prev_cursor=format_cursor(items[0]) if has_prev else None)
+
+
+def cached_count(queryset, farmer_id, scope):
+    """
+    `queryset.count()` cached until the farmer's data changes; `scope` names
+    the list and its filters (anything JSON-serializable).
+    """
+    version = data_version(farmer_id)
+    if version is None:
+        return queryset.count()   # nothing to key on until the farmer's first save
+    raw = json.dumps(scope, sort_keys=True, default=str)
+    key = 'rowcount:{}:{}:{}'.format(farmer_id, version, hashlib.sha1(raw.encode()).hexdigest())
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_TTL)
+    return count
@@ -0,0 +1,125 @@
+"""
+On-demand request profiling.
+
+A staff user adds `X-Profile: 1` to a request (or `?_profile=1` to the URL)
+and ProfilerMiddleware (middleware.py) runs the rest of the request under
+cProfile. It writes two files to PROFILE_DIR: `<name>.prof` for pstats or
+snakeviz, and `<name>.collapsed`, folded stacks (`a;b;c <µs>`) that
+flamegraph.pl and speedscope read directly. The response carries links to both
+in `X-Profile` and `X-Profile-Collapsed`; `profile_download` serves them to
+staff. Streamed responses are profiled until the stream is consumed, so the
+files appear once the download has finished.
+
+cProfile records caller/callee pairs rather than whole stacks, so the
+collapsed stacks split each function's time between its callers in proportion
+to the time each caller spent in it. Only the newest PROFILE_KEEP profiles are
+kept. Export jobs rendered by `run_export_worker` run outside any request and
+are not covered; request a PDF export that misses the cache instead.
+"""
+import cProfile
+import os
+import pstats
+import re
+import secrets
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.text import slugify
+
+FILENAME = re.compile(r'^[\w-]+\.(?:prof|collapsed)$')
+MIN_SECONDS = 1e-6     # stack paths cheaper than this are left out of the collapsed file
+MAX_DEPTH = 200
+
+
+def profile_dir():
+    path = Path(settings.PROFILE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def wants_profile(request):
+    """Profiling is asked for and the user may ask for it."""
+    asked = request.headers.get('X-Profile') == '1' or request.GET.get('_profile') == '1'
+    return asked and request.user.is_staff
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == '~':  # builtins and C methods
+        return name.replace(';', ':')
+    path = Path(filename)
+    try:
+        short = path.relative_to(settings.BASE_DIR)
+    except ValueError:
+        short = Path(*path.parts[-2:])
+    return f'{name} ({short}:{line})'.replace(';', ':')
+
+
+def collapsed_stacks(stats):
+    """{'root;...;leaf': self seconds on that path} from a pstats.Stats."""
+    callees = defaultdict(dict)
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees[caller][func] = edge[3]  # cumulative time `func` ran when called from `caller`
+    stacks = defaultdict(float)
+
+    def walk(func, path, labels, share):
+        _, _, self_time, cumulative, _ = stats.stats[func]
+        fraction = min(share / cumulative, 1.0) if cumulative else 1.0
+        labels = f'{labels};{_label(func)}' if labels else _label(func)
+        stacks[labels] += self_time * fraction
+        if len(path) >= MAX_DEPTH:
+            return
+        for callee, edge_time in callees[func].items():
+            if callee not in path and edge_time * fraction >= MIN_SECONDS:  # recursion stays in the frame
+                walk(callee, path | {callee}, labels, edge_time * fraction)
+
+    # Roots: functions entered straight from the frame that enabled the profiler. cProfile
+    # records no caller for those calls, so they are the calls its callers don't account for
+    # (the middleware chain, say, is entered once from outside and then recursed into).
+    for func, (primitive, calls, _, cumulative, callers) in stats.stats.items():
+        outside = calls - sum(edge[0] for edge in callers.values())
+        if outside > 0 and primitive:
+            walk(func, frozenset([func]), '', cumulative * min(outside / primitive, 1.0))
+    return stacks
+
+
+class RequestProfile:
+    """One profiled request: a cProfile.Profile plus the file names it will be saved under."""
+
+    def __init__(self, request):
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        slug = slugify(request.path.replace('/', ' '))[:40] or 'root'
+        self.name = f'{stamp}-{slug}-{secrets.token_hex(3)}'
+        self.profiler = cProfile.Profile()
+
+    def call(self, func, *args):
+        self.profiler.enable()
+        try:
+            return func(*args)
+        finally:
+            self.profiler.disable()
+
+    def filename(self, kind):
+        return f'{self.name}.{kind}'
+
+    def save(self):
+        directory = profile_dir()
+        self.profiler.dump_stats(directory / self.filename('prof'))
+        stacks = collapsed_stacks(pstats.Stats(self.profiler))
+        with open(directory / self.filename('collapsed'), 'w') as fh:
+            for stack, seconds in sorted(stacks.items()):
+                if round(seconds * 1e6):
+                    fh.write(f'{stack} {round(seconds * 1e6)}\n')
+        prune(directory)
+
+
+def prune(directory, keep=None):
+    """Delete all but the newest `keep` (PROFILE_KEEP) profiles."""
+    keep = settings.PROFILE_KEEP if keep is None else keep
+    profiles = sorted(directory.glob('*.prof'), key=os.path.getmtime, reverse=True)
+    for old in profiles[keep:]:
+        old.unlink(missing_ok=True)
+        old.with_suffix('.collapsed').unlink(missing_ok=True)
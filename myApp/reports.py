@@ -0,0 +1,187 @@
+"""
+Paginated table reports (PDF).
+
+Rows are consumed from an iterator (the chunked value-tuple sources in
+exports.py) and laid out one page at a time: each row's height is measured
+as it arrives, and once the page is full its rows are drawn as a reportlab
+Table and dropped. Wrapped cells keep their full text: a row taller than a
+whole page fills the rest of the current one and continues on the next.
+Only the current page's rows are held in memory; finished pages are compressed by the canvas and the document is written to a
+SpooledTemporaryFile, which moves to disk past SPOOL_MAX_BYTES and is then
+streamed back with a FileResponse.
+"""
+import tempfile
+
+from django.http import FileResponse
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle
+
+SPOOL_MAX_BYTES = 5 * 1024 * 1024   # keep small reports in memory, spill bigger ones to disk
+
+FONT_SIZE = 8
+LEADING = 10
+PADDING = 3
+
+TABLE_STYLE = TableStyle([
+    ('FONT', (0, 0), (-1, -1), 'Helvetica', FONT_SIZE, LEADING),
+    ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', FONT_SIZE, LEADING),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#dcfce7')),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
+    ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#d1d5db')),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), PADDING),
+    ('RIGHTPADDING', (0, 0), (-1, -1), PADDING),
+    ('TOPPADDING', (0, 0), (-1, -1), PADDING),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), PADDING),
+])
+
+
+class TableReport:
+    """
+    A titled table split across as many pages as the rows need.
+
+    `columns` is a list of (heading, relative width); `wrap` names the column
+    indexes whose text is broken over several lines to fit, and `align_right`
+    the numeric ones.
+    """
+
+    def __init__(self, title, columns, subtitle='', wrap=(), align_right=(), pagesize=None, margin=36):
+        self.title = title
+        self.subtitle = subtitle
+        self.header = [heading for heading, _ in columns]
+        self.pagesize = pagesize or landscape(A4)
+        self.margin = margin
+
+        width, height = self.pagesize
+        usable = width - 2 * margin
+        total = sum(w for _, w in columns)
+        self.col_widths = [usable * w / total for _, w in columns]
+        self.wrap = set(wrap)
+        self.body_top = height - margin - 34            # below the title block
+        self.body_height = self.body_top - margin - 14  # above the footer
+        self.line_height = LEADING + 2 * PADDING
+
+        self.style = TableStyle(TABLE_STYLE.getCommands())
+        for i in align_right:
+            self.style.add('ALIGN', (i, 0), (i, -1), 'RIGHT')
+
+    # ---------- Layout ----------
+    def _cells(self, row):
+        """Each cell as its list of lines; `wrap` columns are broken to fit their width."""
+        cells = []
+        for i, value in enumerate(row):
+            text = '' if value is None else str(value)
+            if i in self.wrap and text:
+                # Pre-split plain text: Table draws '\n'-joined strings without re-measuring them
+                cells.append(simpleSplit(text, 'Helvetica', FONT_SIZE, self.col_widths[i] - 2 * PADDING))
+            else:
+                cells.append([text])
+        return cells
+
+    def _draw_page(self, c, page, rows, heights):
+        width, height = self.pagesize
+        c.setFont('Helvetica-Bold', 14)
+        c.drawString(self.margin, height - self.margin - 14, self.title)
+        c.setFont('Helvetica', 9)
+        c.setFillColor(colors.HexColor('#6b7280'))
+        c.drawString(self.margin, height - self.margin - 28, self.subtitle)
+        c.drawRightString(width - self.margin, self.margin - 12, f"Page {page}")
+        c.setFillColor(colors.black)
+
+        table = Table([self.header] + rows, colWidths=self.col_widths,
+                      rowHeights=[self.line_height] + heights, style=self.style)
+        _, h = table.wrapOn(c, width - 2 * self.margin, self.body_height)
+        table.drawOn(c, self.margin, self.body_top - h)
+        c.showPage()
+
+    # ---------- Rendering ----------
+    def render(self, rows, fileobj, progress=None):
+        """
+        Write the PDF to `fileobj`; returns (rows, pages). `progress(rows_done, pages_done)`
+        is called after every page.
+        """
+        c = canvas.Canvas(fileobj, pagesize=self.pagesize, pageCompression=1)
+        c.setTitle(self.title)
+
+        page = done = 0
+        page_rows, heights, used = [], [], self.line_height
+
+        def flush():
+            nonlocal page, page_rows, heights, used
+            page += 1
+            self._draw_page(c, page, page_rows, heights)
+            if progress:
+                progress(done, page)
+            page_rows, heights, used = [], [], self.line_height
+
+        def add(cells, lines):
+            nonlocal used
+            h = lines * LEADING + 2 * PADDING
+            page_rows.append(['\n'.join(cell) for cell in cells])
+            heights.append(h)
+            used += h
+
+        page_lines = int((self.body_height - self.line_height - 2 * PADDING) // LEADING)
+        for row in rows:
+            cells = self._cells(row)
+            while cells:
+                lines = max(len(cell) for cell in cells)
+                fit = int((self.body_height - used - 2 * PADDING) // LEADING)
+                if lines <= fit:
+                    add(cells, lines)
+                    cells = None
+                    done += 1
+                elif (page_rows and lines <= page_lines) or fit < 1:
+                    flush()
+                else:
+                    # Taller than a whole page: fill this one and carry the rest over
+                    add([cell[:fit] for cell in cells], fit)
+                    cells = [cell[fit:] for cell in cells]
+                    flush()
+
+        if page_rows or not page:
+            page += 1
+            self._draw_page(c, page, page_rows or [['No records.'] + [''] * (len(self.header) - 1)],
+                            heights or [self.line_height])
+            if progress:
+                progress(done, page)
+
+        c.save()
+        return done, page
+
+
+def pdf_response(report, rows, filename, as_attachment=True, progress=None):
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    report.render(rows, spool, progress=progress)
+    spool.seek(0)
+    return FileResponse(spool, as_attachment=as_attachment, filename=filename, content_type='application/pdf')
+
+
+# ---------- Report definitions ----------
+# No "generated at" stamp: exports are cached under their data version, so
+# the same file is served again until the data changes.
+def expense_report(period=''):
+    return TableReport(
+        "Expense Report",
+        [('Date', 1.2), ('Type', 1.4), ('Description', 5), ('Amount (PHP)', 1.4)],
+        subtitle=period,
+        wrap=(2,), align_right=(3,), pagesize=A4,
+    )
+
+
+def expense_pdf_rows(rows):
+    for day, expense_type, description, amount in rows:
+        yield day, expense_type, description, f"{amount:,.2f}"
+
+
+def activity_report(period=''):
+    return TableReport(
+        "Activity Report",
+        [('Date', 1.1), ('Crop', 1.5), ('Type', 1.3), ('Notes', 5),
+         ('Area (ha)', 1), ('Seed (kg)', 1), ('Fert (sacks)', 1), ('Spacing', 1.3)],
+        subtitle=period,
+        wrap=(1, 3, 7), align_right=(4, 5, 6),
+    )
@@ -0,0 +1,173 @@
+"""
+Slow-query log.
+
+SlowQueryMiddleware (middleware.py) wraps every connection during a request.
+A statement that takes SLOW_QUERY_MS or longer is logged (logger
+`myApp.slow_queries`) and stored with its fingerprint: the SQL with literals,
+parameters and IN/VALUES lists collapsed, so the same query with different
+ids groups together. Each fingerprint keeps a count, total and max time, and
+for its slowest run the SQL, parameters, calling view and query plan
+(`EXPLAIN QUERY PLAN` on SQLite, `EXPLAIN` elsewhere, SELECTs only).
+
+Rows live in the METRICS_DB SQLite file next to the request metrics, so a slow
+query never writes into the app database or its transaction. The plan is taken
+straight away (inside a savepoint when the request is in a transaction, so a
+failing EXPLAIN cannot break it), but the rows are only written once the
+response has been sent.
+`python manage.py slow_queries` prints the top offenders by total time.
+"""
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_PARAMS_CHARS = 2000
+NO_VIEW = '-'
+EXPLAIN_SAVEPOINT = 'slow_query_explain'
+
+_STRING = re.compile(r"'(?:''|[^'])*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROWS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_SPACE = re.compile(r'\s+')
+_EXPLAINABLE = re.compile(r'\s*(?:SELECT|WITH)\b', re.I)
+
+
+def normalize(sql):
+    """SQL with literals and placeholders as `?` and placeholder lists as `(...)`."""
+    sql = _STRING.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    sql = _ROWS.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    """(fingerprint, normalized SQL); the fingerprint is a short hash of the normalized text."""
+    normalized = normalize(sql)
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16], normalized
+
+
+def explain(connection, sql, params):
+    """
+    The query plan as text, via a bare backend cursor (no execute wrappers, so
+    no recursion). Inside atomic() it runs in its own savepoint, so an error
+    (which aborts the whole transaction on Postgres) is rolled back alone.
+    """
+    if not _EXPLAINABLE.match(sql):
+        return ''
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    savepoint = connection.in_atomic_block and connection.features.uses_savepoints
+    cursor = connection.create_cursor()
+    try:
+        if savepoint:
+            cursor.execute(connection.ops.savepoint_create_sql(EXPLAIN_SAVEPOINT))
+        try:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+        except connection.Database.Error as exc:
+            if savepoint:
+                cursor.execute(connection.ops.savepoint_rollback_sql(EXPLAIN_SAVEPOINT))
+            return f'EXPLAIN failed: {exc}'
+        finally:
+            if savepoint:
+                cursor.execute(connection.ops.savepoint_commit_sql(EXPLAIN_SAVEPOINT))
+    finally:
+        cursor.close()
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+class SlowQueryLogger:
+    """
+    execute_wrapper that collects statements slower than `threshold_ms` for
+    `request`'s view; flush() stores them (the middleware calls it once the
+    response is closed).
+    """
+
+    def __init__(self, request, threshold_ms):
+        self.request = request
+        self.threshold = threshold_ms / 1000
+        self.pending = []
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        result = execute(sql, params, many, context)
+        elapsed = time.perf_counter() - t0
+        if elapsed >= self.threshold:
+            match = self.request.resolver_match
+            plan = '' if many else explain(context['connection'], sql, params)
+            params_text = json.dumps(params, default=str)[:MAX_PARAMS_CHARS]
+            self.pending.append((sql, params_text, elapsed * 1000, match.view_name if match else NO_VIEW, plan))
+        return result
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        if pending:
+            record(pending)
+
+
+# ---------- SQLite store ----------
+def _connect():
+    conn = sqlite3.connect(settings.METRICS_DB, timeout=5)
+    conn.execute('CREATE TABLE IF NOT EXISTS slow_queries ('
+                 'fingerprint TEXT PRIMARY KEY, normalized TEXT NOT NULL, '
+                 'sql TEXT NOT NULL, params TEXT NOT NULL, view TEXT NOT NULL, plan TEXT NOT NULL, '
+                 'count INTEGER NOT NULL, total_ms REAL NOT NULL, max_ms REAL NOT NULL, '
+                 'first_seen REAL NOT NULL, last_seen REAL NOT NULL)')
+    return conn
+
+
+def record(entries):
+    """Store (sql, params as JSON, ms, view, plan) entries in one transaction."""
+    now = time.time()
+    rows = []
+    for sql, params_text, ms, view, plan in entries:
+        key, normalized = fingerprint(sql)
+        logger.warning("Slow query (%.1f ms) in %s [%s]: %s", ms, view, key, normalized)
+        rows.append((key, normalized, sql, params_text, view, plan, ms, ms, now, now))
+    conn = _connect()
+    try:
+        with conn:
+            # The worst run so far keeps its SQL, params, view and plan
+            conn.executemany(
+                'INSERT INTO slow_queries VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, ?, ?) '
+                'ON CONFLICT (fingerprint) DO UPDATE SET '
+                'count = count + 1, total_ms = total_ms + excluded.total_ms, last_seen = excluded.last_seen, '
+                'sql = CASE WHEN excluded.max_ms > max_ms THEN excluded.sql ELSE sql END, '
+                'params = CASE WHEN excluded.max_ms > max_ms THEN excluded.params ELSE params END, '
+                'view = CASE WHEN excluded.max_ms > max_ms THEN excluded.view ELSE view END, '
+                'plan = CASE WHEN excluded.max_ms > max_ms THEN excluded.plan ELSE plan END, '
+                'max_ms = MAX(max_ms, excluded.max_ms)',
+                rows)
+    except sqlite3.Error:
+        logger.exception("Could not store %d slow queries", len(rows))
+    finally:
+        conn.close()
+
+
+def top_offenders(limit=20, since=None):
+    """Fingerprint rows (dicts) ordered by total time, optionally only those seen after `since`."""
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute('SELECT * FROM slow_queries WHERE last_seen >= ? ORDER BY total_ms DESC LIMIT ?',
+                            (since or 0, limit))
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def reset():
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute('DELETE FROM slow_queries')
+    finally:
+        conn.close()
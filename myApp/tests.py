@@ -1,3 +1,1713 @@
-from django.test import TestCase
+import gzip
+import importlib
+import itertools
+import pstats
+import os
+import re
+import tempfile
+import time
+import traceback
+import tracemalloc
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from html.parser import HTMLParser
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse, QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from . import forecast_queue, metrics, reports, slow_queries
+from .middleware import SlowQueryMiddleware
+from .date_ranges import as_int, filter_period, month_bounds, period_q
+from .export_cache import cache_path
+from .export_jobs import claim_export_jobs, cleanup_export_jobs, render_export_job, start_export_job
+from .forecast_batch import CROP_FIELDS, CropTable, compute_forecasts_batch, planting_rows
+from .forecast_montecarlo import MC_FIELDS, add_percentiles, percentiles_for_activity
+from .forecast_scenarios import MAX_SCENARIOS, ScenarioError, evaluate_grid, parse_grid
+from .models import (Activity, Crop, CropRecompute, DashboardSummary, DataVersion, Expense, ExpenseRollup, ExportJob,
+                     Forecast, ForecastJob, LatestForecast, Reminder, User, compute_forecast_from_activity,
+                     rebuild_expense_rollups, save_forecast_for_activity)
+from .pagination import cached_count, format_cursor, keyset_page, parse_cursor
+
+
+@override_settings(FORECAST_SYNC=True)
+class BatchForecastTests(TestCase):
+    """compute_forecasts_batch must store exactly what the per-planting save path stores."""
+    FIELDS = ('expected_yield_kg', 'yield_min_kg', 'yield_max_kg', 'season_factor', 'input_factor',
+              'population_factor', 'harvest_start', 'harvest_end', 'notes')
+
+    def test_batch_matches_scalar_path_field_by_field(self):
+        rice = Crop.objects.create(name='Rice', ideal_seasons='Jun-Nov', yield_t_min=4, yield_t_max=6,
+                                   seed_rate_min_kg=40, seed_rate_max_kg=60, fert_sacks_min=4, fert_sacks_max=6)
+        corn = Crop.objects.create(name='Corn', ideal_seasons='Jan-Mar, Nov-Dec', yield_t_min=3, yield_t_max=5,
+                                   days_to_harvest_min=90, days_to_harvest_max=110)
+        mango = Crop.objects.create(name='Mango', ideal_seasons='May-Jul', yield_t_min=8, yield_t_max=12,
+                                    days_to_harvest_min=1000, days_to_harvest_max=1200)
+        bare = Crop.objects.create(name='Okra', ideal_seasons='Jan-Dec')  # no baselines
+        # A crop saved before season_factors existed: both paths fall back to parsing ideal_seasons
+        legacy = Crop.objects.create(name='Banana', ideal_seasons='Apr-Jun', yield_t_min=20, yield_t_max=30)
+        Crop.objects.filter(pk=legacy.pk).update(season_factors=[])
+
+        plantings = [
+            (rice, date(2024, 7, 1), dict(area_ha=2.0, seed_qty_kg=100, fert_sacks=10)),
+            (rice, date(2024, 12, 15), dict(area_ha=0.5, seed_qty_kg=45, fert_sacks=1)),   # shoulder month
+            (corn, date(2024, 2, 1), dict(area_ha=1.5)),
+            (corn, date(2024, 6, 1), dict(area_ha=1.0, seed_qty_kg=20)),                   # off season
+            (mango, date(2024, 6, 1), dict(area_ha=3.0, spacing='10x8 m')),
+            (mango, date(2024, 6, 1), dict(area_ha=3.0)),                                  # missing spacing
+            (mango, date(2024, 6, 1), dict(area_ha=1.0, spacing='close together')),        # unparseable
+            (bare, date(2024, 3, 1), dict(area_ha=1.0)),
+            (legacy, date(2024, 9, 1), dict(area_ha=0.0, spacing='300x300 cm')),
+        ]
+        activities = []
+        for i, (crop, day, inputs) in enumerate(plantings):
+            farmer = User.objects.create_user(username=f'farmer{i}', password='x', role='farmer')
+            activities.append(Activity.objects.create(farmer=farmer, crop=crop, activity_type='planting',
+                                                      date=day, **inputs))
+        # A bulk-created planting never had its spacing precompiled
+        Activity.objects.filter(pk=activities[-1].pk).update(trees_per_ha=None)
+        activities[-1].refresh_from_db()
+        Forecast.objects.all().delete()
+        for activity in activities:
+            activity.crop.refresh_from_db()
+            save_forecast_for_activity(activity)
+
+        rows = list(planting_rows(Activity.objects.filter(pk__in=[a.pk for a in activities]).order_by('pk')))
+        results = compute_forecasts_batch(rows, CropTable.from_queryset())
+        for activity, data in zip(activities, results):
+            forecast = Forecast.objects.get(farmer_id=activity.farmer_id, crop_id=activity.crop_id)
+            for field in self.FIELDS:
+                with self.subTest(crop=activity.crop.name, date=activity.date, field=field):
+                    self.assertEqual(data[field], getattr(forecast, field))
+        # The fixture reaches every branch: shoulder/off season, population factor, no baselines
+        self.assertEqual({r['season_factor'] for r in results}, {1.0, 0.9, 0.8})
+        self.assertNotEqual(results[4]['population_factor'], 1.0)
+        self.assertEqual(results[7]['notes'], 'Missing baseline yields for this crop.')
+
+    def test_unparseable_spacing_is_parsed_once_on_save(self):
+        mango = Crop.objects.create(name='Mango', ideal_seasons='May-Jul', yield_t_min=8, yield_t_max=12)
+        farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        activity = Activity.objects.create(farmer=farmer, crop=mango, activity_type='planting',
+                                           date=date(2024, 6, 1), spacing='close together')
+        self.assertEqual(activity.trees_per_ha, 0.0)
+
+        with mock.patch('myApp.models._parse_spacing') as parse:
+            self.assertEqual(compute_forecast_from_activity(activity)['population_factor'], 1.0)
+        parse.assert_not_called()
+
+
+@override_settings(FORECAST_SYNC=False)
+class ForecastQueueTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        self.crop = Crop.objects.create(name='Rice', ideal_seasons='Jun-Nov', yield_t_min=4, yield_t_max=6,
+                                        days_to_harvest_min=100, days_to_harvest_max=120)
+
+    def _plant(self, crop=None, area=1.0):
+        # In season, so the season factor is 1 and a hectare yields the 5 t midpoint
+        return Activity.objects.create(farmer=self.farmer, crop=crop or self.crop, activity_type='planting',
+                                       date=date(2024, 7, 1), area_ha=area)
+
+    def test_sync_setting_saves_forecast_inline(self):
+        with override_settings(FORECAST_SYNC=True):
+            self._plant()
+        self.assertFalse(ForecastJob.objects.exists())
+        self.assertEqual(Forecast.objects.get(farmer=self.farmer).expected_yield_kg, 5000)
+
+    def test_planting_is_queued_and_drained(self):
+        self._plant()
+        self.assertFalse(Forecast.objects.exists())
+        self.assertEqual(ForecastJob.objects.get().status, 'pending')
+
+        self.assertEqual(forecast_queue.drain(), 1)
+        self.assertFalse(ForecastJob.objects.exists())
+        self.assertEqual(Forecast.objects.get(farmer=self.farmer).expected_yield_kg, 5000)
+
+    def test_claimed_jobs_are_not_claimed_twice(self):
+        self._plant()
+        self.assertEqual(len(forecast_queue.claim_jobs('worker-a')), 1)
+        self.assertEqual(forecast_queue.claim_jobs('worker-b'), [])
+        self.assertEqual(ForecastJob.objects.get().claimed_by, 'worker-a')
+
+    def test_stale_running_job_is_reclaimed_after_five_minutes(self):
+        self._plant()
+        forecast_queue.claim_jobs('worker-a')
+
+        ForecastJob.objects.update(claimed_at=timezone.now() - timedelta(minutes=4))
+        self.assertEqual(forecast_queue.claim_jobs('worker-b'), [])
+        ForecastJob.objects.update(claimed_at=timezone.now() - timedelta(minutes=6))
+        [job] = forecast_queue.claim_jobs('worker-b')
+        self.assertEqual(job.claimed_by, 'worker-b')
+
+    def test_newest_job_per_farmer_and_crop_wins(self):
+        other = Crop.objects.create(name='Corn', ideal_seasons='May-Aug', yield_t_min=3, yield_t_max=5)
+        self._plant(area=1.0)
+        self._plant(area=2.0)
+        self._plant(crop=other)
+        jobs = list(ForecastJob.objects.order_by('id'))
+
+        winners, superseded = forecast_queue.merge_jobs(jobs)
+        self.assertEqual(sorted(j.id for j in winners), [jobs[1].id, jobs[2].id])
+        self.assertEqual(superseded, [jobs[0]])
+
+        forecast_queue.drain()
+        self.assertEqual(Forecast.objects.get(crop=self.crop).expected_yield_kg, 10000)  # the 2 ha planting
+
+    def test_release_backs_off_then_fails_at_max_attempts(self):
+        self._plant()
+        [job] = forecast_queue.claim_jobs('worker-a')
+        before = timezone.now()
+        forecast_queue._release([job], 'locked', retry=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.claimed_by), ('pending', 1, ''))
+        self.assertGreaterEqual(job.available_at, before + timedelta(seconds=2))
+
+        job.attempts = forecast_queue.MAX_ATTEMPTS - 1
+        forecast_queue._release([job], 'locked', retry=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', forecast_queue.MAX_ATTEMPTS))
+
+    def test_lock_error_reschedules_and_other_errors_fail(self):
+        self._plant()
+        with mock.patch.object(forecast_queue, 'compute_forecasts_batch',
+                               side_effect=OperationalError('database is locked')):
+            self.assertEqual(forecast_queue.process_batch('worker-a'), (1, 0))
+        self.assertEqual(ForecastJob.objects.get().status, 'pending')
+
+        ForecastJob.objects.update(available_at=timezone.now())
+        with mock.patch.object(forecast_queue, 'compute_forecasts_batch', side_effect=ValueError('bad row')):
+            with self.assertLogs('myApp.forecast_queue', 'ERROR') as logs:
+                self.assertEqual(forecast_queue.process_batch('worker-a'), (1, 0))
+        self.assertIn('ValueError: bad row', logs.output[0])
+        self.assertEqual(ForecastJob.objects.get().status, 'failed')
+
+    def test_only_the_failing_farmer_crop_is_failed(self):
+        crops = [self.crop] + [Crop.objects.create(name=f'Crop {i}', ideal_seasons='Jun-Nov', yield_t_min=4,
+                                                   yield_t_max=6) for i in range(4)]
+        bad = crops[2]
+        for crop in crops:
+            self._plant(crop=crop)
+        self._plant(crop=bad, area=2.0)   # a second job for the failing pair; both are failed together
+        real = forecast_queue.compute_forecasts_batch
+
+        def compute(rows, crop_table):
+            if any(row[2] == bad.id for row in rows):
+                raise ValueError('bad row')
+            return real(rows, crop_table)
+
+        with mock.patch.object(forecast_queue, 'compute_forecasts_batch', side_effect=compute):
+            with self.assertLogs('myApp.forecast_queue', 'ERROR'):
+                self.assertEqual(forecast_queue.drain(), 4)
+        self.assertEqual(set(Forecast.objects.values_list('crop_id', flat=True)), {c.id for c in crops} - {bad.id})
+        self.assertEqual(list(ForecastJob.objects.values_list('crop_id', 'status')), [(bad.id, 'failed')] * 2)
+
+    def test_lock_error_mid_bisect_reschedules_the_rest(self):
+        other = Crop.objects.create(name='Corn', ideal_seasons='May-Aug', yield_t_min=3, yield_t_max=5)
+        self._plant()
+        self._plant(crop=other)
+        # The whole batch fails, then the first half hits a lock while bisecting
+        errors = [ValueError('bad row'), OperationalError('database is locked')]
+        with mock.patch.object(forecast_queue, 'compute_forecasts_batch', side_effect=errors):
+            self.assertEqual(forecast_queue.process_batch('worker-a'), (2, 0))
+        self.assertEqual(set(ForecastJob.objects.values_list('status', 'attempts')), {('pending', 1)})
+
+    def test_reclaiming_a_stale_job_costs_an_attempt(self):
+        self._plant()
+        forecast_queue.claim_jobs('worker-a')
+        for attempt in range(1, forecast_queue.MAX_ATTEMPTS):
+            ForecastJob.objects.update(claimed_at=timezone.now() - timedelta(minutes=6))   # the worker died
+            [job] = forecast_queue.claim_jobs('worker-b')
+            self.assertEqual(job.attempts, attempt)
+
+        ForecastJob.objects.update(claimed_at=timezone.now() - timedelta(minutes=6))
+        self.assertEqual(forecast_queue.claim_jobs('worker-c'), [])
+        job = ForecastJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ('failed', forecast_queue.MAX_ATTEMPTS))
+
+    def test_worker_survives_a_failing_step(self):
+        self._plant()
+        err = StringIO()
+        with mock.patch.object(forecast_queue.CropTable, 'from_queryset', side_effect=ValueError('bad crop')):
+            call_command('run_forecast_worker', '--once', stdout=StringIO(), stderr=err)
+        self.assertIn('ValueError: bad crop', err.getvalue())
+        self.assertNotIn('busy', err.getvalue())
+
+
+@override_settings(FORECAST_SYNC=True, FORECAST_MC_SAMPLES=500, FORECAST_MC_SEED=7)
+class MonteCarloForecastTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        rice = Crop.objects.create(name='Rice', ideal_seasons='Jun-Nov', yield_t_min=4, yield_t_max=6,
+                                   days_to_harvest_min=100, days_to_harvest_max=120)
+        corn = Crop.objects.create(name='Corn', ideal_seasons='May-Aug', yield_t_min=3, yield_t_max=5,
+                                   days_to_harvest_min=90, days_to_harvest_max=110)
+        mango = Crop.objects.create(name='Mango', ideal_seasons='Dec-Feb', yield_t_min=8, yield_t_max=12,
+                                    days_to_harvest_min=120, days_to_harvest_max=150)
+        okra = Crop.objects.create(name='Okra', ideal_seasons='Mar-Jun')   # no baselines
+        self.plantings = [
+            Activity.objects.create(farmer=self.farmer, crop=rice, activity_type='planting',
+                                    date=date(2024, 7, 1), area_ha=2.0, seed_qty_kg=80, fert_sacks=8),
+            Activity.objects.create(farmer=self.farmer, crop=corn, activity_type='planting',
+                                    date=date(2024, 11, 5), area_ha=0.5),
+            Activity.objects.create(farmer=self.farmer, crop=mango, activity_type='planting',
+                                    date=date(2024, 1, 10), area_ha=3.0, spacing='10x8 m'),
+            Activity.objects.create(farmer=self.farmer, crop=okra, activity_type='planting',
+                                    date=date(2024, 4, 1)),
+        ]
+        self.rows = list(planting_rows(Activity.objects.filter(farmer=self.farmer).order_by('id')))
+        self.table = CropTable.from_queryset()
+
+    def _batch(self, **kwargs):
+        return add_percentiles(self.rows, compute_forecasts_batch(self.rows, self.table), self.table, **kwargs)
+
+    def test_same_seed_gives_the_same_percentiles(self):
+        first, again = self._batch(), self._batch()
+        self.assertEqual([{f: r[f] for f in MC_FIELDS} for r in first],
+                         [{f: r[f] for f in MC_FIELDS} for r in again])
+        other = self._batch(seed=8)
+        self.assertNotEqual(first[0]['yield_p50_kg'], other[0]['yield_p50_kg'])
+
+    def test_percentiles_are_ordered_and_inside_the_range(self):
+        for planting, result in zip(self.plantings[:3], self._batch()):
+            with self.subTest(crop=planting.crop.name):
+                self.assertLessEqual(result['yield_p10_kg'], result['yield_p50_kg'])
+                self.assertLessEqual(result['yield_p50_kg'], result['yield_p90_kg'])
+                self.assertLess(result['yield_p10_kg'], result['yield_p90_kg'])
+                self.assertLessEqual(result['harvest_p10'], result['harvest_p50'])
+                self.assertLessEqual(result['harvest_p50'], result['harvest_p90'])
+                crop = planting.crop
+                self.assertGreaterEqual(result['harvest_p10'],
+                                        planting.date + timedelta(days=crop.days_to_harvest_min))
+                self.assertLessEqual(result['harvest_p90'], planting.date + timedelta(days=crop.days_to_harvest_max))
+                # Noise is clamped like the deterministic factor: 0.5..1.3 × the baseline range
+                self.assertGreaterEqual(result['yield_p10_kg'], crop.yield_t_min * 1000 * planting.area_ha * 0.5)
+                self.assertLessEqual(result['yield_p90_kg'], crop.yield_t_max * 1000 * planting.area_ha * 1.3)
+
+    def test_missing_baseline_gets_no_percentiles(self):
+        self.assertEqual({f: self._batch()[3][f] for f in MC_FIELDS}, dict.fromkeys(MC_FIELDS))
+
+    def test_batch_matches_each_planting_alone(self):
+        with mock.patch('myApp.forecast_montecarlo.CHUNK_CELLS', 1000):   # two plantings per pass
+            batch = self._batch()
+        for planting, result in zip(self.plantings, batch):
+            with self.subTest(crop=planting.crop.name):
+                alone = percentiles_for_activity(planting)
+                self.assertEqual({f: result[f] for f in MC_FIELDS}, alone)
+
+    def test_percentiles_are_saved_on_the_forecast(self):
+        with override_settings(FORECAST_MONTE_CARLO=True):
+            planting = Activity.objects.create(farmer=self.farmer, crop=self.plantings[0].crop,
+                                               activity_type='planting', date=date(2024, 7, 1), area_ha=2.0)
+        forecast = Forecast.objects.get(farmer=self.farmer, crop=planting.crop)
+        expected = percentiles_for_activity(planting)
+        self.assertEqual({f: getattr(forecast, f) for f in MC_FIELDS}, expected)
+
+        # The queued path writes the same numbers through the batch engine
+        Forecast.objects.all().delete()
+        with override_settings(FORECAST_MONTE_CARLO=True, FORECAST_SYNC=False):
+            planting.save()
+            forecast_queue.drain()
+        forecast = Forecast.objects.get(farmer=self.farmer, crop=planting.crop)
+        self.assertEqual({f: getattr(forecast, f) for f in MC_FIELDS}, expected)
+
+        with override_settings(FORECAST_MONTE_CARLO=False):
+            planting.save()
+        forecast = Forecast.objects.get(farmer=self.farmer, crop=planting.crop)
+        self.assertIsNone(forecast.yield_p50_kg)   # range-only forecasts leave them empty
+
+
+@override_settings(FORECAST_SYNC=False)
+class CropRecomputeTests(TestCase):
+    def setUp(self):
+        self.crop = Crop.objects.create(name='Rice', ideal_seasons='Jun-Nov', yield_t_min=4, yield_t_max=6)
+        for i in range(5):
+            farmer = User.objects.create_user(username=f'farmer{i}', password='x', role='farmer')
+            Activity.objects.create(farmer=farmer, crop=self.crop, activity_type='planting',
+                                    date=date(2024, 7, 1), area_ha=1.0)
+
+    def _edit_baseline(self, yield_t_max):
+        self.crop.yield_t_max = yield_t_max
+        self.crop.save()
+        return CropRecompute.objects.get(crop=self.crop, status__in=('pending', 'running'))
+
+    def _edit_baseline_done(self, yield_t_max):
+        self.crop.yield_t_max = yield_t_max
+        self.crop.save()
+        return CropRecompute.objects.get(crop=self.crop)
+
+    def _expected_yields(self):
+        return set(Forecast.objects.filter(crop=self.crop).values_list('expected_yield_kg', flat=True))
+
+    def test_recompute_advances_in_chunks(self):
+        job = self._edit_baseline(8)
+        self.assertEqual(job.changed_fields, 'yield_t_max')
+
+        self.assertFalse(forecast_queue.recompute_chunk(job, chunk_size=2))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.total, job.processed), ('running', 5, 2))
+        self.assertEqual(Forecast.objects.filter(crop=self.crop).count(), 2)
+
+        forecast_queue.run_crop_recompute(job, chunk_size=2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), ('done', 5))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(self._expected_yields(), {6000})
+
+    def test_baseline_edit_mid_run_restarts_it(self):
+        job = self._edit_baseline(8)
+        forecast_queue.recompute_chunk(job, chunk_size=2)
+
+        self.crop.yield_t_min = 6
+        restarted = self._edit_baseline(10)
+        self.assertEqual(restarted.pk, job.pk)
+        self.assertEqual((restarted.status, restarted.cursor, restarted.processed, restarted.total),
+                         ('pending', 0, 0, None))
+        self.assertEqual(restarted.changed_fields, 'yield_t_max,yield_t_min')
+
+        # The worker's copy of the job is stale; its next chunk gives way to the restart
+        self.assertFalse(forecast_queue.recompute_chunk(job, chunk_size=2))
+        self.assertEqual(CropRecompute.objects.get(pk=job.pk).processed, 0)
+
+        forecast_queue.run_crop_recompute(restarted, chunk_size=2)
+        self.assertEqual(self._expected_yields(), {8000})  # every farmer on the latest baselines
+
+    def test_stale_copy_does_not_advance_the_cursor(self):
+        job = self._edit_baseline(8)
+        forecast_queue.recompute_chunk(job, chunk_size=2)
+        stale = CropRecompute.objects.get(pk=job.pk)
+        forecast_queue.recompute_chunk(job, chunk_size=2)  # another worker moves on
+
+        self.assertFalse(forecast_queue.recompute_chunk(stale, chunk_size=2))
+        saved = CropRecompute.objects.get(pk=job.pk)
+        self.assertEqual((saved.processed, saved.cursor), (4, job.cursor))
+        self.assertEqual((stale.processed, stale.cursor), (4, job.cursor))  # refreshed from the row
+
+    def test_crop_edit_request_queues_without_recomputing(self):
+        # Settings as shipped: no FORECAST_SYNC, so the worker does the recompute
+        farmer = User.objects.get(username='farmer0')
+        self.client.force_login(farmer)
+        with mock.patch.object(forecast_queue, 'recompute_chunk') as chunk:
+            response = self.client.post(reverse('activity_log'), {
+                'edit_crop': '1', 'crop_id': self.crop.pk, 'name': 'Rice', 'ideal_seasons': 'May-Oct'}, follow=True)
+        chunk.assert_not_called()
+        self.assertContains(response, 'refresh in the background')
+        job = CropRecompute.objects.get(crop=self.crop)
+        self.assertEqual((job.status, job.processed, job.changed_fields), ('pending', 0, 'ideal_seasons'))
+        self.assertFalse(Forecast.objects.filter(crop=self.crop).exists())
+
+    @override_settings(FORECAST_SYNC=True, CROP_RECOMPUTE_INLINE_MAX=5)
+    def test_sync_recomputes_small_crops_inline_only(self):
+        self.assertEqual(self._edit_baseline_done(8).status, 'done')
+        self.assertEqual(self._expected_yields(), {6000})
+
+        Activity.objects.create(farmer=User.objects.get(username='farmer0'), crop=self.crop,
+                                activity_type='planting', date=date(2024, 7, 2), area_ha=1.0)
+        self.assertEqual(self._edit_baseline(10).status, 'pending')   # 6 plantings: left to the worker
+
+    def test_worker_step_runs_the_oldest_recompute(self):
+        job = self._edit_baseline(8)
+        while forecast_queue.process_recompute_chunk(chunk_size=2):
+            pass
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(self._expected_yields(), {6000})
+
+
+class ForecastScenarioTests(TestCase):
+    DEFAULTS = {'area': 1.0, 'seed': 0.0, 'fert': 0.0, 'spacing': None}
+
+    def setUp(self):
+        self.mango = Crop.objects.create(name='Mango', ideal_seasons='Dec-Feb', yield_t_min=8, yield_t_max=12,
+                                         seed_rate_min_kg=2, seed_rate_max_kg=4, fert_sacks_min=3, fert_sacks_max=5,
+                                         days_to_harvest_min=120, days_to_harvest_max=150)
+
+    def test_grid_cells_match_the_scalar_forecast(self):
+        axes = {'area': [0.5, 2.0], 'seed': [0.0, 3.0, 12.0], 'fert': [0.0, 4.0, 20.0], 'spacing': [None, 8.0, 12.0]}
+        for month in (1, 7):   # in season and off season
+            surface = evaluate_grid(tuple(getattr(self.mango, f) for f in CROP_FIELDS), month, axes)
+            self.assertEqual(surface['shape'], [2, 3, 3, 3])
+            cells = itertools.product(*(axes[a] for a in ('area', 'seed', 'fert', 'spacing')))
+            for i, (area, seed, fert, spacing) in enumerate(cells):
+                with self.subTest(month=month, area=area, seed=seed, fert=fert, spacing=spacing):
+                    planting = Activity(crop=self.mango, activity_type='planting', date=date(2024, month, 15),
+                                        area_ha=area, seed_qty_kg=seed, fert_sacks=fert,
+                                        spacing=f'{spacing:g}x{spacing:g} m' if spacing else None)
+                    scalar = compute_forecast_from_activity(planting)
+                    self.assertAlmostEqual(surface['yield_min_kg'][i], scalar['yield_min_kg'], places=1)
+                    self.assertAlmostEqual(surface['yield_max_kg'][i], scalar['yield_max_kg'], places=1)
+                    self.assertAlmostEqual(surface['combined'][i],
+                                           scalar['yield_max_kg'] / (12000 * area), places=3)
+            self.assertEqual(surface['season_factor'], compute_forecast_from_activity(planting)['season_factor'])
+
+    def test_missing_baselines_report_an_error(self):
+        okra = Crop.objects.create(name='Okra', ideal_seasons='Mar-Jun')
+        surface = evaluate_grid(tuple(getattr(okra, f) for f in CROP_FIELDS), 4, parse_grid({}, self.DEFAULTS))
+        self.assertEqual(surface['error'], 'Missing baseline yields for this crop.')
+        self.assertNotIn('yield_min_kg', surface)
+
+    def test_parse_grid_accepts_ranges_lists_and_defaults(self):
+        axes = parse_grid({'area': '1:3:3', 'seed': '2,4', 'fert': ' 5 ', 'spacing': ''}, self.DEFAULTS)
+        self.assertEqual(axes, {'area': [1.0, 2.0, 3.0], 'seed': [2.0, 4.0], 'fert': [5.0], 'spacing': [None]})
+
+    def test_parse_grid_rejects_bad_grids(self):
+        bad = {
+            'malformed range': {'area': '1:5'},
+            'not a number': {'seed': 'lots'},
+            'fractional count': {'fert': '1:5:2.5'},
+            'zero count': {'fert': '1:5:0'},
+            'count over the limit': {'seed': f'1:5:{MAX_SCENARIOS + 1}'},
+            'too many combinations': {'area': '1:2:100', 'seed': '0:10:101'},
+            'negative': {'fert': '-1,2'},
+            'not finite': {'spacing': 'inf'},
+            'nan': {'seed': 'nan'},
+            'zero area': {'area': '0,1'},
+        }
+        for label, params in bad.items():
+            with self.subTest(label):
+                with self.assertRaises(ScenarioError):
+                    parse_grid(params, self.DEFAULTS)
+        self.assertEqual(len(parse_grid({'area': '1:2:100', 'seed': '0:10:100'}, self.DEFAULTS)['seed']), 100)
+
+    def test_endpoint_returns_400_for_bad_grids(self):
+        farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        self.client.force_login(farmer)
+        url = reverse('forecast_scenarios')
+        response = self.client.get(url, {'crop': self.mango.pk, 'month': 1, 'area': '1:2:200', 'seed': '0:1:60'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('limit is', response.json()['error'])
+        self.assertEqual(self.client.get(url, {'crop': self.mango.pk, 'month': 13}).status_code, 400)
+        response = self.client.get(url, {'crop': self.mango.pk, 'month': 1, 'area': '1,2'})
+        self.assertEqual(response.json()['shape'], [2, 1, 1, 1])
+
+
+@override_settings(FORECAST_SYNC=True)
+class DashboardSummaryTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        self.crop = Crop.objects.create(name='Rice', ideal_seasons='Jun-Nov', yield_t_min=4, yield_t_max=6)
+        self.today = timezone.now().date()
+        Activity.objects.create(farmer=self.farmer, crop=self.crop, activity_type='planting',
+                                date=self.today, area_ha=1.0)
+        Expense.objects.create(farmer=self.farmer, expense_type='seed', amount=Decimal('150.00'), date=self.today)
+        Reminder.objects.create(farmer=self.farmer, message='Weed the paddy', due_date=self.today + timedelta(days=2))
+        self.client.force_login(self.farmer)
+
+    def test_dashboard_reads_summary_in_three_queries(self):
+        self.client.get(reverse('farmer_dashboard'))  # first view builds the summary
+
+        # session + user + summary
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('farmer_dashboard'))
+        self.assertEqual(response.context['crop_count'], 1)
+        self.assertEqual(response.context['total_expenses'], Decimal('150.00'))
+        self.assertEqual(len(response.context['forecasts']), 1)
+        self.assertContains(response, 'Weed the paddy')
+
+    def test_signals_keep_summary_current(self):
+        self.client.get(reverse('farmer_dashboard'))
+        with CaptureQueriesContext(connection) as ctx:
+            Expense.objects.create(farmer=self.farmer, expense_type='labor', amount=Decimal('50.00'),
+                                   date=self.today)
+            reminder = Reminder.objects.create(farmer=self.farmer, message='Buy urea', due_date=self.today)
+        # Saves only flag their sections; nothing is recomputed until the next view
+        summary_sql = [q['sql'] for q in ctx.captured_queries if 'myApp_dashboardsummary' in q['sql']]
+        self.assertEqual(len(summary_sql), 2)
+        self.assertTrue(all(sql.startswith('UPDATE') for sql in summary_sql))
+
+        # session + user + summary, clear the flags, the two stale sections, store
+        with self.assertNumQueries(9):
+            response = self.client.get(reverse('farmer_dashboard'))
+        self.assertEqual(response.context['total_expenses'], Decimal('200.00'))
+        self.assertContains(response, 'Buy urea')
+        with self.assertNumQueries(3):
+            self.client.get(reverse('farmer_dashboard'))
+
+        reminder.delete()
+        response = self.client.get(reverse('farmer_dashboard'))
+        self.assertNotContains(response, 'Buy urea')
+
+    def test_stale_summary_is_rebuilt(self):
+        self.client.get(reverse('farmer_dashboard'))
+        DashboardSummary.objects.filter(farmer=self.farmer).update(as_of=self.today - timedelta(days=1), crop_count=0)
+
+        response = self.client.get(reverse('farmer_dashboard'))
+        self.assertEqual(response.context['crop_count'], 1)
+
+    def test_rebuild_command(self):
+        call_command('rebuild_dashboard_summaries', stdout=StringIO())
+        summary = DashboardSummary.objects.get(farmer=self.farmer)
+        self.assertEqual(summary.as_of, self.today)
+        self.assertEqual(summary.month_expense_total, Decimal('150.00'))
+
+
+class ExpenseRollupTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        self.other = User.objects.create_user(username='other', password='x', role='farmer')
+        for day, kind, amount in [(date(2024, 5, 3), 'seed', '100.00'), (date(2024, 5, 20), 'seed', '40.00'),
+                                  (date(2024, 5, 9), 'labor', '75.50'), (date(2024, 6, 1), 'seed', '10.00')]:
+            Expense.objects.create(farmer=self.farmer, expense_type=kind, amount=Decimal(amount), date=day)
+        Expense.objects.create(farmer=self.other, expense_type='seed', amount=Decimal('5.00'), date=date(2024, 5, 3))
+        self.expense = Expense.objects.get(farmer=self.farmer, amount=Decimal('40.00'))
+
+    def _rollups(self):
+        return list(ExpenseRollup.objects.order_by('farmer_id', 'year', 'month', 'expense_type')
+                    .values_list('farmer_id', 'year', 'month', 'expense_type', 'total', 'count',
+                                 'min_amount', 'max_amount'))
+
+    def assertMatchesRebuild(self):
+        incremental = self._rollups()
+        rebuild_expense_rollups()
+        self.assertEqual(incremental, self._rollups())
+
+    def test_create_matches_rebuild(self):
+        self.assertMatchesRebuild()
+        may_seed = ExpenseRollup.objects.get(farmer=self.farmer, year=2024, month=5, expense_type='seed')
+        self.assertEqual((may_seed.total, may_seed.count, may_seed.min_amount, may_seed.max_amount),
+                         (Decimal('140.00'), 2, Decimal('40.00'), Decimal('100.00')))
+
+    def test_edits_across_month_year_and_type_match_rebuild(self):
+        for change in ({'date': date(2024, 6, 15)}, {'date': date(2023, 6, 15)}, {'expense_type': 'labor'},
+                       {'amount': Decimal('41.00')}, {'date': date(2024, 5, 20), 'expense_type': 'seed'}):
+            for field, value in change.items():
+                setattr(self.expense, field, value)
+            self.expense.save()
+            with self.subTest(change=change):
+                self.assertMatchesRebuild()
+
+        # An instance loaded from a list (no signals at load time) still moves its old bucket
+        expense = Expense.objects.filter(pk=self.expense.pk).select_related('farmer').get()
+        expense.date = date(2025, 1, 1)
+        expense.save(update_fields=['date'])
+        self.assertMatchesRebuild()
+        self.assertEqual(ExpenseRollup.objects.get(farmer=self.farmer, year=2024, month=5, expense_type='seed').count, 1)
+
+    def test_delete_empties_the_bucket(self):
+        Expense.objects.get(farmer=self.farmer, date=date(2024, 6, 1)).delete()
+        self.assertFalse(ExpenseRollup.objects.filter(farmer=self.farmer, month=6).exists())
+        Expense.objects.filter(farmer=self.farmer, expense_type='labor').delete()
+        self.assertMatchesRebuild()
+
+    def test_rebuild_command_for_one_farmer(self):
+        ExpenseRollup.objects.all().delete()
+        call_command('rebuild_expense_rollups', '--farmer', str(self.other.pk), stdout=StringIO())
+        self.assertEqual(ExpenseRollup.objects.filter(farmer=self.other).count(), 1)
+        self.assertFalse(ExpenseRollup.objects.filter(farmer=self.farmer).exists())
+
+
+class DateRangeTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        for day, amount in [(date(2023, 12, 31), '1.00'), (date(2024, 1, 1), '2.00'), (date(2024, 2, 29), '4.00'),
+                            (date(2024, 12, 1), '8.00'), (date(2024, 12, 31), '16.00'), (date(2025, 1, 1), '32.00')]:
+            Expense.objects.create(farmer=self.farmer, expense_type='seed', amount=Decimal(amount), date=day)
+
+    def _days(self, year=None, month=None):
+        return sorted(filter_period(Expense.objects.all(), year, month).values_list('date', flat=True))
+
+    def test_december_rolls_over_into_next_year(self):
+        self.assertEqual(month_bounds(2024, 12), (date(2024, 12, 1), date(2025, 1, 1)))
+        self.assertEqual(month_bounds(2024, 2), (date(2024, 2, 1), date(2024, 3, 1)))
+        self.assertEqual(self._days(2024, 12), [date(2024, 12, 1), date(2024, 12, 31)])
+        self.assertEqual(self._days(2024), [date(2024, 1, 1), date(2024, 2, 29), date(2024, 12, 1),
+                                            date(2024, 12, 31)])
+        self.assertEqual(self._days(2024, 2), [date(2024, 2, 29)])
+
+    def test_month_without_year_covers_every_year(self):
+        self.assertEqual(self._days(month=12), [date(2023, 12, 31), date(2024, 12, 1), date(2024, 12, 31)])
+        self.assertEqual(self._days(month=1), [date(2024, 1, 1), date(2025, 1, 1)])
+        self.assertEqual(filter_period(Expense.objects.none(), month=1).count(), 0)
+        self.assertEqual(filter_period(Expense.objects.filter(amount=0), month=1).count(), 0)
+        self.assertEqual(period_q(month=3), Q(pk__in=[]))           # no years given → nothing
+        self.assertIsNone(period_q())
+
+    def test_invalid_periods_match_nothing(self):
+        for year, month in [(2024, 0), (2024, 13), (None, 13), (None, -1), (10000, 1), (0, None)]:
+            with self.subTest(year=year, month=month):
+                self.assertEqual(self._days(year, month), [])
+
+    def test_invalid_period_strings_on_the_expense_log(self):
+        self.assertEqual([as_int(v) for v in ('12', ' 7 ', '', 'None', 'null', 'undefined', 'abc', '1.5', None)],
+                         [12, 7, None, None, None, None, None, None, None])
+        self.client.force_login(self.farmer)
+        for params, total in [({'year': 'abc', 'month': 'x'}, Decimal('63.00')),   # both ignored
+                              ({'year': '', 'month': '12'}, Decimal('25.00')),
+                              ({'year': '2024', 'month': '13'}, 0),
+                              ({'year': '99999'}, 0)]:
+            with self.subTest(params=params):
+                response = self.client.get(reverse('expense_log'), params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['total'] or 0, total)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        self.crop = Crop.objects.create(name='Corn', ideal_seasons='May-Aug')
+        # Three rows share each date, so every page boundary has ties to break by id
+        for i in range(8):
+            Activity.objects.create(farmer=self.farmer, crop=self.crop, activity_type='watering',
+                                    date=date(2024, 5, 1) + timedelta(days=i // 3))
+        self.activities = Activity.objects.filter(farmer=self.farmer)
+        self.newest_first = list(self.activities.order_by('-date', '-id'))
+
+    def _walk(self, params, direction):
+        pages = []
+        while True:
+            page = keyset_page(self.activities, params, size=3)
+            pages.append(page.items)
+            query = page.next_query if direction == 'after' else page.prev_query
+            if not query:
+                return pages
+            params = QueryDict(query)
+
+    def test_parse_cursor_rejects_bad_input(self):
+        for value in (None, '', 'junk', '2024-05-01', '2024-05-01_', '2024-13-01_4', '2024-05-01_x',
+                      '2024-05-01_4_5', '_4'):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_cursor(value))
+        self.assertEqual(parse_cursor('2024-05-01_4'), (date(2024, 5, 1), 4))
+        self.assertEqual(parse_cursor(format_cursor(self.newest_first[0])),
+                         (self.newest_first[0].date, self.newest_first[0].pk))
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        page = keyset_page(self.activities, QueryDict('after=nonsense&crop=1'), size=3)
+        self.assertEqual(page.items, self.newest_first[:3])
+        self.assertFalse(page.has_prev)
+        self.assertIn('crop=1', page.next_query)
+
+    def test_after_walks_every_row_once_across_ties(self):
+        pages = self._walk(QueryDict(), 'after')
+        self.assertEqual([len(p) for p in pages], [3, 3, 2])
+        self.assertEqual([a for p in pages for a in p], self.newest_first)
+
+    def test_before_walks_back_to_the_first_page(self):
+        last = keyset_page(self.activities, QueryDict('after=' + format_cursor(self.newest_first[5])), size=3)
+        self.assertEqual(last.items, self.newest_first[6:])
+        self.assertFalse(last.has_next)
+        self.assertTrue(last.has_prev)
+
+        pages = self._walk(QueryDict(last.prev_query), 'before')
+        self.assertEqual(pages, [self.newest_first[3:6], self.newest_first[:3]])
+        first = keyset_page(self.activities, QueryDict(last.prev_query), size=3)
+        self.assertTrue(first.has_next)                     # coming back, the page we left is still there
+
+    def test_single_page_has_no_links(self):
+        page = keyset_page(self.activities, QueryDict(), size=50)
+        self.assertEqual(page.items, self.newest_first)
+        self.assertFalse(page.has_other_pages)
+        empty = keyset_page(Activity.objects.none(), QueryDict('after=2024-05-01_1'), size=3)
+        self.assertEqual((empty.items, empty.has_other_pages), ([], False))
+
+    def _counted(self, queryset, farmer_id):
+        """(count, SQL verbs run) for one cached_count call."""
+        with CaptureQueriesContext(connection) as ctx:
+            count = cached_count(queryset, farmer_id, {'list': 'activities'})
+        return count, [q['sql'].split()[0] for q in ctx.captured_queries]
+
+    def test_cached_count_never_writes(self):
+        cache.clear()
+        self.assertEqual(self._counted(self.activities, self.farmer.pk), (8, ['SELECT', 'SELECT']))
+        self.assertEqual(self._counted(self.activities, self.farmer.pk), (8, ['SELECT']))   # version only
+        Activity.objects.create(farmer=self.farmer, crop=self.crop, activity_type='watering', date=date(2024, 6, 1))
+        self.assertEqual(self._counted(self.activities, self.farmer.pk)[0], 9)
+
+        # A user with no DataVersion row yet gets a fresh count and no row
+        newcomer = User.objects.create_user(username='new', password='x', role='farmer')
+        none = Activity.objects.filter(farmer=newcomer)
+        for _ in range(2):
+            self.assertEqual(self._counted(none, newcomer.pk), (0, ['SELECT', 'SELECT']))
+        self.assertFalse(DataVersion.objects.filter(farmer=newcomer).exists())
+        # ...until their first save creates it
+        Activity.objects.create(farmer=newcomer, crop=self.crop, activity_type='watering', date=date(2024, 6, 1))
+        self.assertEqual(DataVersion.objects.get(farmer=newcomer).version, 1)
+        self.assertEqual(self._counted(none, newcomer.pk)[0], 1)
+
+    def test_migration_seeds_a_version_row_per_user(self):
+        newcomer = User.objects.create_user(username='new', password='x', role='farmer')
+        seed = importlib.import_module('myApp.migrations.0016_seed_dataversions').seed
+        seed(django_apps, mock.Mock(connection=connection))
+        self.assertEqual(DataVersion.objects.get(farmer=newcomer).version, 0)
+        self.assertEqual(DataVersion.objects.filter(farmer=self.farmer).count(), 1)   # existing rows kept
+        self.assertGreater(DataVersion.objects.get(farmer=self.farmer).version, 0)
+
+    def test_activity_log_post_skips_the_page(self):
+        self.client.force_login(self.farmer)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('activity_log'), {
+                'add_activity': '1', 'crop': self.crop.pk, 'activity_type': 'watering', 'date': '2024-06-01'})
+        self.assertRedirects(response, reverse('activity_log'), fetch_redirect_response=False)
+        sql = [q['sql'] for q in ctx.captured_queries]
+        self.assertFalse([q for q in sql if 'ORDER BY "myApp_activity"."date" DESC' in q or 'COUNT(*)' in q])
+
+        response = self.client.get(reverse('activity_log'), {'after': format_cursor(self.newest_first[2])},
+                                   HTTP_HX_REQUEST='true', HTTP_HX_TARGET='activity-records')
+        self.assertTemplateUsed(response, 'partials/activity_records.html')
+        self.assertEqual(list(response.context['activities']), self.newest_first[3:8])
+
+    def test_expense_log_post_skips_the_page(self):
+        self.client.force_login(self.farmer)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('expense_log'), {
+                'add_expense': '1', 'expense_type': 'labor', 'amount': '25.00', 'date': '2024-06-01'})
+        self.assertRedirects(response, reverse('expense_log'), fetch_redirect_response=False)
+        sql = [q['sql'] for q in ctx.captured_queries]
+        self.assertFalse([q for q in sql if 'ORDER BY "myApp_expense"."date" DESC' in q or 'COUNT(*)' in q])
+
+
+class StreamingExportTests(TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.enterContext(override_settings(EXPORT_CACHE_DIR=cache_dir.name))
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        self.crop = Crop.objects.create(name='Corn', ideal_seasons='May-Aug')
+        Activity.objects.create(farmer=self.farmer, crop=self.crop, activity_type='planting',
+                                date=date(2024, 5, 1), area_ha=2.0, seed_qty_kg=20, fert_sacks=4, spacing='75x25 cm')
+        Activity.objects.create(farmer=self.farmer, crop=self.crop, activity_type='weeding',
+                                date=date(2024, 6, 1), area_ha=2.0, notes='Rows 1-4')
+        Expense.objects.create(farmer=self.farmer, expense_type='seed', description='Hybrid',
+                               amount=Decimal('900.00'), date=date(2024, 5, 1))
+        Expense.objects.create(farmer=self.farmer, expense_type='labor', amount=Decimal('300.00'),
+                               date=date(2023, 5, 1))
+        self.client.force_login(self.farmer)
+
+    def _body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_expenses_csv_streams_filtered_rows(self):
+        response = self.client.get(reverse('export_expenses_csv'), {'year': 2024})
+        self.assertTrue(response.streaming)
+        self.assertEqual(self._body(response).decode().splitlines(), [
+            'Date,Type,Description,Amount',
+            '2024-05-01,Seed,Hybrid,900.00',
+        ])
+
+    def test_activities_csv_blanks_planting_columns_for_other_types(self):
+        response = self.client.get(reverse('export_activities_csv'))
+        lines = self._body(response).decode().splitlines()
+        self.assertEqual(lines[1], '2024-06-01,Corn,weeding,Rows 1-4,,,,')
+        self.assertEqual(lines[2], '2024-05-01,Corn,planting,,2.0,20.0,4.0,75x25 cm')
+
+    def test_gzip_when_accepted(self):
+        response = self.client.get(reverse('export_expenses_csv'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(gzip.decompress(self._body(response)).startswith(b'Date,Type,Description,Amount'))
+
+    def test_large_export_in_constant_memory(self):
+        Expense.objects.bulk_create([
+            Expense(farmer=self.farmer, expense_type='seed', description=f'Bag {i}', amount=Decimal('123.45'),
+                    date=date(2024, 1, 1) + timedelta(days=i % 365))
+            for i in range(200_000)
+        ], batch_size=5000)
+
+        # The whole path: view, values_list().iterator(), cache file build, streamed response
+        tracemalloc.start()
+        try:
+            response = self.client.get(reverse('export_expenses_csv'), {'year': 2024})
+            self.assertTrue(response.streaming)
+            size = lines = 0
+            for chunk in response.streaming_content:
+                size += len(chunk)
+                lines += chunk.count(b'\n')
+            response.close()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(lines, 1 + 200_001)      # header, the bulk rows and setUp's 2024 expense
+        self.assertGreater(size, 5_000_000)        # ~6 MB of CSV went through...
+        self.assertLess(peak, 2 * 1024 * 1024)     # ...without ever holding more than 2 MB
+
+
+class ReportRendererTests(SimpleTestCase):
+    def _render(self, report, rows):
+        """Render to memory; returns (rows, pages, PDF bytes, the table rows drawn on each page)."""
+        drawn = []
+        draw = report._draw_page
+        with mock.patch.object(report, '_draw_page',
+                               side_effect=lambda c, page, rows, heights: (drawn.append(rows), draw(c, page, rows, heights))):
+            out = tempfile.SpooledTemporaryFile()
+            done, pages = report.render(rows, out)
+        out.seek(0)
+        return done, pages, out.read(), drawn
+
+    def test_rows_flow_over_many_pages(self):
+        rows = [(date(2024, 1, 1), 'seed', f'Bag {i}', f'{i:,.2f}') for i in range(500)]
+        seen = []
+        report = reports.expense_report('2024')
+        done, pages, pdf, drawn = self._render(report, rows)
+        self.assertEqual(done, 500)
+        self.assertGreater(pages, 5)
+        self.assertEqual(len(drawn), pages)
+        self.assertEqual([row[2] for page in drawn for row in page], [f'Bag {i}' for i in range(500)])
+        self.assertTrue(pdf.startswith(b'%PDF'))
+
+        report.render(iter(rows), tempfile.SpooledTemporaryFile(), lambda done, page: seen.append((done, page)))
+        self.assertEqual(seen[-1], (500, pages))
+
+    def test_long_cell_is_wrapped_in_full_across_pages(self):
+        words = [f'word{i}' for i in range(3000)]
+        rows = [(date(2024, 1, 1), 'seed', 'Before', '1.00'),
+                (date(2024, 1, 2), 'labor', ' '.join(words), '2.00'),
+                (date(2024, 1, 3), 'seed', 'After', '3.00')]
+        done, pages, pdf, drawn = self._render(reports.expense_report(), rows)
+        self.assertEqual(done, 3)
+        self.assertGreater(pages, 2)
+        # The long row starts under "Before" on page 1, continues on later pages and ends above "After"
+        self.assertEqual(drawn[0][0][2], 'Before')
+        self.assertEqual(drawn[-1][-1][2], 'After')
+        self.assertEqual(drawn[-1][-1][1], 'seed')
+        long_text = '\n'.join(row[2] for page in drawn for row in page)
+        self.assertEqual(long_text.split()[1:-1], words)
+        self.assertEqual([row[1] for page in drawn for row in page if row[1]], ['seed', 'labor', 'seed'])
+
+    def test_pdf_response_streams_the_spooled_file(self):
+        rows = [(date(2024, 1, 1), 'seed', f'Bag {i}', '1.00') for i in range(300)]
+        with mock.patch.object(reports, 'SPOOL_MAX_BYTES', 1024):
+            response = reports.pdf_response(reports.expense_report(), rows, 'expenses.pdf')
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('attachment; filename="expenses.pdf"', response['Content-Disposition'])
+        self.assertTrue(response.file_to_stream._rolled)          # spilled to disk past the spool limit
+        body = b''.join(response.streaming_content)
+        response.close()
+        self.assertTrue(body.startswith(b'%PDF'))
+        self.assertTrue(body.rstrip().endswith(b'%%EOF'))
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.enterContext(override_settings(EXPORT_CACHE_DIR=cache_dir.name, EXPORT_JOB_TTL_HOURS=24))
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        Expense.objects.create(farmer=self.farmer, expense_type='seed', description='Hybrid',
+                               amount=Decimal('900.00'), date=date(2024, 5, 1))
+        self.client.force_login(self.farmer)
+
+    def _start(self, **params):
+        return self.client.post(reverse('start_export'), {'export': 'expenses.csv', 'year': 2024, **params})
+
+    def _age(self, job, hours):
+        ExportJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - timedelta(hours=hours))
+
+    def test_lifecycle_from_start_to_download(self):
+        response = self._start()
+        job = ExportJob.objects.get()
+        self.assertEqual((job.status, job.filters), ('pending', {'month': None, 'year': 2024}))
+        self.assertContains(response, 'queued')
+        self._start()
+        self.assertEqual(ExportJob.objects.count(), 1)                 # same export in flight → same job
+
+        self.assertEqual(claim_export_jobs('w1', limit=5), [job.pk])
+        self.assertEqual(claim_export_jobs('w2', limit=5), [])
+        self.assertTrue(render_export_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_total, job.rows_done, job.claimed_by), ('done', 1, 1, 'w1'))
+
+        status = self.client.get(reverse('export_job_status', args=[job.pk]))
+        self.assertContains(status, reverse('export_job_download', args=[job.pk]))
+        self.assertNotContains(status, 'hx-trigger')                   # polling stops once done
+        download = self.client.get(reverse('export_job_download', args=[job.pk]))
+        self.assertEqual(b''.join(download.streaming_content).decode().splitlines(), [
+            'Date,Type,Description,Amount',
+            '2024-05-01,Seed,Hybrid,900.00',
+        ])
+
+        self._start()
+        self.assertEqual(ExportJob.objects.count(), 1)                 # rendered file still cached → reused
+        Expense.objects.create(farmer=self.farmer, expense_type='labor', amount=Decimal('300.00'),
+                               date=date(2024, 6, 1))
+        self._start()
+        self.assertEqual(ExportJob.objects.filter(status='pending').count(), 1)  # data changed → new job
+
+    def test_failed_render_marks_job_failed(self):
+        self._start()
+        job = ExportJob.objects.get()
+        claim_export_jobs('w1', limit=1)
+        with mock.patch('myApp.exports.build_export', side_effect=ValueError('bad row')):
+            self.assertFalse(render_export_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('ValueError: bad row', job.last_error)
+        self.assertContains(self.client.get(reverse('export_job_status', args=[job.pk])), 'failed')
+        self.assertEqual(self.client.get(reverse('export_job_download', args=[job.pk])).status_code, 404)
+
+    def test_other_farmers_job_is_404(self):
+        job = start_export_job(self.farmer, 'expenses.csv', {'month': None, 'year': 2024})
+        claim_export_jobs('w1', limit=1)
+        render_export_job(job.pk)
+        other = User.objects.create_user(username='other', password='x', role='farmer')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('export_job_status', args=[job.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export_job_download', args=[job.pk])).status_code, 404)
+
+    def test_expired_file_redirects_back(self):
+        job = start_export_job(self.farmer, 'expenses.csv', {'month': None, 'year': 2024})
+        claim_export_jobs('w1', limit=1)
+        render_export_job(job.pk)
+        cache_path(job.cache_key, '.csv').unlink()
+        response = self.client.get(reverse('export_job_download', args=[job.pk]))
+        self.assertRedirects(response, reverse('expense_log'), fetch_redirect_response=False)
+
+    def test_cleanup_after_ttl(self):
+        filters = {'month': None, 'year': 2024}
+        old = start_export_job(self.farmer, 'expenses.csv', filters)
+        claim_export_jobs('w1', limit=1)
+        render_export_job(old.pk)
+        self._age(old, 25)
+        shared = ExportJob.objects.create(farmer=self.farmer, export='expenses.csv', filters=filters,
+                                          cache_key=old.cache_key, status='done')   # newer job, same file
+        stuck = ExportJob.objects.create(farmer=self.farmer, export='activities.csv', cache_key='x' * 40,
+                                         status='running')
+        self._age(stuck, 25)
+        orphan = cache_path('y' * 40, '.csv').with_suffix('.tmp')
+        orphan.write_text('half a render')
+        os.utime(orphan, (time.time() - 25 * 3600,) * 2)
+
+        self.assertEqual(cleanup_export_jobs(), 1)
+        self.assertEqual(set(ExportJob.objects.values_list('pk', flat=True)), {shared.pk, stuck.pk})
+        self.assertTrue(cache_path(old.cache_key, '.csv').exists())   # still served for the newer job
+        self.assertFalse(orphan.exists())
+
+        self._age(shared, 25)
+        out = StringIO()
+        call_command('run_export_worker', '--once', '--processes', '0', stdout=out)
+        self.assertIn('removed 1 expired export jobs', out.getvalue())
+        self.assertFalse(cache_path(old.cache_key, '.csv').exists())
+        self.assertEqual(list(ExportJob.objects.values_list('pk', flat=True)), [stuck.pk])  # running jobs stay
+
+
+@override_settings(FORECAST_SYNC=True)
+class QueryPlanTests(TestCase):
+    """
+    Every farmer-facing GET runs its SELECTs through EXPLAIN QUERY PLAN and must
+    not full-scan a table or sort raw rows in a temp B-tree unless ALLOWED says why.
+    """
+    URLS = [
+        'farmer_dashboard', 'activity_log', 'expense_log', 'refresh_reminders',
+        ('activity_log', {'crop': 1, 'start_date': '2024-01-01', 'end_date': '2024-12-31'}),
+        ('expense_log', {'month': 5, 'year': 2024}),
+        ('chart_bundle', {'page': 'dashboard'}),
+        ('chart_bundle', {'page': 'activity_log', 'start': '2024-01-01'}),
+        ('chart_bundle', {'page': 'expense_log', 'month': 5, 'year': 2024}),
+        'expense_chart_data', 'chart_yield_by_crop', 'chart_harvest_timeline',
+        'chart_activities_monthly', 'chart_activities_by_type', 'chart_activities_by_crop',
+        ('export_expenses_csv', {'month': 5, 'year': 2024}),
+        ('export_activities_csv', {'start': '2024-01-01', 'end': '2024-06-30'}),
+        'export_activities_pdf',
+    ]
+
+    # Full scans and temp B-trees that are fine by construction: (view, statement fingerprint) → why.
+    # A failure prints the statement's slow_queries.fingerprint; add it here only with a reason.
+    ALLOWED = {
+        ('activity_log', '17ee0eab9fef9274'): "crop dropdown: the whole crop catalogue, shared by every farmer",
+        ('farmer_dashboard', '6dc4e1a475dca3e6'): "top expense type this month: at most 5 rollup rows",
+        ('expense_log', '6dc4e1a475dca3e6'): "top expense type this month: at most 5 rollup rows",
+        ('expense_log', 'cd62a78f0d5dc7a0'): "totals by type for the year: at most 12 months × 5 types of rollups",
+        ('expense_log', '15d52287d6178f89'): "totals by type for one month: at most 5 rollup rows",
+        ('farmer_dashboard', '88ac6aeef7b258c7'): "latest forecasts: one pointer per crop per farmer",
+        ('farmer_dashboard', '9c6a4ba0a809fa87'): "upcoming harvests: one pointer per crop per farmer",
+        ('chart_activities_monthly', '660f4a00d8bc4e62'): "type × crop × month groups, built from the indexed farmer slice",
+        ('chart_activities_by_type', '660f4a00d8bc4e62'): "type × crop × month groups, built from the indexed farmer slice",
+        ('chart_activities_by_crop', '660f4a00d8bc4e62'): "type × crop × month groups, built from the indexed farmer slice",
+        ('chart_bundle', 'fef21ea8e1a55366'): "the same activity groups from a start date",
+    }
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.enterContext(override_settings(EXPORT_CACHE_DIR=cache_dir.name))
+
+        crops = [Crop.objects.create(name=f'Crop {i}', ideal_seasons='Jan-Dec', yield_t_min=3, yield_t_max=5,
+                                     days_to_harvest_min=90, days_to_harvest_max=120) for i in range(3)]
+        today = timezone.now().date()
+        for username in ('farmer', 'neighbour'):
+            farmer = User.objects.create_user(username=username, password='x', role='farmer')
+            for i in range(12):
+                day = date(2024, 1, 1) + timedelta(days=30 * i)
+                Activity.objects.create(farmer=farmer, crop=crops[i % 3], date=day, area_ha=1.0,
+                                        activity_type='planting' if i % 2 else 'watering')
+                Expense.objects.create(farmer=farmer, expense_type='seed', amount=Decimal('10.00'), date=day)
+                Reminder.objects.create(farmer=farmer, message='Check the pump', due_date=today + timedelta(days=i))
+        self.planting = Activity.objects.filter(farmer=farmer, activity_type='planting').first()
+        self.client.force_login(farmer)
+
+    def _problems(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = [row[-1] for row in cursor.fetchall()]
+        return [step for step in plan if re.match(r'SCAN "?myApp_\w+"?$', step) or 'TEMP B-TREE' in step]
+
+    def test_views_use_indexes(self):
+        urls = self.URLS + [('planting_detail', None, {'pk': self.planting.pk})]
+        used = set()
+        for entry in urls:
+            name, params, kwargs = (entry, None, None) if isinstance(entry, str) else (entry + (None,))[:3]
+            with self.subTest(view=name, params=params):
+                with CaptureQueriesContext(connection) as ctx:
+                    response = self.client.get(reverse(name, kwargs=kwargs), params or {})
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertEqual(response.status_code, 200)
+                failures = []
+                for query in ctx.captured_queries:
+                    problems = self._problems(query['sql']) if query['sql'].startswith('SELECT') else []
+                    allowed = (name, slow_queries.fingerprint(query['sql'])[0])
+                    if problems and allowed in self.ALLOWED:
+                        used.add(allowed)
+                    elif problems:
+                        failures.append(f"{problems} in {allowed}: {query['sql']}")
+                self.assertFalse(failures, '\n'.join(failures))
+        self.assertEqual(set(self.ALLOWED) - used, set(), "allow-list entries no query needs any more")
+
+
+@override_settings(FORECAST_SYNC=True)
+class LatestForecastTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        self.client.force_login(self.farmer)
+
+    def _plant(self, count):
+        for i in range(count):
+            crop = Crop.objects.create(name=f'Crop {Crop.objects.count()}', ideal_seasons='Jan-Dec',
+                                       yield_t_min=3, yield_t_max=5, days_to_harvest_min=90, days_to_harvest_max=120)
+            Activity.objects.create(farmer=self.farmer, crop=crop, activity_type='planting',
+                                    date=date(2024, 3, 1), area_ha=1.0)
+
+    def _pointer(self, crop):
+        return LatestForecast.objects.get(farmer=self.farmer, crop=crop).forecast_id
+
+    def test_pointer_follows_newest_forecast(self):
+        self._plant(1)
+        crop = Crop.objects.get()
+        first = Forecast.objects.get()
+        self.assertEqual(self._pointer(crop), first.pk)
+
+        newer = Forecast.objects.create(farmer=self.farmer, crop=crop, expected_yield_kg=1.0,
+                                        forecast_date=date(2024, 4, 1))
+        self.assertEqual(self._pointer(crop), newer.pk)
+
+        newer.delete()
+        self.assertEqual(self._pointer(crop), first.pk)
+        Forecast.objects.filter(pk=first.pk).delete()
+        self.assertFalse(LatestForecast.objects.exists())
+
+    def test_newer_forecast_moves_pointer_in_one_query(self):
+        self._plant(1)
+        crop = Crop.objects.get()
+        first = Forecast.objects.get()
+        newer = Forecast(farmer=self.farmer, crop=crop, expected_yield_kg=1.0, forecast_date=date(2024, 4, 1))
+        with CaptureQueriesContext(connection) as ctx:
+            newer.save()
+        self.assertEqual([q['sql'][:6] for q in ctx if 'myApp_latestforecast' in q['sql']], ['UPDATE'])
+        self.assertEqual(self._pointer(crop), newer.pk)
+
+        # Saving an older row leaves the pointer where it is
+        first.created_at = newer.created_at - timedelta(days=1)
+        first.save()
+        self.assertEqual(self._pointer(crop), newer.pk)
+        # ...unless the newest one moves back in time
+        newer.created_at = first.created_at - timedelta(days=1)
+        newer.save()
+        self.assertEqual(self._pointer(crop), first.pk)
+
+    def test_chart_queries_do_not_grow_with_crops(self):
+        counts = []
+        for crops in (2, 8):
+            self._plant(crops)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse('chart_bundle'), {'page': 'dashboard'})
+            self.assertEqual(len(response.json()['yield_by_crop']['labels']), Crop.objects.count())
+            counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+
+
+@override_settings(FORECAST_SYNC=True)
+class ChartBundleTests(TestCase):
+    # bundle page + params → {series key: (per-chart endpoint, its params)}
+    PAGES = {
+        ('dashboard', ()): {
+            'expenses_monthly': ('chart_expenses_monthly', {}),
+            'expenses_by_category': ('chart_expenses_by_category', {}),
+            'harvest_timeline': ('chart_harvest_timeline', {}),
+            'yield_by_crop': ('chart_yield_by_crop', {}),
+        },
+        ('activity_log', (('start', '2024-02-01'),)): {
+            'activities_monthly': ('chart_activities_monthly', {'start': '2024-02-01'}),
+            'activities_by_type': ('chart_activities_by_type', {'start': '2024-02-01'}),
+            'activities_by_crop': ('chart_activities_by_crop', {'start': '2024-02-01'}),
+        },
+        ('expense_log', (('year', '2024'), ('month', '5'))): {
+            'expenses_monthly': ('chart_expenses_monthly', {'year': '2024', 'month': '5'}),
+            'expenses_by_category': ('chart_expenses_by_category', {'year': '2024', 'month': '5'}),
+        },
+    }
+
+    def setUp(self):
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        self.today = timezone.now().date()
+        self.corn = Crop.objects.create(name='Corn', ideal_seasons='Jan-Dec', yield_t_min=3, yield_t_max=5,
+                                        days_to_harvest_min=90, days_to_harvest_max=110)
+        rice = Crop.objects.create(name='Rice', ideal_seasons='Jan-Dec', yield_t_min=4, yield_t_max=6,
+                                   days_to_harvest_min=100, days_to_harvest_max=120)
+        # An older corn forecast whose window opens first: the timeline shows the latest one
+        Forecast.objects.create(farmer=self.farmer, crop=self.corn, expected_yield_kg=1.0, forecast_date=self.today,
+                                harvest_start=self.today + timedelta(days=5),
+                                harvest_end=self.today + timedelta(days=20))
+        for crop, day in [(self.corn, self.today - timedelta(days=30)), (rice, date(2024, 3, 1)),
+                          (rice, date(2024, 1, 10))]:
+            Activity.objects.create(farmer=self.farmer, crop=crop, activity_type='planting', date=day, area_ha=1.0)
+        Activity.objects.create(farmer=self.farmer, crop=rice, activity_type='watering', date=date(2024, 3, 2))
+        for expense_type, amount, day in [('seed', '900.00', date(2024, 5, 1)), ('labor', '300.00', date(2024, 5, 9)),
+                                          ('seed', '50.00', date(2024, 6, 1)), ('labor', '75.00', self.today)]:
+            Expense.objects.create(farmer=self.farmer, expense_type=expense_type, amount=Decimal(amount), date=day)
+        self.client.force_login(self.farmer)
+
+    def test_bundle_matches_per_chart_endpoints(self):
+        for (page, params), series in self.PAGES.items():
+            bundle = self.client.get(reverse('chart_bundle'), {'page': page, **dict(params)}).json()
+            self.assertEqual(set(bundle), set(series))
+            for key, (name, chart_params) in series.items():
+                with self.subTest(page=page, series=key):
+                    self.assertEqual(bundle[key], self.client.get(reverse(name), chart_params).json())
+                    self.assertTrue(bundle[key]['labels'], 'the fixture should give every series data')
+
+    def test_harvest_timeline_uses_each_crops_latest_forecast(self):
+        timeline = self.client.get(reverse('chart_harvest_timeline')).json()
+        latest = LatestForecast.objects.get(farmer=self.farmer, crop=self.corn).forecast
+        self.assertEqual(timeline['labels'], ['Corn'])       # rice's 2024 windows are past
+        self.assertEqual(timeline['offsets'], [(latest.harvest_start - self.today).days])
+        self.assertGreater(timeline['offsets'][0], 5)        # not the older forecast's window
+
+
+class ForecastCompactionTests(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        self.crop = Crop.objects.create(name='Rice', ideal_seasons='Jun-Nov')
+        self.today = timezone.now().date()
+
+    def _history(self, days_ago, yields):
+        for ago, kg in zip(days_ago, yields):
+            day = self.today - timedelta(days=ago)
+            Forecast.objects.create(farmer=self.farmer, crop=self.crop, expected_yield_kg=kg, forecast_date=day,
+                                    created_at=timezone.now() - timedelta(days=ago))
+
+    def _rows(self):
+        return list(Forecast.objects.order_by('forecast_date')
+                    .values_list('forecast_date', 'valid_from', 'expected_yield_kg'))
+
+    def test_unchanged_runs_collapse_into_their_last_row(self):
+        self._history(range(6, -1, -1), [100, 100, 100, 120, 120, 100, 100])
+        latest = LatestForecast.objects.get().forecast_id
+
+        call_command('compact_forecasts', stdout=StringIO())
+
+        day = lambda ago: self.today - timedelta(days=ago)
+        self.assertEqual(self._rows(), [
+            (day(4), day(6), 100),
+            (day(2), day(3), 120),
+            (day(1), None, 100),   # today's row is still being upserted and stays apart
+            (day(0), None, 100),
+        ])
+        self.assertEqual(LatestForecast.objects.get().forecast_id, latest)
+
+    def test_old_history_keeps_one_snapshot_per_week(self):
+        monday = self.today - timedelta(days=self.today.weekday() + 7 * 20)
+        ago = (self.today - monday).days
+        self._history([ago, ago - 2, ago - 4, ago - 7, 1], [100, 110, 120, 130, 140])
+
+        call_command('compact_forecasts', '--weekly-after-days=30', stdout=StringIO())
+
+        self.assertEqual(self._rows(), [
+            (monday + timedelta(days=4), monday, 120),
+            (monday + timedelta(days=7), None, 130),
+            (self.today - timedelta(days=1), None, 140),
+        ])
+
+    def test_dry_run_writes_nothing(self):
+        self._history([3, 2, 1], [100, 100, 100])
+        call_command('compact_forecasts', '--dry-run', stdout=StringIO())
+        self.assertEqual(Forecast.objects.count(), 3)
+
+
+class QueryRecorder:
+    """
+    Records every SQL statement run on `connection` with its duration and the
+    innermost myApp line (outside the tests) that triggered it.
+    """
+    APP_DIR = os.path.join(settings.BASE_DIR, 'myApp') + os.sep
+
+    def __init__(self):
+        self.queries = []
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._wrapper.__exit__(*exc)
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - t0, self._call_site()))
+
+    def _call_site(self):
+        for frame in reversed(traceback.extract_stack()[:-2]):
+            if frame.filename.startswith(self.APP_DIR) and not frame.filename.endswith('tests.py'):
+                return f"{os.path.relpath(frame.filename, settings.BASE_DIR)}:{frame.lineno} in {frame.name}"
+        return "django"
+
+    @property
+    def total_ms(self):
+        return sum(duration for _, duration, _ in self.queries) * 1000
+
+    def report(self):
+        by_site = defaultdict(list)
+        for sql, duration, site in self.queries:
+            by_site[site].append((sql, duration))
+        lines = []
+        for site, queries in sorted(by_site.items(), key=lambda item: -len(item[1])):
+            ms = sum(d for _, d in queries) * 1000
+            lines.append(f"  {len(queries)}× {ms:.1f} ms  {site}")
+            lines.extend(f"      {sql[:200]}" for sql in dict.fromkeys(sql for sql, _ in queries))
+        return '\n'.join(lines)
+
+
+class TopLevelElements(HTMLParser):
+    """(id, is out-of-band) of each top-level element in an HTML fragment."""
+    VOID = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+    def __init__(self):
+        super().__init__()
+        self.depth = 0
+        self.elements = []
+
+    @classmethod
+    def of(cls, html):
+        parser = cls()
+        parser.feed(html)
+        parser.close()
+        return parser.elements
+
+    def handle_starttag(self, tag, attrs):
+        if self.depth == 0:
+            attrs = dict(attrs)
+            self.elements.append((attrs.get('id'), 'hx-swap-oob' in attrs))
+        if tag not in self.VOID:
+            self.depth += 1
+
+    def handle_endtag(self, tag):
+        if tag not in self.VOID:
+            self.depth -= 1
+
+
+@override_settings(FORECAST_SYNC=True)
+class QueryBudgetTests(TestCase):
+    """
+    Every route in myApp/urls.py has a query count budget against the fixture
+    below; a request over budget fails with its SQL grouped by the myApp line
+    that ran it. The fixture has dozens of rows per list and several
+    crops, so a new N+1 blows the budget as soon as it lands.
+    """
+    # Total SQL time per request, checked only when QUERY_BUDGET_SQL_MS is set: wall-clock
+    # timings depend on the machine, so a shared CI box would fail at random
+    SQL_MS = float(os.getenv('QUERY_BUDGET_SQL_MS', '0'))
+    # Endpoints the pages only call over HTMX
+    HX_ROUTES = {'flash_messages', 'add_reminder', 'edit_reminder', 'delete_reminder', 'refresh_reminders',
+                 'start_export', 'export_job_status'}
+
+    # (url name or (url name, kwargs), method, params, max queries); kwargs/params may be
+    # callables taking the test case. Counts include the session/user lookups and savepoints.
+    BUDGETS = [
+        ('login', 'get', None, 0),
+        ('logout', 'get', None, 0),
+        ('register', 'get', None, 0),
+        ('home', 'get', None, 2),
+        ('farmer_dashboard', 'get', None, 18),  # first view builds the summary
+        ('flash_messages', 'get', None, 0),
+        ('password_reset', 'get', None, 0),
+        ('password_reset_done', 'get', None, 0),
+        (('password_reset_confirm', lambda t: t.reset), 'get', None, 1),
+        ('password_reset_complete', 'get', None, 0),
+        ('add_reminder', 'post', lambda t: {'message': 'Irrigate', 'due_date': t.today}, 8),
+        ('edit_reminder', 'post', lambda t: {'reminder_id': t.reminder.pk, 'message': 'Irrigate',
+                                             'due_date': t.today}, 9),
+        ('delete_reminder', 'post', lambda t: {'reminder_id': t.reminder.pk}, 9),
+        ('refresh_reminders', 'get', None, 3),
+        ('activity_log', 'get', None, 8),
+        ('activity_log', 'post', lambda t: {'add_activity': '1', 'crop': t.crops[0].pk, 'activity_type': 'watering',
+                                            'date': t.today, 'notes': ''}, 7),
+        (('planting_detail', lambda t: {'pk': t.planting.pk}), 'get', None, 5),
+        ('forecast_scenarios', 'get', lambda t: {'planting': t.planting.pk, 'area': '1:4:4'}, 4),
+        ('expense_log', 'get', {'month': 5, 'year': 2024}, 10),
+        ('expense_log', 'post', lambda t: {'add_expense': '1', 'expense_type': 'labor', 'amount': '25.00',
+                                           'date': t.today, 'description': ''}, 14),
+        ('expense_chart_data', 'get', None, 3),
+        ('export_expenses_csv', 'get', {'year': 2024}, 4),
+        ('export_expenses_pdf', 'get', {'year': 2024}, 4),
+        ('chart_expenses_monthly', 'get', {'year': 2024}, 3),
+        ('chart_expenses_by_category', 'get', {'month': 5, 'year': 2024}, 3),
+        ('chart_yield_by_crop', 'get', None, 3),
+        ('chart_harvest_timeline', 'get', None, 3),
+        ('chart_bundle', 'get', {'page': 'dashboard'}, 4),
+        ('chart_bundle', 'get', {'page': 'activity_log'}, 3),
+        ('chart_bundle', 'get', {'page': 'expense_log', 'year': 2024}, 3),
+        ('chart_activities_monthly', 'get', None, 3),
+        ('chart_activities_by_type', 'get', None, 3),
+        ('chart_activities_by_crop', 'get', None, 3),
+        ('export_activities_csv', 'get', None, 4),
+        ('export_activities_pdf', 'get', None, 4),
+        ('start_export', 'post', {'export': 'activities.csv'}, 5),
+        (('export_job_status', lambda t: {'pk': t.job.pk}), 'get', None, 3),
+        (('export_job_download', lambda t: {'pk': t.job.pk}), 'get', None, 3),
+        ('metrics_dashboard', 'get', None, 4),
+        ('metrics_prometheus', 'get', None, 2),
+        (('profile_download', {'filename': 'sample.collapsed'}), 'get', None, 2),
+    ]
+
+    def setUp(self):
+        cache.clear()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.enterContext(override_settings(EXPORT_CACHE_DIR=cache_dir.name, PROFILE_DIR=cache_dir.name,
+                                            METRICS_DB=os.path.join(cache_dir.name, 'metrics.sqlite3')))
+        with open(os.path.join(cache_dir.name, 'sample.collapsed'), 'w') as fh:
+            fh.write('main (manage.py:1) 10\n')
+
+        self.today = timezone.now().date()
+        self.crops = [Crop.objects.create(name=f'Crop {i}', ideal_seasons='Jan-Dec', yield_t_min=3, yield_t_max=5,
+                                          days_to_harvest_min=90, days_to_harvest_max=120) for i in range(4)]
+        for username in ('neighbour', 'farmer'):
+            farmer = User.objects.create_user(username=username, password='x', role='farmer')
+            for i in range(40):
+                day = date(2024, 1, 1) + timedelta(days=9 * i)
+                Activity.objects.create(farmer=farmer, crop=self.crops[i % 4], date=day, area_ha=1.5,
+                                        activity_type=('planting', 'watering', 'harvesting')[i % 3],
+                                        seed_qty_kg=20, fert_sacks=4, spacing='20x20 cm')
+                Expense.objects.create(farmer=farmer, expense_type=Expense.EXPENSE_TYPES[i % 5][0],
+                                       amount=Decimal('12.50'), date=day)
+                Reminder.objects.create(farmer=farmer, message='Check the pump', due_date=self.today + timedelta(days=i))
+        self.farmer = farmer
+        self.planting = Activity.objects.filter(farmer=farmer, activity_type='planting').first()
+        self.reminder = Reminder.objects.filter(farmer=farmer).first()
+        self.job = start_export_job(farmer, 'expenses.csv', {'month': None, 'year': 2024})
+        render_export_job(self.job.pk)
+        self.reset = {'uidb64': urlsafe_base64_encode(force_bytes(farmer.pk)),
+                      'token': default_token_generator.make_token(farmer)}
+        farmer.is_staff = True  # so the staff-only metrics routes answer
+        farmer.save(update_fields=['is_staff'])
+        self.client.force_login(farmer)
+
+    def _request(self, name, kwargs, method, params):
+        kwargs = kwargs(self) if callable(kwargs) else kwargs
+        params = params(self) if callable(params) else params
+        with QueryRecorder() as recorder:
+            headers = {'HX-Request': 'true'} if name in self.HX_ROUTES else {}
+            response = getattr(self.client, method)(reverse(name, kwargs=kwargs), params or {}, headers=headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400)
+        return recorder
+
+    def test_every_route_within_budget(self):
+        budgets = [(entry if isinstance(entry, tuple) else (entry, None), *rest) for entry, *rest in self.BUDGETS]
+        routes = {p.name for p in get_resolver('myApp.urls').url_patterns}
+        self.assertEqual(routes - {name for (name, _), *_ in budgets}, set(), "routes without a query budget")
+
+        for (name, kwargs), method, params, max_queries in budgets:
+            with self.subTest(route=name, method=method, params=None if callable(params) else params):
+                recorder = self._request(name, kwargs, method, params)
+                report = f"\n{recorder.report()}"
+                self.assertLessEqual(len(recorder.queries), max_queries, f"query budget exceeded:{report}")
+                if self.SQL_MS:
+                    self.assertLessEqual(recorder.total_ms, self.SQL_MS, f"SQL time budget exceeded:{report}")
+
+    # HX-Target → (view, params, the fragment's root id, out-of-band ids, max queries)
+    PARTIALS = {
+        'activity-records': ('activity_log', lambda t: {'after': t.cursor('activity')}, 'activity-records', [], 5),
+        'activity-results': ('activity_log', lambda t: {'crop': t.crops[1].pk}, 'activity-results', [], 5),
+        'expense-records': ('expense_log', lambda t: {'year': '', 'after': t.cursor('expense')},
+                            'expense-records', [], 5),
+        'expense-results': ('expense_log', {'month': 5, 'year': 2024}, 'expense-results',
+                            ['expense-kpis', 'expense-period', 'expense-count', 'expense-chart-year',
+                             'expense-chart-data'], 11),   # the page's 10 plus the chart series
+    }
+
+    def cursor(self, kind):
+        rows = Activity.objects if kind == 'activity' else Expense.objects
+        return format_cursor(rows.filter(farmer=self.farmer).order_by('-date', '-id')[2])
+
+    def test_partials_return_only_their_fragment(self):
+        for target, (name, params, root, oob, max_queries) in self.PARTIALS.items():
+            params = params(self) if callable(params) else params
+            with self.subTest(target=target):
+                hx = {'HX-Request': 'true', 'HX-Target': target}
+                with QueryRecorder() as recorder:
+                    response = self.client.get(reverse(name), params, headers=hx)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(len(recorder.queries), max_queries, f"query budget exceeded:\n{recorder.report()}")
+                top = TopLevelElements.of(response.content.decode())
+                self.assertEqual(top[0], (root, False), 'the fragment comes first and is swapped in place')
+                self.assertEqual(top[1:], [(i, True) for i in oob], 'anything else must be an out-of-band swap')
+                self.assertIn('HX-Target', response['Vary'])
+
+                # The same URL without htmx (or on a history restore) is the whole page
+                for headers in ({}, {**hx, 'HX-History-Restore-Request': 'true'}):
+                    page = self.client.get(reverse(name), params, headers=headers)
+                    self.assertTemplateUsed(page, 'base.html')
+                    self.assertContains(page, '<html')
+                    self.assertContains(page, f'id="{root}"')
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        sink = tempfile.TemporaryDirectory()
+        self.addCleanup(sink.cleanup)
+        self.enterContext(override_settings(METRICS_DB=os.path.join(sink.name, 'metrics.sqlite3'),
+                                            METRICS_TOKEN='s3cret'))
+        metrics.REGISTRY.flush()  # start from an empty sink
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        self.client.force_login(self.farmer)
+
+    def test_histogram_percentiles_within_bucket_precision(self):
+        hist = metrics.Histogram()
+        for value in range(1, 100_001):
+            hist.record(value)
+        for pct in (50, 95, 99):
+            self.assertAlmostEqual(hist.percentile(pct), pct * 1000, delta=pct * 1000 / 32)
+        self.assertEqual(hist.percentile(100), 100_000)
+        self.assertEqual(metrics.Histogram.from_dict(hist.to_dict()).percentile(95), hist.percentile(95))
+
+    def test_requests_are_recorded_per_view(self):
+        for _ in range(3):
+            self.client.get(reverse('chart_bundle'), {'page': 'dashboard'})
+        self.client.get('/no-such-page/')
+
+        stats = metrics.load_stats()
+        bundle = stats['chart_bundle']
+        self.assertEqual(bundle.wall_us.count, 3)
+        self.assertEqual(bundle.statuses, {200: 3})
+        self.assertGreater(bundle.queries.total, 0)
+        self.assertGreater(bundle.db_us.total, 0)
+        self.assertGreater(bundle.bytes.mean, 0)
+        self.assertEqual(stats['<unresolved>'].statuses, {404: 1})
+
+    def test_prometheus_endpoint_needs_staff_or_token(self):
+        self.client.get(reverse('farmer_dashboard'))
+        self.assertEqual(self.client.get(reverse('metrics_prometheus')).status_code, 403)
+
+        response = self.client.get(reverse('metrics_prometheus'), headers={'Authorization': 'Bearer s3cret'})
+        body = response.content.decode()
+        self.assertIn('agritrack_request_duration_seconds_count{view="farmer_dashboard"} 1', body)
+        self.assertIn('agritrack_requests_total{view="farmer_dashboard",status="200"} 1', body)
+
+    def test_prometheus_counters_survive_pruning(self):
+        self.client.get(reverse('farmer_dashboard'))
+        metrics.REGISTRY.flush()
+        with override_settings(METRICS_RETENTION_DAYS=0):   # the next flush prunes the first row
+            time.sleep(0.01)
+            self.client.get(reverse('farmer_dashboard'))
+            metrics.REGISTRY.flush()
+
+        self.assertEqual(metrics.load_stats()['farmer_dashboard'].wall_us.count, 1)
+        body = self.client.get(reverse('metrics_prometheus'), headers={'Authorization': 'Bearer s3cret'}).content
+        self.assertIn(b'agritrack_request_duration_seconds_count{view="farmer_dashboard"} 2', body)
+        self.assertIn(b'agritrack_requests_total{view="farmer_dashboard",status="200"} 2', body)
+
+    def test_admin_page_lists_views_for_staff_only(self):
+        self.client.get(reverse('farmer_dashboard'))
+        self.assertEqual(self.client.get(reverse('metrics_dashboard')).status_code, 302)
+
+        self.farmer.is_staff = True
+        self.farmer.save(update_fields=['is_staff'])
+        response = self.client.get(reverse('metrics_dashboard'), {'window': '1h'})
+        self.assertContains(response, '<code>farmer_dashboard</code>', html=False)
+
+
+class SlowQueryTests(TestCase):
+    def setUp(self):
+        sink = tempfile.TemporaryDirectory()
+        self.addCleanup(sink.cleanup)
+        # Every statement counts as slow
+        self.enterContext(override_settings(METRICS_DB=os.path.join(sink.name, 'metrics.sqlite3'),
+                                            SLOW_QUERY_MS=0.0001))
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        for i in range(3):
+            Expense.objects.create(farmer=self.farmer, date=date(2023, 5, 1 + i), expense_type='seed',
+                                   amount=Decimal('10.00'), description=f'bag {i}')
+        self.client.force_login(self.farmer)
+
+    def test_fingerprint_groups_the_same_query(self):
+        a, _ = slow_queries.fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'x' AND k IN (%s, %s)")
+        b, normalized = slow_queries.fingerprint("SELECT *  FROM t WHERE id = 7 AND name = 'it''s' AND k IN (%s)")
+        self.assertEqual(a, b)
+        self.assertEqual(normalized, 'SELECT * FROM t WHERE id = ? AND name = ? AND k IN (...)')
+        self.assertNotEqual(a, slow_queries.fingerprint('SELECT * FROM t WHERE id > 12')[0])
+
+    def test_slow_queries_keep_view_params_and_plan(self):
+        with self.assertLogs('myApp.slow_queries', 'WARNING'):
+            self.client.get(reverse('expense_log'), {'year': 2023})
+            self.client.get(reverse('expense_log'), {'year': 2023})
+
+        rows = [r for r in slow_queries.top_offenders(limit=100) if r['view'] == 'expense_log']
+        [page] = [r for r in rows if r['sql'].startswith('SELECT "myApp_expense"."id"')]
+        self.assertEqual(page['count'], 2)  # both requests' page query, one fingerprint
+        self.assertRegex(page['plan'], r'SEARCH|SCAN')
+        self.assertIn(str(self.farmer.pk), page['params'])
+
+        out = StringIO()
+        call_command('slow_queries', '--limit', '100', '--plans', stdout=out)
+        self.assertIn('expense_log', out.getvalue())
+        self.assertIn('plan:', out.getvalue())
+        call_command('slow_queries', '--reset', stdout=StringIO())
+        self.assertEqual(slow_queries.top_offenders(), [])
+
+    def test_failed_explain_leaves_the_transaction_usable(self):
+        self.assertTrue(connection.in_atomic_block)   # TestCase wraps each test in atomic()
+        with mock.patch.object(connection.ops, 'savepoint_rollback_sql',
+                               wraps=connection.ops.savepoint_rollback_sql) as rollback:
+            plan = slow_queries.explain(connection, 'SELECT * FROM "no_such_table"', [])
+        self.assertTrue(plan.startswith('EXPLAIN failed:'))
+        rollback.assert_called_once_with(slow_queries.EXPLAIN_SAVEPOINT)
+        self.assertFalse(connection.needs_rollback)
+        self.assertEqual(Expense.objects.filter(farmer=self.farmer).count(), 3)
+
+    def test_rows_are_written_after_the_response_is_closed(self):
+        def view(request):
+            return HttpResponse(str(Expense.objects.count()))
+
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        response = SlowQueryMiddleware(view)(request)
+        self.assertEqual(slow_queries.top_offenders(), [])   # nothing written during the request
+
+        with self.assertLogs('myApp.slow_queries', 'WARNING'):
+            response.close()
+        [row] = slow_queries.top_offenders()
+        self.assertEqual((row['view'], row['count']), (slow_queries.NO_VIEW, 1))
+        self.assertIn('COUNT(*)', row['sql'])
+
+    def test_file_response_still_closes_its_file(self):
+        spool = tempfile.SpooledTemporaryFile()
+
+        def view(request):
+            spool.write(str(Expense.objects.count()).encode())
+            spool.seek(0)
+            return FileResponse(spool)
+
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        response = SlowQueryMiddleware(view)(request)
+        self.assertEqual(b''.join(response.streaming_content), b'3')
+        with self.assertLogs('myApp.slow_queries', 'WARNING'):
+            response.close()
+        self.assertTrue(spool.closed)
+        self.assertEqual(slow_queries.top_offenders()[0]['count'], 1)
+
+
+class ProfilerTests(TestCase):
+    def setUp(self):
+        profiles = tempfile.TemporaryDirectory()
+        self.addCleanup(profiles.cleanup)
+        self.enterContext(override_settings(PROFILE_DIR=profiles.name, PROFILE_KEEP=2))
+        self.dir = profiles.name
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        self.client.force_login(self.farmer)
+
+    def test_only_staff_requests_are_profiled(self):
+        response = self.client.get(reverse('activity_log'), headers={'X-Profile': '1'})
+        self.assertNotIn('X-Profile', response.headers)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_profile_files_are_written_and_linked(self):
+        self.farmer.is_staff = True
+        self.farmer.save(update_fields=['is_staff'])
+
+        response = self.client.get(reverse('activity_log'), {'_profile': '1'})
+        prof_url, collapsed_url = response['X-Profile'], response['X-Profile-Collapsed']
+        self.assertTrue(prof_url.endswith('.prof'))
+        name = os.path.basename(prof_url)
+        self.assertIn('activities', name)
+        stats = pstats.Stats(os.path.join(self.dir, name))
+        self.assertTrue(any(func[2] == 'activity_log_view' for func in stats.stats))
+
+        collapsed = b''.join(self.client.get(collapsed_url).streaming_content).decode()
+        view_lines = [line for line in collapsed.splitlines() if ';activity_log_view (myApp/views.py:' in line]
+        self.assertTrue(view_lines)
+        self.assertTrue(all(re.fullmatch(r'[^;]+(;[^;]+)* \d+', line) for line in collapsed.splitlines()))
+
+        # Streamed exports are profiled until consumed; only the newest PROFILE_KEEP are kept
+        for _ in range(2):
+            response = self.client.get(reverse('export_expenses_csv'), headers={'X-Profile': '1'})
+            b''.join(response.streaming_content)
+            response.close()
+        self.assertEqual(len([f for f in os.listdir(self.dir) if f.endswith('.prof')]), 2)
+        self.assertFalse(os.path.exists(os.path.join(self.dir, name)))
+        self.assertEqual(self.client.get(reverse('profile_download', args=[name])).status_code, 404)
+
+
+class ReminderHtmxTests(TestCase):
+    HX = {'HTTP_HX_REQUEST': 'true'}
+
+    def setUp(self):
+        self.farmer = User.objects.create_user(username='farmer', password='x', role='farmer')
+        self.due = timezone.now().date() + timedelta(days=3)
+        self.client.force_login(self.farmer)
+        self.client.get(reverse('farmer_dashboard'))  # builds the summary the list is read from
+
+    def _oob(self, response, element_id):
+        match = re.search(rf'<div id="{element_id}" hx-swap-oob="innerHTML">(.*?)</div>\s*(?=<div id=|$)',
+                          response.content.decode(), re.S)
+        return match and match.group(1)
+
+    def _assert_single_response(self, response):
+        # Everything the page needs is in this response: no HX-Trigger asking for
+        # follow-up GETs, and the flash messages were consumed here
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('HX-Trigger', response)
+        self.assertNotContains(self.client.get(reverse('flash_messages')), 'rounded-md border')
+
+    def test_add_edit_delete_each_answer_in_one_response(self):
+        response = self.client.post(reverse('add_reminder'), {'message': 'Spray fungicide', 'due_date': self.due}, **self.HX)
+        self.assertIn('Reminder saved.', self._oob(response, 'flash-region'))
+        self.assertIn('Spray fungicide', self._oob(response, 'reminderList'))
+        self._assert_single_response(response)
+
+        reminder = Reminder.objects.get(farmer=self.farmer)
+        response = self.client.post(reverse('edit_reminder'), {
+            'reminder_id': reminder.pk, 'message': 'Spray copper', 'due_date': self.due}, **self.HX)
+        self.assertIn('Reminder updated.', self._oob(response, 'flash-region'))
+        self.assertIn('Spray copper', self._oob(response, 'reminderList'))
+        self._assert_single_response(response)
+
+        response = self.client.post(reverse('delete_reminder'), {'reminder_id': reminder.pk}, **self.HX)
+        self.assertIn('Reminder deleted.', self._oob(response, 'flash-region'))
+        self.assertNotIn('Spray copper', self._oob(response, 'reminderList'))
+        self._assert_single_response(response)
+
+    def test_invalid_form_only_updates_flash(self):
+        response = self.client.post(reverse('add_reminder'), {'message': 'No date'}, **self.HX)
+        self.assertIn('Please provide both', self._oob(response, 'flash-region'))
+        self.assertIsNone(self._oob(response, 'reminderList'))
+        self._assert_single_response(response)
@@ -38,6 +38,7 @@ urlpatterns = [
 
     path('activities/', views.activity_log_view, name='activity_log'),
     path('activities/<int:pk>/detail/', views.planting_detail_view, name='planting_detail'),
+    path('api/forecast/scenarios/', views.forecast_scenarios, name='forecast_scenarios'),
     path('expenses/', views.expense_log_view, name='expense_log'),
     path('expenses/chart/data/', views.chart_expenses_monthly, name='expense_chart_data'),
 
@@ -48,6 +49,7 @@ urlpatterns = [
     path("api/charts/expenses/by-category/", views.expenses_by_category, name="chart_expenses_by_category"),
     path("api/charts/yield/by-crop/", views.yield_by_crop, name="chart_yield_by_crop"),
     path("api/charts/harvest/timeline/", views.harvest_timeline, name="chart_harvest_timeline"),
+    path("api/charts/bundle/", views.chart_bundle, name="chart_bundle"),
 
      path('charts/activities/monthly/', views.chart_activities_monthly, name='chart_activities_monthly'),
     path('charts/activities/type/', views.chart_activities_by_type, name='chart_activities_by_type'),
@@ -55,6 +57,13 @@ urlpatterns = [
 
     path('export/activities.csv', views.export_activities_csv, name='export_activities_csv'),
     path('export/activities.pdf', views.export_activities_pdf, name='export_activities_pdf'),
+    path('export/jobs/start/', views.start_export, name='start_export'),
+    path('export/jobs/<int:pk>/', views.export_job_status, name='export_job_status'),
+    path('export/jobs/<int:pk>/download/', views.export_job_download, name='export_job_download'),
+
+    path('metrics/', views.metrics_dashboard, name='metrics_dashboard'),
+    path('metrics/prometheus/', views.metrics_prometheus, name='metrics_prometheus'),
+    path('profiles/<str:filename>', views.profile_download, name='profile_download'),
 
 
     path("charts/expenses-monthly/", views.chart_expenses_monthly, name="chart_expenses_monthly"),
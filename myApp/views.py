@@ -5,7 +5,6 @@ from .forms import CustomUserCreationForm
 from django.db import models
 from django.contrib import messages
 from django.http import HttpResponse, HttpResponseBadRequest
-import json
 
 
 def register_view(request):
@@ -19,24 +18,30 @@ def register_view(request):
         form = CustomUserCreationForm()
     return render(request, 'auth/register.html', {'form': form})
 
-# put this small helper near the top of views.py (once)
-def _as_int(value):
+# querystring ints ('' / 'None' / 'null' → None), shared with charts.py and exports.py
+from .date_ranges import as_int
+
+
+def _hx_updates(request, reminders=False):
     """
-    Convert querystring value to int or return None for '', 'None', 'null', 'undefined', etc.
+    Reply to an HTMX mutation: the flash messages (and, with `reminders`, the
+    reminder list) as out-of-band swaps, so the page needs no follow-up GETs.
     """
-    if value in (None, "", "None", "none", "null", "undefined"):
-        return None
-    try:
-        return int(value)
-    except (TypeError, ValueError):
-        return None
+    context = {'show_reminders': reminders}
+    if reminders:
+        context['reminders'] = get_dashboard_summary(request.user).context()['reminders']
+    return render(request, 'partials/hx_updates.html', context)
 
 
-def _hx_empty(trigger_events=None, status=204):
-    response = HttpResponse(status=status)
-    if trigger_events:
-        response['HX-Trigger'] = json.dumps(trigger_events)
-    return response
+def _hx_target(request):
+    """
+    Id of the element an HTMX GET will swap, or None for full page loads
+    (including htmx's history restores, which need the whole page).
+    """
+    if (request.method == 'GET' and request.headers.get('HX-Request')
+            and not request.headers.get('HX-History-Restore-Request')):
+        return request.headers.get('HX-Target')
+    return None
 
 
 
@@ -50,77 +55,15 @@ from django.db.models import Count
 
 from django.utils import timezone
 from django.db import models
-from .models import Activity, Forecast, Expense, Reminder, Crop
+from .models import Activity, Forecast, Expense, Reminder, Crop, LatestForecast, get_dashboard_summary
 from django.db.models import Count
 
 def farmer_dashboard(request):
-    user = request.user
-    today = timezone.now()
-    current_month = today.strftime("%B")
-
-    # Crop and expense summary (unchanged)
-    crop_count = Activity.objects.filter(
-        farmer=user, date__month=today.month
-    ).values('crop').distinct().count()
-
-    expenses = Expense.objects.filter(farmer=user)
-    total_expenses = expenses.filter(
-        date__month=today.month, date__year=today.year
-    ).aggregate(total=models.Sum('amount'))['total'] or 0
-
-    most_common_expense = (
-        expenses.filter(date__month=today.month, date__year=today.year)
-        .values('expense_type')
-        .annotate(count=Count('expense_type'))
-        .order_by('-count')
-        .first()
-    )
-    most_common_expense_label = (
-        dict(Expense.EXPENSE_TYPES).get(most_common_expense['expense_type'])
-        if most_common_expense else "—"
-    )
-
-    last_recorded_expense = expenses.order_by('-date').first()
-    last_recorded_date = last_recorded_expense.date if last_recorded_expense else None
-
-    # Recent activities & reminders (unchanged)
-    recent_activities = Activity.objects.filter(farmer=user).order_by('-date')[:5]
-    reminders = Reminder.objects.filter(
-        farmer=user, due_date__gte=today.date()
-    ).order_by('due_date')
-
-    # 🔮 Forecasts (NEW) — prefer upcoming harvests, else show latest 3
-    upcoming = Forecast.objects.filter(
-        farmer=user,
-        harvest_end__isnull=False,
-        harvest_end__gte=today.date()
-    ).order_by('harvest_start', '-created_at')
-
-    if upcoming.exists():
-        forecasts = list(upcoming[:3])
-    else:
-        # fallback: just show the latest few even if harvest window passed or missing
-        forecasts = list(
-            Forecast.objects.filter(farmer=user).order_by('-created_at')[:3]
-        )
-
-    planting_map = {}
-    for planting in (Activity.objects
-                     .filter(farmer=user, activity_type='planting')
-                     .order_by('crop_id', '-date', '-id')):
-        planting_map.setdefault(planting.crop_id, planting.pk)
-    for fc in forecasts:
-        fc.planting_activity_id = planting_map.get(fc.crop_id)
-
+    # Cards, reminders and forecasts come precomputed from DashboardSummary
+    summary = get_dashboard_summary(request.user)
     return render(request, 'myApp/farmer_dashboard.html', {
-        'crop_count': crop_count,
-        'forecasts': forecasts,             # ⬅️ make sure this matches the template
-        'total_expenses': total_expenses,
-        'most_common_expense_label': most_common_expense_label,
-        'last_recorded_date': last_recorded_date,
-        'recent_activities': recent_activities,
-        'reminders': reminders,
-        'current_month': current_month,
+        **summary.context(),
+        'current_month': timezone.now().strftime("%B"),
     })
 
 
@@ -141,10 +84,11 @@ def role_redirect_view(request):
 def technician_home(request):
     if request.user.role != 'technician':
         return redirect('farmer_dashboard')
-    upcoming = (Forecast.objects
-                .filter(farmer__role='farmer')
-                .select_related('crop', 'farmer')
-                .order_by('-created_at')[:5])
+    # Newest forecast per farmer/crop, walked backwards on the pointer's created_at index
+    upcoming = [p.forecast for p in (LatestForecast.objects
+                                     .filter(farmer__role='farmer')
+                                     .select_related('forecast__crop', 'forecast__farmer')
+                                     .order_by('-created_at')[:5])]
 
     assigned_farmers = User.objects.filter(role='farmer').order_by('username')[:10]
 
@@ -170,7 +114,7 @@ def add_reminder(request):
     if request.method != "POST":
         messages.error(request, "Reminder could not be saved.")
         if request.headers.get('HX-Request'):
-            return _hx_empty({'flash-refresh': ''})
+            return _hx_updates(request)
         return HttpResponseBadRequest("Invalid form")
 
     message_text = request.POST.get("message")
@@ -178,21 +122,21 @@ def add_reminder(request):
     if not (message_text and due_date):
         messages.error(request, "Please provide both a reminder message and due date.")
         if request.headers.get('HX-Request'):
-            return _hx_empty({'flash-refresh': ''})
+            return _hx_updates(request)
         return redirect('farmer_dashboard')
 
     Reminder.objects.create(farmer=request.user, message=message_text, due_date=due_date)
     messages.success(request, "Reminder saved.")
 
     if request.headers.get('HX-Request'):
-        return _hx_empty({'flash-refresh': '', 'reminder-updated': ''})
+        return _hx_updates(request, reminders=True)
     return redirect('farmer_dashboard')
 
 def edit_reminder(request):
     if request.method != "POST":
         messages.error(request, "Reminder update failed.")
         if request.headers.get('HX-Request'):
-            return _hx_empty({'flash-refresh': ''})
+            return _hx_updates(request)
         return HttpResponseBadRequest("Invalid form")
 
     reminder_id = request.POST.get("reminder_id")
@@ -200,7 +144,7 @@ def edit_reminder(request):
     if not reminder:
         messages.error(request, "Reminder not found.")
         if request.headers.get('HX-Request'):
-            return _hx_empty({'flash-refresh': ''})
+            return _hx_updates(request)
         return redirect('farmer_dashboard')
 
     reminder.message = request.POST.get("message")
@@ -209,14 +153,14 @@ def edit_reminder(request):
     messages.success(request, "Reminder updated.")
 
     if request.headers.get('HX-Request'):
-        return _hx_empty({'flash-refresh': '', 'reminder-updated': ''})
+        return _hx_updates(request, reminders=True)
     return redirect('farmer_dashboard')
 
 def delete_reminder(request):
     if request.method != "POST":
         messages.error(request, "Reminder delete failed.")
         if request.headers.get('HX-Request'):
-            return _hx_empty({'flash-refresh': ''})
+            return _hx_updates(request)
         return HttpResponseBadRequest("Invalid request")
 
     reminder_id = request.POST.get("reminder_id")
@@ -227,7 +171,7 @@ def delete_reminder(request):
         messages.warning(request, "Reminder was not found.")
 
     if request.headers.get('HX-Request'):
-        return _hx_empty({'flash-refresh': '', 'reminder-updated': ''})
+        return _hx_updates(request, reminders=True)
     return redirect('farmer_dashboard')
 
 def refresh_reminders(request):
@@ -254,14 +198,18 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q
 from django.utils import timezone
+from django.conf import settings
 
-from .models import Activity, Crop
+from .models import Activity, Crop, CropRecompute
 from .forms import ActivityForm, CropForm
+from .pagination import cached_count, keyset_page
+from django.views.decorators.vary import vary_on_headers
 
 @login_required
+@vary_on_headers('HX-Request', 'HX-Target')
 def activity_log_view(request):
     user = request.user
-    activities = Activity.objects.filter(farmer=user).order_by('-date')
+    activities = Activity.objects.filter(farmer=user)
     crops = Crop.objects.all()
 
     # --------------------------
@@ -314,8 +262,11 @@ def activity_log_view(request):
                     new_activity.fert_sacks = _f('fert_sacks', None)
                     new_activity.spacing = request.POST.get('spacing') or None
 
-                new_activity.save()  # <-- post_save signal in models.py creates/updates Forecast
-                messages.success(request, "Activity logged successfully. Forecast generated.")
+                new_activity.save()  # <-- post_save signal in models.py creates Forecast (or queues a ForecastJob)
+                if new_activity.activity_type == 'planting' and not settings.FORECAST_SYNC:
+                    messages.success(request, "Activity logged successfully. Forecast will update in a moment.")
+                else:
+                    messages.success(request, "Activity logged successfully. Forecast generated.")
                 return redirect('activity_log')
             else:
                 messages.error(request, "Please check the activity form and try again.")
@@ -336,8 +287,12 @@ def activity_log_view(request):
             crop = get_object_or_404(Crop, id=crop_id)
             form = CropForm(request.POST, instance=crop)
             if form.is_valid():
-                form.save()
-                messages.success(request, "Crop updated successfully!")
+                crop = form.save()
+                recompute = getattr(crop, '_recompute', None)
+                if recompute and recompute.status != 'done':
+                    messages.success(request, "Crop updated! Forecasts using it will refresh in the background.")
+                else:
+                    messages.success(request, "Crop updated successfully!")
                 return redirect('activity_log')
             else:
                 messages.error(request, "Please check the crop form and try again.")
@@ -352,14 +307,30 @@ def activity_log_view(request):
     # --------------------------
     # Render
     # --------------------------
+    # One keyset page of rows, fetched only once no POST action has redirected.
+    # HTMX requests get just the block they swap: the pager replaces the
+    # records, the filter bar the count + records.
+    page = keyset_page(activities.select_related('crop'), request.GET)
+    records = {
+        'activities': page.items,
+        'page': page,
+        'total_count': cached_count(activities, user.pk, ['activities', crop_filter, start_date, end_date]),
+    }
+    hx_target = _hx_target(request)
+    if hx_target == 'activity-records':
+        return render(request, 'partials/activity_records.html', records)
+    if hx_target == 'activity-results':
+        return render(request, 'partials/activity_results.html', records)
+
     return render(request, 'myApp/activity_log.html', {
         'form': activity_form,
         'crop_form': crop_form,
-        'activities': activities,
+        **records,
         'crops': crops,
         'crop_filter': crop_filter,
         'start_date': start_date,
         'end_date': end_date,
+        'recomputes': CropRecompute.objects.filter(status__in=('pending', 'running')).select_related('crop'),
     })
 
 
@@ -393,17 +364,19 @@ from django.utils import timezone
 from datetime import datetime
 import calendar
 
-from .models import Expense
+from .date_ranges import filter_period
+from .models import Expense, ExpenseRollup, compute_forecast_from_activity, save_forecast_for_activity
 from .forms import ExpenseForm
 
 
 @login_required
+@vary_on_headers('HX-Request', 'HX-Target')
 def expense_log_view(request):
     user = request.user
     form = ExpenseForm()
 
     # Base queryset
-    expenses = Expense.objects.filter(farmer=user).order_by('-date')
+    expenses = Expense.objects.filter(farmer=user)
 
     # ---- Filters (support month OR year OR both) ----
     today = timezone.now()
@@ -416,16 +389,12 @@ def expense_log_view(request):
     else:
         selected_year = year_param  # can be '' for "all years"
 
-    if selected_year:
-        expenses = expenses.filter(date__year=selected_year)
-
     selected_month = month_param or ''
-    if selected_month:
-        expenses = expenses.filter(date__month=selected_month)
+    expenses = filter_period(expenses, as_int(selected_year), as_int(selected_month))
     if selected_month:
         try:
             selected_month_label = calendar.month_name[int(selected_month)]
-        except (TypeError, ValueError):
+        except (TypeError, ValueError, IndexError):
             selected_month_label = selected_month
     else:
         selected_month_label = ''
@@ -459,22 +428,37 @@ def expense_log_view(request):
             messages.success(request, "Expense deleted.")
             return redirect('expense_log')
 
-    # ---- Stats based on the *filtered* queryset (drives the cards) ----
-    agg = expenses.aggregate(
-        total=Sum('amount'),
-        avg=Avg('amount'),
-        n=Count('id'),
-    )
-    total = agg['total'] or 0
-    avg_expense = agg['avg'] or 0
+    # ---- One keyset page of rows (after the POST actions; the pager's HTMX requests stop here) ----
+    page = keyset_page(expenses, request.GET)
+    records = {
+        'expenses': page.items,
+        'page': page,
+        'total_count': cached_count(expenses, user.pk, ['expenses', selected_year, selected_month]),
+    }
+    hx_target = _hx_target(request)
+    if hx_target == 'expense-records':
+        return render(request, 'partials/expense_records.html', records)
+
+    # ---- Stats for the filtered view, from the monthly rollups (drives the cards) ----
+    month_int = as_int(selected_month)
+    year_int = as_int(selected_year)
+    rollups = ExpenseRollup.objects.filter(farmer=user)
+    if year_int:
+        rollups = rollups.filter(year=year_int)
+    if month_int:
+        rollups = rollups.filter(month=month_int)
 
-    # “Most Spent On” = category with largest total amount in the filtered view
-    top_cat = (
-        expenses.values('expense_type')
-        .annotate(total=Sum('amount'))
+    by_type = list(
+        rollups.values('expense_type')
+        .annotate(total=Sum('total'), n=Sum('count'))
         .order_by('-total')
-        .first()
     )
+    total = sum((row['total'] for row in by_type), 0)
+    n = sum(row['n'] for row in by_type)
+    avg_expense = total / n if n else 0
+
+    # “Most Spent On” = category with largest total amount in the filtered view
+    top_cat = by_type[0] if by_type else None
     if top_cat:
         label_map = dict(Expense.EXPENSE_TYPES)
         most_spent_on = label_map.get(top_cat['expense_type'], top_cat['expense_type'])
@@ -484,23 +468,16 @@ def expense_log_view(request):
         most_spent_amount = 0.0
 
     # ---- Optional: current-month quick summary (if you still show this elsewhere) ----
-    current_month_expenses = Expense.objects.filter(
-        farmer=user, date__year=today.year, date__month=today.month
-    )
-    monthly_total = current_month_expenses.aggregate(Sum('amount'))['amount__sum'] or 0
+    current_month_rollups = ExpenseRollup.objects.filter(farmer=user, year=today.year, month=today.month)
+    monthly_total = current_month_rollups.aggregate(Sum('total'))['total__sum'] or 0
 
-    most_common = (
-        current_month_expenses.values('expense_type')
-        .annotate(count=Count('expense_type'))
-        .order_by('-count')
-        .first()
-    )
+    most_common = current_month_rollups.order_by('-count').values('expense_type').first()
     most_common_expense = (
         dict(Expense.EXPENSE_TYPES).get(most_common['expense_type'], "N/A")
         if most_common else "N/A"
     )
 
-    last_recorded = expenses.first().date if expenses.exists() else None
+    last_recorded = expenses.order_by('-date').values_list('date', flat=True).first()
 
     # ---- Month/Year drop-down options ----
     months = [(str(i).zfill(2), calendar.month_name[i]) for i in range(1, 13)]
@@ -511,32 +488,20 @@ def expense_log_view(request):
 
     # ---- YoY Delta ----
     yoy_percent = None
-    year_int = None
-    try:
-        year_int = int(selected_year) if selected_year else None
-    except (TypeError, ValueError):
-        year_int = None
-    month_int = None
-    try:
-        month_int = int(selected_month) if selected_month else None
-    except (TypeError, ValueError):
-        month_int = None
-
     current_total_float = float(total or 0)
     if year_int:
-        prev_qs = Expense.objects.filter(farmer=user, date__year=year_int - 1)
+        prev_qs = ExpenseRollup.objects.filter(farmer=user, year=year_int - 1)
         if month_int:
-            prev_qs = prev_qs.filter(date__month=month_int)
-        prev_total = prev_qs.aggregate(total=Sum('amount'))['total'] or 0
+            prev_qs = prev_qs.filter(month=month_int)
+        prev_total = prev_qs.aggregate(total=Sum('total'))['total'] or 0
         prev_total_float = float(prev_total)
         if prev_total_float > 0:
             yoy_percent = ((current_total_float - prev_total_float) / prev_total_float) * 100.0
         else:
             yoy_percent = None
 
-    return render(request, 'myApp/expense_log.html', {
-        'form': form,
-        'expenses': expenses,
+    context = {
+        **records,
 
         # Cards (filtered)
         'total': total,
@@ -557,7 +522,12 @@ def expense_log_view(request):
         'most_common_expense': most_common_expense,
         'last_recorded': last_recorded,
         'yoy_percent': yoy_percent,
-    })
+    }
+    if hx_target == 'expense-results':
+        # Filter change: records, cards and chart data in one response (charts redraw without a fetch)
+        context['chart_bundle'] = charts.expense_log_bundle(user, request.GET)
+        return render(request, 'partials/expense_results.html', context)
+    return render(request, 'myApp/expense_log.html', {'form': form, **context})
 
 
 @login_required
@@ -566,30 +536,12 @@ def planting_detail_view(request, pk):
     crop = activity.crop
     forecast_snapshot = compute_forecast_from_activity(activity)
 
-    latest_forecast = (Forecast.objects
-                       .filter(farmer=request.user, crop=crop)
-                       .order_by('-created_at')
-                       .first())
+    pointer = LatestForecast.objects.filter(farmer=request.user, crop=crop).select_related('forecast').first()
+    latest_forecast = pointer.forecast if pointer else None
 
     if request.method == 'POST' and request.POST.get('recalculate'):
-        data = compute_forecast_from_activity(activity)
-        latest_forecast, _ = Forecast.objects.update_or_create(
-            farmer=activity.farmer,
-            crop=activity.crop,
-            forecast_date=timezone.now().date(),
-            defaults={
-                "expected_yield_kg": data["expected_yield_kg"],
-                "yield_min_kg": data["yield_min_kg"],
-                "yield_max_kg": data["yield_max_kg"],
-                "season_factor": data["season_factor"],
-                "input_factor": data["input_factor"],
-                "population_factor": data["population_factor"],
-                "harvest_start": data["harvest_start"],
-                "harvest_end": data["harvest_end"],
-                "notes": data["notes"],
-                "created_at": timezone.now(),
-            }
-        )
+        # Explicit user action: stays synchronous so the redirect shows fresh numbers
+        save_forecast_for_activity(activity)
         messages.success(request, "Forecast recalculated with the latest crop baselines.")
         return redirect('planting_detail', pk=activity.pk)
 
@@ -613,68 +565,66 @@ def planting_detail_view(request, pk):
     })
 
 
-import csv
-from django.http import HttpResponse
-from reportlab.pdfgen import canvas
-from io import BytesIO
+from django.http import HttpResponse, JsonResponse
+from .forecast_scenarios import ScenarioError, parse_grid, scenario_surface
 
 @login_required
-def export_expenses_csv(request):
-    user = request.user
-    month = _as_int(request.GET.get('month'))
-    year = _as_int(request.GET.get('year'))
+def forecast_scenarios(request):
+    """
+    What-if surface: ?crop=&month=&area=&seed=&fert=&spacing= (or ?planting=<id>
+    to start from a planting). Axis values are 'start:stop:num', '1,2,3' or one
+    number; spacing is square spacing in metres.
+    """
+    planting_id = as_int(request.GET.get('planting'))
+    if planting_id is not None:
+        activity = get_object_or_404(Activity, pk=planting_id, farmer=request.user, activity_type='planting')
+        crop = activity.crop
+        month = as_int(request.GET.get('month')) or activity.date.month
+        spacing = None
+        if activity.spacing_row_m and activity.spacing_hill_m:
+            spacing = (activity.spacing_row_m * activity.spacing_hill_m) ** 0.5
+        defaults = {
+            'area': activity.area_ha or 1.0,
+            'seed': activity.seed_qty_kg or 0.0,
+            'fert': activity.fert_sacks or 0.0,
+            'spacing': spacing,
+        }
+    else:
+        crop = get_object_or_404(Crop, pk=as_int(request.GET.get('crop')))
+        month = as_int(request.GET.get('month')) or timezone.now().month
+        defaults = {'area': 1.0, 'seed': 0.0, 'fert': 0.0, 'spacing': None}
 
-    expenses = Expense.objects.filter(farmer=user)
-    if month is not None:
-        expenses = expenses.filter(date__month=month)
-    if year is not None:
-        expenses = expenses.filter(date__year=year)
+    if not 1 <= month <= 12:
+        return JsonResponse({"error": "month must be 1-12."}, status=400)
+    try:
+        axes = parse_grid(request.GET, defaults)
+    except ScenarioError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
 
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="expenses.csv"'
+    return HttpResponse(scenario_surface(crop, month, axes), content_type='application/json')
 
-    writer = csv.writer(response)
-    writer.writerow(['Date', 'Type', 'Description', 'Amount'])
-    for e in expenses:
-        writer.writerow([e.date, e.get_expense_type_display(), e.description, e.amount])
 
-    return response
+from django.http import HttpResponse
+from . import export_cache, exports
+from .export_jobs import start_export_job
+from .models import ExportJob
+
+def _export(request, name, as_attachment=True):
+    filters = exports.export_filters(name, request.GET)
+
+    def build(out):
+        exports.build_export(name, request.user, filters, out)
+    return export_cache.serve_export(request, name, filters, build, as_attachment)
 
 
 @login_required
-def export_expenses_pdf(request):
-    user = request.user
-    month = _as_int(request.GET.get('month'))
-    year = _as_int(request.GET.get('year'))
+def export_expenses_csv(request):
+    return _export(request, 'expenses.csv')
 
-    expenses = Expense.objects.filter(farmer=user)
-    if month is not None:
-        expenses = expenses.filter(date__month=month)
-    if year is not None:
-        expenses = expenses.filter(date__year=year)
-
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer)
-    p.setFont("Helvetica", 12)
-    p.drawString(100, 800, "Expense Report")
-
-    y = 770
-    for e in expenses:
-        line = f"{e.date} - {e.get_expense_type_display()} - {e.description} - ₱{e.amount}"
-        p.drawString(50, y, line)
-        y -= 20
-        if y < 50:
-            p.showPage()
-            p.setFont("Helvetica", 12)
-            y = 800
-
-    p.showPage()
-    p.save()
-    buffer.seek(0)
-
-    resp = HttpResponse(buffer, content_type='application/pdf')
-    resp['Content-Disposition'] = 'attachment; filename="expenses.pdf"'
-    return resp
+
+@login_required
+def export_expenses_pdf(request):
+    return _export(request, 'expenses.pdf')
 
 
 # myApp/views.py
@@ -689,16 +639,17 @@ from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.db.models import Sum
 from django.utils import timezone
-from .models import Expense, Forecast, Crop
+from .models import Expense, ExpenseRollup, Forecast, Crop
 from django.db import models
+from . import charts
 
 @login_required
 def expenses_by_category(request):
     user = request.user
-    qs = (Expense.objects
+    qs = (ExpenseRollup.objects
           .filter(farmer=user)
           .values('expense_type')
-          .annotate(total=Sum('amount'))
+          .annotate(total=Sum('total'))
           .order_by('-total'))
     labels = [dict(Expense.EXPENSE_TYPES).get(x['expense_type'], x['expense_type']) for x in qs]
     data = [float(x['total']) for x in qs]
@@ -706,19 +657,8 @@ def expenses_by_category(request):
 
 @login_required
 def yield_by_crop(request):
-    user = request.user
     # latest forecast per crop
-    by_crop = {}
-    for c in Crop.objects.all():
-        f = (Forecast.objects
-             .filter(farmer=user, crop=c)
-             .order_by('-created_at')
-             .first())
-        if f:
-            by_crop[c.name] = by_crop.get(c.name, 0.0) + (f.expected_yield_kg or 0.0)
-    labels = list(by_crop.keys())
-    data = [round(v, 2) for v in by_crop.values()]
-    return JsonResponse({"labels": labels, "data": data})
+    return JsonResponse(charts.yield_by_crop_series(charts.forecast_rows(request.user)))
 
 @login_required
 def harvest_timeline(request):
@@ -726,29 +666,7 @@ def harvest_timeline(request):
     Return labels (crop names) + offsets/windows (days).
     UI renders scrollable chips (no big chart).
     """
-    user = request.user
-    today = timezone.now().date()
-    rows = (Forecast.objects
-            .filter(farmer=user, harvest_start__isnull=False, harvest_end__isnull=False)
-            .order_by('harvest_start', 'crop__name')
-            .select_related('crop'))
-
-    labels, offsets, windows = [], [], []
-    seen = set()
-    for f in rows:
-        if f.crop_id in seen:  # one upcoming per crop
-            continue
-        seen.add(f.crop_id)
-        if f.harvest_end < today:
-            continue
-        start = f.harvest_start
-        end = f.harvest_end
-        labels.append(f.crop.name)
-        offsets.append(max((start - today).days, 0))
-        windows.append(max((end - start).days, 0))
-
-    return JsonResponse({"labels": labels, "offsets": offsets, "windows": windows})
-
+    return JsonResponse(charts.harvest_timeline_series(charts.forecast_rows(request.user)))
 
 @login_required
 def activities_month_counts(request):
@@ -773,105 +691,55 @@ from django.db.models.functions import TruncMonth
 from django.db.models import Count
 from django.contrib.auth.decorators import login_required
 from datetime import datetime
-import csv
-from io import BytesIO
-from reportlab.pdfgen import canvas
-
-# Helper to optionally filter by date range
-def _date_range(qs, request):
-    start = request.GET.get('start')
-    end = request.GET.get('end')
-    if start:
-        qs = qs.filter(date__gte=start)
-    if end:
-        qs = qs.filter(date__lte=end)
-    return qs
 
 @login_required
 def chart_activities_monthly(request):
-    qs = Activity.objects.filter(farmer=request.user)
-    qs = _date_range(qs, request)
-    monthly = (qs.annotate(m=TruncMonth('date'))
-                 .values('m')
-                 .annotate(c=Count('id'))
-                 .order_by('m'))
-    labels = [x['m'].strftime('%b %Y') for x in monthly]
-    data = [x['c'] for x in monthly]
-    return JsonResponse({'labels': labels, 'data': data})
+    rows = charts.activity_rows(request.user, request.GET.get('start'), request.GET.get('end'))
+    return JsonResponse(charts.activities_monthly_series(rows))
 
 @login_required
 def chart_activities_by_type(request):
-    qs = Activity.objects.filter(farmer=request.user)
-    qs = _date_range(qs, request)
-    agg = (qs.values('activity_type')
-             .annotate(c=Count('id'))
-             .order_by())
-    # Use display names
-    type_map = dict(Activity.ACTIVITY_TYPES)
-    labels = [type_map.get(x['activity_type'], x['activity_type']).title() for x in agg]
-    data = [x['c'] for x in agg]
-    return JsonResponse({'labels': labels, 'data': data})
+    rows = charts.activity_rows(request.user, request.GET.get('start'), request.GET.get('end'))
+    return JsonResponse(charts.activities_by_type_series(rows))
 
 @login_required
 def chart_activities_by_crop(request):
-    qs = Activity.objects.filter(farmer=request.user)
-    qs = _date_range(qs, request)
-    agg = (qs.values('crop__name')
-             .annotate(c=Count('id'))
-             .order_by('-c', 'crop__name'))[:8]  # cap to 8 for compact bar
-    labels = [x['crop__name'] for x in agg]
-    data = [x['c'] for x in agg]
-    return JsonResponse({'labels': labels, 'data': data})
+    rows = charts.activity_rows(request.user, request.GET.get('start'), request.GET.get('end'))
+    return JsonResponse(charts.activities_by_crop_series(rows))  # capped to 8 for compact bar
 
 # --------- Exports ----------
 @login_required
 def export_activities_csv(request):
-    qs = Activity.objects.filter(farmer=request.user).select_related('crop')
-    qs = _date_range(qs, request)
-
-    resp = HttpResponse(content_type='text/csv')
-    resp['Content-Disposition'] = 'attachment; filename="activities.csv"'
-    w = csv.writer(resp)
-    w.writerow(['Date', 'Crop', 'Type', 'Notes', 'Area(ha)', 'Seed(kg)', 'Fert(sacks)', 'Spacing'])
-    for a in qs.order_by('-date'):
-        w.writerow([
-            a.date, a.crop.name, a.activity_type, a.notes or '',
-            a.area_ha if a.activity_type=='planting' else '',
-            a.seed_qty_kg if a.activity_type=='planting' else '',
-            a.fert_sacks if a.activity_type=='planting' else '',
-            a.spacing if a.activity_type=='planting' else '',
-        ])
-    return resp
+    return _export(request, 'activities.csv')
 
 @login_required
 def export_activities_pdf(request):
-    qs = Activity.objects.filter(farmer=request.user).select_related('crop')
-    qs = _date_range(qs, request)
-
-    buf = BytesIO()
-    p = canvas.Canvas(buf)
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(50, 800, "Activity Report")
-    p.setFont("Helvetica", 10)
-
-    y = 780
-    for a in qs.order_by('-date'):
-        line = f"{a.date}  |  {a.crop.name}  |  {a.activity_type}"
-        if a.activity_type == 'planting':
-            line += f"  |  area {a.area_ha or ''} ha, seed {a.seed_qty_kg or ''} kg, fert {a.fert_sacks or ''}, spacing {a.spacing or ''}"
-        if a.notes:
-            line += f"  |  {a.notes[:70]}"
-        p.drawString(50, y, line)
-        y -= 16
-        if y < 50:
-            p.showPage()
-            p.setFont("Helvetica", 10)
-            y = 800
-
-    p.showPage()
-    p.save()
-    buf.seek(0)
-    return HttpResponse(buf, content_type='application/pdf')
+    return _export(request, 'activities.pdf', as_attachment=False)
+
+@login_required
+def start_export(request):
+    """POST export=<name> (+ the page's filters): queue a background export and return its progress partial."""
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST required")
+    name = request.POST.get('export')
+    if name not in exports.EXPORTS:
+        return HttpResponseBadRequest("Unknown export.")
+    job = start_export_job(request.user, name, exports.export_filters(name, request.POST))
+    return render(request, 'partials/export_job.html', {'job': job})
+
+@login_required
+def export_job_status(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk, farmer=request.user)
+    return render(request, 'partials/export_job.html', {'job': job})
+
+@login_required
+def export_job_download(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk, farmer=request.user, status='done')
+    response = export_cache.serve_cached(request, job.cache_key, job.export)
+    if response is None:
+        messages.warning(request, "⚠️ That export has expired. Please start it again.")
+        return redirect('expense_log' if job.export.startswith('expenses') else 'activity_log')
+    return response
 
 
 # views_charts.py (or inside your existing views.py)
@@ -888,39 +756,62 @@ from .models import Expense
 @login_required
 def chart_expenses_monthly(request):
     """12 months for the selected or current year, filtered to this farmer."""
-    user = request.user
-    year = _as_int(request.GET.get('year')) or timezone.now().year
-
-    qs = (
-        Expense.objects
-        .filter(farmer=user, date__year=year)
-        .values('date__month')
-        .annotate(total=Sum('amount'))
-    )
-    totals_by_month = {row['date__month']: float(row['total'] or 0) for row in qs}
-
-    labels = [calendar.month_abbr[m] for m in range(1, 13)]
-    data = [totals_by_month.get(m, 0) for m in range(1, 13)]
-    return JsonResponse({"labels": labels, "data": data})
+    year = as_int(request.GET.get('year')) or timezone.now().year
+    return JsonResponse(charts.expenses_monthly_series(charts.expense_rows(request.user, year)))
 
 @login_required
 def chart_expenses_by_category(request):
     """Sum by expense_type for the current month (or ?month=&year=)."""
-    user = request.user
-    now = timezone.now()
-    year = _as_int(request.GET.get('year')) or now.year
-    month = _as_int(request.GET.get('month'))
-
-    qs = Expense.objects.filter(farmer=user, date__year=year)
-    if month:
-        qs = qs.filter(date__month=month)
-    qs = (
-        qs.values('expense_type')
-          .annotate(total=Sum('amount'))
-          .order_by('-total')
-    )
+    year = as_int(request.GET.get('year')) or timezone.now().year
+    month = as_int(request.GET.get('month'))
+    return JsonResponse(charts.expenses_by_category_series(charts.expense_rows(request.user, year), month or None))
 
-    type_map = dict(Expense.EXPENSE_TYPES)
-    labels = [type_map.get(row['expense_type'], row['expense_type']) for row in qs]
-    data = [float(row['total'] or 0) for row in qs]
-    return JsonResponse({"labels": labels, "data": data})
+
+@login_required
+def chart_bundle(request):
+    """Every chart series a page needs, in one response: ?page=dashboard|activity_log|expense_log."""
+    build = charts.PAGE_BUNDLES.get(request.GET.get('page'))
+    if build is None:
+        return JsonResponse({"error": f"page must be one of: {', '.join(charts.PAGE_BUNDLES)}"}, status=400)
+    return JsonResponse(build(request.user, request.GET))
+
+
+import hmac
+import time
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404
+from . import metrics, profiling
+
+METRICS_WINDOWS = {'1h': 3600, '24h': 86400, '7d': 7 * 86400}
+
+@staff_member_required
+def metrics_dashboard(request):
+    """Per-view latency, DB and size summary from the metrics sink, heaviest first."""
+    window = request.GET.get('window') if request.GET.get('window') in METRICS_WINDOWS else '24h'
+    rows = metrics.summary_rows(metrics.load_stats(since=time.time() - METRICS_WINDOWS[window]))
+    return render(request, 'myApp/metrics.html', {
+        **admin.site.each_context(request),
+        'title': 'Request metrics',
+        'rows': rows,
+        'window': window,
+        'windows': list(METRICS_WINDOWS),
+    })
+
+def metrics_prometheus(request):
+    """Prometheus text format; staff sessions or `Authorization: Bearer <METRICS_TOKEN>`."""
+    token = settings.METRICS_TOKEN
+    bearer = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not (request.user.is_staff or (token and hmac.compare_digest(bearer, token))):
+        return HttpResponse("Forbidden", status=403, content_type='text/plain')
+    return HttpResponse(metrics.prometheus_text(metrics.load_totals()),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@staff_member_required
+def profile_download(request, filename):
+    """A .prof or .collapsed file written by ProfilerMiddleware."""
+    path = profiling.profile_dir() / filename
+    if not profiling.FILENAME.match(filename) or not path.is_file():
+        raise Http404("No such profile.")
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename,
+                        content_type='application/octet-stream' if path.suffix == '.prof' else 'text/plain')
@@ -39,12 +39,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myApp.middleware.RequestMetricsMiddleware',
+    'myApp.middleware.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'myApp.middleware.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -132,3 +135,59 @@ LOGOUT_REDIRECT_URL = 'login'
 
 EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'AgriTrack Support <support@agritrack.local>')
+
+# Forecasts: planting saves queue a ForecastJob and crop baseline edits a
+# CropRecompute, drained by `python manage.py run_forecast_worker` running next
+# to the web server. FORECAST_SYNC=1 computes planting forecasts inline instead
+# (tests, small installs without a worker).
+FORECAST_SYNC = os.getenv('FORECAST_SYNC', '0') == '1'
+
+# Crop baseline edits always queue a CropRecompute; with FORECAST_SYNC=1 a crop
+# with at most this many plantings is also recomputed inside the request.
+CROP_RECOMPUTE_INLINE_MAX = int(os.getenv('CROP_RECOMPUTE_INLINE_MAX', '200'))
+
+# Forecast history (`python manage.py compact_forecasts`): forecasts older than
+# this many days are thinned to one snapshot per farmer, crop and week.
+FORECAST_WEEKLY_AFTER_DAYS = int(os.getenv('FORECAST_WEEKLY_AFTER_DAYS', '90'))
+
+# Monte Carlo forecasts: also store P10/P50/P90 yields and harvest dates.
+# Draws are seeded, so the same inputs always give the same percentiles.
+FORECAST_MONTE_CARLO = os.getenv('FORECAST_MONTE_CARLO', '0') == '1'
+FORECAST_MC_SAMPLES = int(os.getenv('FORECAST_MC_SAMPLES', '1000'))
+FORECAST_MC_SEED = int(os.getenv('FORECAST_MC_SEED', '2024'))
+
+# CSV exports are streamed; gzip them for clients that send Accept-Encoding: gzip.
+EXPORT_GZIP = os.getenv('EXPORT_GZIP', '1') == '1'
+
+# Generated CSV/PDF exports are cached on disk, keyed by each farmer's data
+# version; least recently served files are evicted past EXPORT_CACHE_MAX_BYTES.
+EXPORT_CACHE_DIR = os.getenv('EXPORT_CACHE_DIR', str(BASE_DIR / 'export_cache'))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv('EXPORT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+# Background export jobs (`python manage.py run_export_worker`) and their files
+# are deleted after this many hours.
+EXPORT_JOB_TTL_HOURS = float(os.getenv('EXPORT_JOB_TTL_HOURS', '24'))
+
+# Per-view request metrics (myApp/metrics.py): histograms are flushed to the
+# METRICS_DB SQLite file every METRICS_FLUSH_SECONDS and kept for
+# METRICS_RETENTION_DAYS. Prometheus can scrape /metrics/prometheus/ with
+# `Authorization: Bearer <METRICS_TOKEN>`; staff can browse /metrics/.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_DB = os.getenv('METRICS_DB', str(BASE_DIR / 'metrics.sqlite3'))
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '30'))
+METRICS_RETENTION_DAYS = float(os.getenv('METRICS_RETENTION_DAYS', '7'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Statements slower than this many milliseconds are stored with their plan in
+# METRICS_DB (`python manage.py slow_queries`); 0 turns the slow-query log off.
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+
+# Staff requests with `X-Profile: 1` or `?_profile=1` run under cProfile; the
+# .prof and collapsed-stack files land in PROFILE_DIR (newest PROFILE_KEEP kept)
+# and are linked from the X-Profile / X-Profile-Collapsed response headers.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '1') == '1'
+PROFILE_DIR = os.getenv('PROFILE_DIR', str(BASE_DIR / 'profiles'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+
+# Activity and expense logs show this many rows per page (keyset pagination).
+LOG_PAGE_SIZE = int(os.getenv('LOG_PAGE_SIZE', '50'))